@@ -0,0 +1,313 @@
+import argparse
+import json
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from history_store import HistoryStore
+from metric_registry import DEFAULT_MARKETS, MetricRegistry
+from valuation_frame import assign_bands, fallback_percentile
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MARKETS = ['cn', 'hk', 'stock', 'indicator']
+# 各市场名称映射所在的配置段
+NAME_SECTIONS = {
+    'cn': ('cn_config', 'index_names'),
+    'hk': ('hk_config', 'index_names'),
+    'stock': ('stock_config', 'stock_names'),
+}
+
+def band_name(label):
+    """评级标签去掉图标，如 "🟢 低估" -> "低估"；查询时两种写法都可使用"""
+    return label.split()[-1] if label and label.strip() else None
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+class SnapshotIndex:
+    """各市场最新估值的内存索引，数据来自本地历史存储，不访问理杏仁或 akshare
+    
+    刷新时为每个市场建立 代码 -> 记录、评级 -> 记录 的索引，并预先序列化整市场和各评级的响应；
+    历史查询结果按 (市场, 代码, 指标, 区间, 分区版本) 放入 LRU 缓存，存储写入新数据后自然失效。
+    """
+    
+    def __init__(self, store, names=None, history_cache_size=256, ratings=None):
+        self.store = store
+        self.names = names or {}
+        # 各市场评级使用的百分位（按顺序取第一个有效值），与对应机器人的指标注册表一致
+        self.ratings = ratings or {market: options['rating'] for market, options in DEFAULT_MARKETS.items()}
+        self.history_cache_size = history_cache_size
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._versions = {}
+        self._bodies = {}
+        self._history = OrderedDict()
+        self.history_hits = 0
+        self.history_misses = 0
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置创建索引，名称映射取自各机器人的配置段"""
+        options = config.get('api_server', {})
+        names = {
+            market: config.get(section, {}).get(key, {})
+            for market, (section, key) in NAME_SECTIONS.items()
+        }
+        ratings = {market: MetricRegistry.from_config(config, market).rating for market in DEFAULT_MARKETS}
+        return cls(HistoryStore.from_config(config), names, options.get('history_cache_size', 256), ratings)
+    
+    def _build(self, market):
+        """根据每个代码、每个指标的最新数据建立单个市场的快照
+        
+        各记录的日期为该代码最近的数据日期（停牌的代码保留停牌前的数据），市场的日期为其中最新的一个。
+        """
+        table = self.store.latest(market)
+        if table.num_rows == 0:
+            return {'date': None, 'items': {}, 'bands': {}}
+        
+        frame = table.to_pandas()
+        for column in ('code', 'metric'):
+            frame[column] = frame[column].astype(str)
+        wide = frame.pivot(index='code', columns='metric', values='value')
+        dates = frame.groupby('code')['date'].max().astype(str).reindex(wide.index).tolist()
+        date = max(dates)
+        
+        rating_columns = self.ratings.get(market)
+        if rating_columns:
+            rating_frame = wide.reindex(columns=list(wide.columns) + [c for c in rating_columns if c not in wide.columns])
+            percentile = fallback_percentile(rating_frame, rating_columns)
+            bands = assign_bands(percentile)
+        
+        names = self.names.get(market, {})
+        items = {}
+        by_band = defaultdict(list)
+        for i, (code, metrics) in enumerate(wide.to_dict('index').items()):
+            item = {
+                'market': market,
+                'code': code,
+                'name': names.get(code),
+                'date': dates[i],
+                'metrics': {metric: value for metric, value in metrics.items() if not math.isnan(value)},
+            }
+            if rating_columns:
+                item['percentile'] = None if math.isnan(percentile[i]) else float(percentile[i])
+                item['band'] = band_name(bands[i])
+                if item['band']:
+                    by_band[item['band']].append(item)
+            items[code] = item
+        return {'date': date, 'items': items, 'bands': dict(by_band)}
+    
+    def refresh(self):
+        """重新加载分区有变化的市场，返回刷新的市场列表"""
+        refreshed = []
+        for market in MARKETS:
+            version = self.store.version(market)
+            if self._versions.get(market) == version:
+                continue
+            snapshot = self._build(market)
+            with self._lock:
+                # 整体替换，处理中的请求持有的仍是旧快照
+                self._snapshots = dict(self._snapshots, **{market: snapshot})
+                self._versions[market] = version
+            refreshed.append(market)
+        if refreshed:
+            self._serialize()
+            logger.info(f"已刷新快照: {', '.join(refreshed)}，"
+                        f"{sum(len(s['items']) for s in self._snapshots.values())} 条记录")
+        return refreshed
+    
+    def _serialize(self):
+        """预先序列化不带参数的列表类响应"""
+        with self._lock:
+            snapshots = dict(self._snapshots)
+        bodies = {'/markets': _dumps(self.summary(snapshots))}
+        all_bands = defaultdict(list)
+        for market, snapshot in snapshots.items():
+            bodies[f'/markets/{market}'] = _dumps({
+                'market': market, 'date': snapshot['date'], 'items': list(snapshot['items'].values())
+            })
+            for band, items in snapshot['bands'].items():
+                bodies[f'/markets/{market}/bands/{band}'] = _dumps({'market': market, 'band': band, 'items': items})
+                all_bands[band].extend(items)
+        for band, items in all_bands.items():
+            bodies[f'/bands/{band}'] = _dumps({'band': band, 'items': items})
+        with self._lock:
+            self._bodies = bodies
+    
+    @staticmethod
+    def summary(snapshots):
+        return {
+            market: {'date': snapshot['date'], 'count': len(snapshot['items']), 'bands': {
+                band: len(items) for band, items in snapshot['bands'].items()
+            }}
+            for market, snapshot in snapshots.items()
+        }
+    
+    def history(self, market, code, metric=None, start_date=None, end_date=None):
+        """历史序列（LRU 缓存），返回 {指标: {'dates': [...], 'values': [...]}}"""
+        key = (market, code, metric, start_date, end_date, self._versions.get(market))
+        with self._lock:
+            if key in self._history:
+                self._history.move_to_end(key)
+                self.history_hits += 1
+                return self._history[key]
+            self.history_misses += 1
+        
+        table = self.store.read(market, metric, [code], start_date, end_date)
+        series = defaultdict(lambda: {'dates': [], 'values': []})
+        for day, name, value in zip(table['date'].to_pylist(), table['metric'].to_pylist(), table['value'].to_pylist()):
+            series[name]['dates'].append(str(day))
+            series[name]['values'].append(value)
+        result = _dumps({'market': market, 'code': code, 'series': dict(series)})
+        
+        with self._lock:
+            self._history[key] = result
+            while len(self._history) > self.history_cache_size:
+                self._history.popitem(last=False)
+        return result
+    
+    def handle(self, path, query):
+        """处理只读请求，返回 (状态码, JSON 字节)"""
+        parts = path.strip('/').split('/')
+        if len(parts) >= 2 and parts[-2] == 'bands':
+            # 评级也可以写成带图标的完整标签
+            parts[-1] = band_name(parts[-1]) or ''
+        path = '/' + '/'.join(parts)
+        with self._lock:
+            body = self._bodies.get(path)
+            snapshots = self._snapshots
+        if body is not None:
+            return 200, body
+        
+        if parts == ['health']:
+            return 200, _dumps({'status': 'ok', 'markets': self.summary(snapshots)})
+        if len(parts) == 2 and parts[0] == 'bands':
+            return 200, _dumps({'band': parts[1], 'items': []})
+        if len(parts) == 4 and parts[0] == 'markets' and parts[1] in snapshots:
+            if parts[2] == 'bands':
+                return 200, _dumps({'market': parts[1], 'band': parts[3], 'items': []})
+            if parts[2] == 'codes':
+                item = snapshots[parts[1]]['items'].get(parts[3])
+                if item is None:
+                    return 404, _dumps({'error': f"没有 {parts[1]} 市场代码 {parts[3]} 的数据"})
+                return 200, _dumps(item)
+        if len(parts) == 2 and parts[0] == 'codes':
+            items = [snapshot['items'][parts[1]] for snapshot in snapshots.values() if parts[1] in snapshot['items']]
+            if not items:
+                return 404, _dumps({'error': f"没有代码 {parts[1]} 的数据"})
+            return 200, _dumps({'code': parts[1], 'items': items})
+        if len(parts) == 3 and parts[0] == 'history' and parts[1] in MARKETS:
+            metric, start_date, end_date = (query.get(name, [None])[0] for name in ('metric', 'start', 'end'))
+            return 200, self.history(parts[1], parts[2], metric, start_date, end_date)
+        return 404, _dumps({'error': f"未知的路径: {path}"})
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """只接受 GET 请求，响应均为 JSON"""
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        try:
+            status, body = self.server.index.handle(unquote(parts.path), parse_qs(parts.query))
+        except Exception as e:
+            logger.error(f"处理请求 {self.path} 失败: {e}", exc_info=True)
+            status, body = 500, _dumps({'error': str(e)})
+        self._send(status, body)
+    
+    def _reject(self):
+        self._send(405, _dumps({'error': '只读服务，只支持 GET'}))
+    
+    do_POST = do_PUT = do_DELETE = do_PATCH = _reject
+    
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+class ApiServer(ThreadingHTTPServer):
+    """本地只读 JSON 服务，后台线程按 refresh_seconds 检查历史存储并刷新快照"""
+    daemon_threads = True
+    
+    def __init__(self, index, host='127.0.0.1', port=8765, refresh_seconds=30):
+        super().__init__((host, port), ApiRequestHandler)
+        self.index = index
+        self.refresh_seconds = refresh_seconds
+        self._stop = threading.Event()
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置中的 api_server 段创建服务"""
+        options = config.get('api_server', {})
+        return cls(
+            SnapshotIndex.from_config(config),
+            options.get('host', '127.0.0.1'),
+            options.get('port', 8765),
+            options.get('refresh_seconds', 30)
+        )
+    
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                self.index.refresh()
+            except Exception as e:
+                logger.error(f"刷新快照失败: {e}", exc_info=True)
+    
+    def start(self):
+        """加载快照并在后台线程中提供服务"""
+        self.index.refresh()
+        threading.Thread(target=self._refresh_loop, daemon=True, name='api-refresh').start()
+        threading.Thread(target=self.serve_forever, daemon=True, name='api-server').start()
+        logger.info(f"只读接口已启动: http://{self.server_address[0]}:{self.server_address[1]}")
+    
+    def stop(self):
+        """停止服务"""
+        self._stop.set()
+        self.shutdown()
+        self.server_close()
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='本地只读 JSON 接口：提供各市场最新估值和历史序列')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    parser.add_argument('--host', help='监听地址，默认取配置')
+    parser.add_argument('--port', type=int, help='监听端口，默认取配置')
+    args = parser.parse_args()
+    
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        options = config.setdefault('api_server', {})
+        if args.host:
+            options['host'] = args.host
+        if args.port:
+            options['port'] = args.port
+        
+        server = ApiServer.from_config(config)
+        if not server.index.store.enabled:
+            logger.error("历史存储未启用，没有可提供的数据")
+            return
+        server.start()
+        while True:
+            time.sleep(3600)
+    
+    except KeyboardInterrupt:
+        logger.info("只读接口已停止")
+    except FileNotFoundError:
+        logger.error(f"配置文件 {args.config} 不存在")
+    except json.JSONDecodeError:
+        logger.error("配置文件格式错误")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
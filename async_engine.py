@@ -0,0 +1,280 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from cassette import current as current_cassette
+from circuit_breaker import CircuitOpenError
+from dingtalk_sender import SENT, THROTTLED
+from http_client import NON_IDEMPOTENT_RETRYABLE_STATUS, RETRYABLE_STATUS
+from single_flight import AsyncSingleFlight, request_key
+
+logger = logging.getLogger(__name__)
+
+class AsyncEngine:
+    """基于 asyncio + aiohttp 的获取与发送引擎
+    
+    所有机器人的理杏仁请求和钉钉发送在同一个线程的事件循环中并发执行，
+    每个主机的并发数由信号量单独限制。akshare 抓取是同步调用，放到线程池中执行。
+    重试、退避和 Retry-After 的处理与 HttpClient 一致，相同的幂等请求同时进行时只发送一次。
+    
+    用法：
+        async with AsyncEngine.from_config(config) as engine:
+            results = await engine.run_bots([cn_bot, hk_bot])
+    """
+    
+    def __init__(self, per_host_limit=8, host_limits=None, total_limit=100, connect_timeout=5,
+                 read_timeout=30, max_retries=3, backoff_factor=0.5, backoff_max=30):
+        self.per_host_limit = per_host_limit
+        self.host_limits = host_limits or {}
+        self.total_limit = total_limit
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self._session = None
+        self._semaphores = {}
+        self._single_flight = AsyncSingleFlight()
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置中的 async_engine 段创建引擎"""
+        return cls(**config.get('async_engine', {}))
+    
+    async def __aenter__(self):
+        try:
+            import aiohttp
+        except ImportError:
+            raise RuntimeError("异步引擎需要安装 aiohttp: pip install aiohttp")
+        
+        connector = aiohttp.TCPConnector(limit=self.total_limit, limit_per_host=self.per_host_limit)
+        timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+    
+    def _semaphore(self, host):
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.host_limits.get(host, self.per_host_limit))
+            self._semaphores[host] = semaphore
+        return semaphore
+    
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * (2 ** attempt)))
+    
+    def _retry_after(self, headers):
+        value = headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(seconds, 0.0), self.backoff_max)
+    
+    async def post_json(self, url, payload, idempotent=False):
+        """发送 JSON POST 请求，返回 (状态码, 解析后的响应)
+        
+        与 HttpClient 相同：非幂等请求只在连接失败和 429 时重试，幂等请求的相同进行中请求会被合并。
+        """
+        if idempotent:
+            return await self._single_flight.do(
+                request_key('POST', url, payload), lambda: self._post_json(url, payload, idempotent)
+            )
+        return await self._post_json(url, payload, idempotent)
+    
+    async def _post_json(self, url, payload, idempotent):
+        import aiohttp
+        
+        cassette = current_cassette()
+        if cassette is not None and not cassette.recording:
+            entry = cassette.lookup_http('POST', url, payload)
+            status, text = entry['status'], entry['text']
+            try:
+                return status, json.loads(text)
+            except ValueError:
+                return status, text
+        
+        host = urlparse(url).netloc
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore(host):
+                    async with self._session.post(url, json=payload) as response:
+                        status = response.status
+                        headers = response.headers
+                        text = await response.text()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                # 连接失败或连接超时时请求尚未发出，可以安全重试；其余超时和中断只重试幂等请求
+                connect_error = isinstance(
+                    e, (aiohttp.ClientConnectorError, getattr(aiohttp, 'ConnectionTimeoutError', ()))
+                )
+                if not (idempotent or connect_error) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                reason = str(e) or type(e).__name__
+            else:
+                retryable_status = RETRYABLE_STATUS if idempotent else NON_IDEMPOTENT_RETRYABLE_STATUS
+                if status not in retryable_status or attempt >= self.max_retries:
+                    if cassette is not None:
+                        cassette.record_http('POST', url, payload, status, headers, text)
+                    try:
+                        return status, json.loads(text)
+                    except ValueError:
+                        return status, text
+                delay = self._retry_after(headers)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                reason = f"状态码 {status}"
+            
+            attempt += 1
+            logger.warning(f"请求 {host} 失败（{reason}），{delay:.2f} 秒后第 {attempt} 次重试")
+            await asyncio.sleep(delay)
+    
+    async def fetch_valuation(self, bot, date):
+        """异步获取估值数据，逻辑与机器人的同步获取方法一致（含缓存）"""
+        if getattr(bot, 'full_market_enabled', False):
+            # 全市场模式自带分批、并发和配额控制，整体放到线程池执行
+            return await asyncio.to_thread(bot.get_stock_valuation, date)
+        
+        api_url = bot.lixinger_config['api_url']
+        payload = bot.build_payload(date)
+        
+        cached_data = bot.cache.get(api_url, payload)
+        if cached_data is not None:
+            return cached_data
+        
+        # 与同步请求共用机器人 HttpClient 的熔断器
+        breaker = getattr(bot.session, 'breaker', None)
+        probe = False
+        try:
+            if breaker is not None:
+                probe = breaker.before_request(api_url)
+            status, data = await self.post_json(api_url, payload, idempotent=True)
+        except Exception as e:
+            if breaker is not None and not isinstance(e, CircuitOpenError):
+                breaker.record_failure(api_url)
+            logger.error(f"请求异常: {e}")
+            return None
+        else:
+            if breaker is not None:
+                if status in RETRYABLE_STATUS:
+                    breaker.record_failure(api_url)
+                else:
+                    breaker.record_success(api_url)
+        finally:
+            # 任务被取消（CancelledError 不是 Exception）时释放探测，否则端点会一直拒绝请求
+            if probe:
+                breaker.release(api_url)
+        
+        if status != 200 or not isinstance(data, dict):
+            logger.error(f"API请求失败，状态码: {status}")
+            return None
+        if 'data' in data:
+            bot.cache.set(api_url, payload, data)
+        return data
+    
+    async def fetch_valuations(self, bot, dates):
+        """并发获取多个日期的估值数据，返回 {日期: 数据}"""
+        results = await asyncio.gather(*(self.fetch_valuation(bot, date) for date in dates))
+        return dict(zip(dates, results))
+    
+    async def send_dingtalk(self, bot, message, title):
+        """异步发送钉钉消息，分段、请求体、限流和错误处理与机器人的 DingTalkSender 一致"""
+        sender = bot.dingtalk
+        payloads = sender.payloads(message, title)
+        for i, payload in enumerate(payloads, 1):
+            for attempt in range(sender.max_throttle_retries + 1):
+                # 令牌桶限流（含被钉钉限流后的暂停），等待时让出事件循环
+                while not sender.rate_limiter.try_acquire():
+                    await asyncio.sleep(sender.rate_limiter.wait_time())
+                try:
+                    status, result = await self.post_json(sender.webhook_url, payload)
+                except Exception as e:
+                    logger.error(f"钉钉请求异常: {e}")
+                    return False
+                outcome = sender.check_result(status, result, attempt)
+                if outcome != THROTTLED:
+                    break
+            if outcome != SENT:
+                logger.error(f"第 {i}/{len(payloads)} 段发送失败，停止发送剩余分段")
+                return False
+        return True
+    
+    async def build_message(self, bot, date=None):
+        """异步获取数据并格式化消息，失败返回 None，增量模式下无变化返回空字符串"""
+        if not hasattr(bot, 'build_payload'):
+            # 指标机器人依赖同步的 akshare 抓取，放到线程池执行
+            return await asyncio.to_thread(bot.build_message)
+        
+        # 最新日期探测使用同步请求，每天最多执行一次，放到线程池避免阻塞事件循环
+        date = await asyncio.to_thread(bot.resolve_date, date)
+        with bot.metrics.stage('fetch') as stage:
+            valuation_data = await self.fetch_valuation(bot, date)
+            stage['success'] = bool(valuation_data)
+            if valuation_data:
+                stage['items'] = len(valuation_data.get('data') or [])
+        
+        # 接口熔断时回退到最近一次成功获取的数据
+        stale = False
+        if not valuation_data:
+            valuation_data, date = bot.last_known_good(date)
+            stale = valuation_data is not None
+        
+        if not valuation_data:
+            logger.error("获取估值数据失败")
+            return None
+        
+        if not stale:
+            await asyncio.to_thread(bot.save_history, valuation_data, date)
+        valuation_data = bot.select_changes(valuation_data, date)
+        if valuation_data is None:
+            logger.info("估值评级无变化，跳过格式化和发送")
+            return ""
+        
+        with bot.metrics.stage('format') as stage:
+            message = bot.format_message(valuation_data, date, stale=stale)
+            stage['items'] = len(valuation_data.get('data') or [])
+            stage['payload_bytes'] = len(message.encode('utf-8'))
+        return message
+    
+    async def run_bot(self, bot, date=None):
+        """异步运行单个机器人：获取、格式化、发送"""
+        try:
+            message = await self.build_message(bot, date)
+            if message is None:
+                return False
+            if not message:
+                return True
+            with bot.metrics.stage('send') as stage:
+                sent = await self.send_dingtalk(bot, message, bot.report_title)
+                stage['success'] = sent
+                stage['payload_bytes'] = len(message.encode('utf-8'))
+            if sent and hasattr(bot, 'confirm_changes'):
+                bot.confirm_changes()
+            return sent
+        except Exception as e:
+            logger.error(f"任务执行失败: {e}", exc_info=True)
+            return False
+    
+    async def run_bots(self, bots, date=None):
+        """并发运行多个机器人，返回各自是否成功"""
+        return await asyncio.gather(*(self.run_bot(bot, date) for bot in bots))
+
+def run_bots(bots, config, date=None):
+    """同步入口：在新的事件循环中并发运行多个机器人"""
+    async def _main():
+        async with AsyncEngine.from_config(config) as engine:
+            return await engine.run_bots(bots, date)
+    return asyncio.run(_main())
\ No newline at end of file
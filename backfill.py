@@ -0,0 +1,264 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from history_store import backfill_rows
+from hk_index_valuation import HKIndexValuationBot
+from index_valuation import IndexValuationBot
+from rate_limiter import RateLimiter
+from stock_valuation import MAX_CODES_PER_REQUEST, StockValuationBot
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BOT_CLASSES = {
+    'cn': IndexValuationBot,
+    'hk': HKIndexValuationBot,
+    'stock': StockValuationBot,
+}
+
+# 理杏仁接口限制：按时间区间查询时 stockCodes 只能有 1 个，且区间不超过 10 年
+# （按日期查询时最多 100 个，见 MAX_CODES_PER_REQUEST）
+MAX_RANGE_YEARS = 10
+
+def chunked(items, size):
+    """将列表按固定大小切分"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def split_date_range(start_date, end_date, max_years):
+    """将日期区间切分为不超过 max_years 年的子区间"""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    windows = []
+    while start <= end:
+        try:
+            window_end = start.replace(year=start.year + max_years) - timedelta(days=1)
+        except ValueError:
+            # 2月29日
+            window_end = start.replace(year=start.year + max_years, day=28)
+        window_end = min(window_end, end)
+        windows.append((start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+        start = window_end + timedelta(days=1)
+    return windows
+
+def metrics_digest(metrics_list):
+    """指标列表的短摘要，写入任务键，指标变化后已完成的任务会重新获取"""
+    joined = ','.join(sorted(metrics_list))
+    return hashlib.sha256(joined.encode('utf-8')).hexdigest()[:12]
+
+class ValuationBackfill:
+    """历史估值数据回填
+    
+    根据请求数选择查询方式：
+    - range: 每个代码一个请求，按不超过 10 年的区间查询
+    - date: 每个交易日一个请求（按机器人市场的交易日历，跳过周末和节假日），代码按 100 个一组切分
+    每个任务完成后与其数据在同一事务中写入进度表，中断后重新运行会跳过已完成的任务。
+    任务键包含指标列表的摘要，指标变化后重新运行会按新指标重新获取。
+    回填的数据同时写入机器人的历史存储（HistoryStore），API 服务和历史查询可以直接读取；
+    最近一次成功获取的数据（熔断回退）和已播报状态只由机器人的日常运行写入，回填不改变。
+    """
+    
+    def __init__(self, bot, market, db_path='data/backfill.db', max_workers=4,
+                 requests_per_minute=120, chunk_size=MAX_CODES_PER_REQUEST,
+                 max_range_years=MAX_RANGE_YEARS):
+        self.bot = bot
+        self.market = market
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.chunk_size = min(chunk_size, MAX_CODES_PER_REQUEST)
+        self.max_range_years = min(max_range_years, MAX_RANGE_YEARS)
+        self.rate_limiter = RateLimiter.per_minute(requests_per_minute, capacity=max_workers)
+        self.calendar = bot.date_resolver.calendar
+        
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS valuations ("
+            " market TEXT NOT NULL,"
+            " stock_code TEXT NOT NULL,"
+            " date TEXT NOT NULL,"
+            " metrics TEXT NOT NULL,"
+            " PRIMARY KEY (market, stock_code, date))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS backfill_tasks ("
+            " market TEXT NOT NULL,"
+            " task_key TEXT NOT NULL,"
+            " rows INTEGER NOT NULL,"
+            " completed_at REAL NOT NULL,"
+            " PRIMARY KEY (market, task_key))"
+        )
+        self.conn.commit()
+    
+    @classmethod
+    def from_config(cls, market, config_file='config.json'):
+        """根据配置文件创建回填任务"""
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        bot = BOT_CLASSES[market](config_file)
+        return cls(bot, market, **config.get('backfill', {}))
+    
+    def plan_tasks(self, start_date, end_date):
+        """生成回填任务列表，选择请求数更少的查询方式"""
+        codes = list(self.bot.stock_codes)
+        windows = split_date_range(start_date, end_date, self.max_range_years)
+        dates = self.calendar.trading_days(
+            self.bot.market, datetime.strptime(start_date, '%Y-%m-%d'), datetime.strptime(end_date, '%Y-%m-%d')
+        )
+        digest = metrics_digest(self.bot.metrics_list)
+        
+        range_requests = len(codes) * len(windows)
+        date_requests = len(dates) * math.ceil(len(codes) / self.chunk_size)
+        logger.info(f"区间查询需要 {range_requests} 个请求，按日查询需要 {date_requests} 个请求")
+        
+        tasks = []
+        if range_requests <= date_requests:
+            for code in codes:
+                for window_start, window_end in windows:
+                    tasks.append({
+                        'key': f"range:{code}:{window_start}:{window_end}:{digest}",
+                        'payload': {
+                            "startDate": window_start,
+                            "endDate": window_end,
+                            "stockCodes": [code],
+                            "metricsList": self.bot.metrics_list
+                        }
+                    })
+        else:
+            for date in dates:
+                for chunk in chunked(codes, self.chunk_size):
+                    tasks.append({
+                        'key': f"date:{date}:{','.join(chunk)}:{digest}",
+                        'payload': {
+                            "date": date,
+                            "stockCodes": chunk,
+                            "metricsList": self.bot.metrics_list
+                        }
+                    })
+        return tasks
+    
+    def completed_task_keys(self):
+        """读取已完成的任务"""
+        rows = self.conn.execute(
+            "SELECT task_key FROM backfill_tasks WHERE market = ?", (self.market,)
+        ).fetchall()
+        return {row[0] for row in rows}
+    
+    def fetch_task(self, task):
+        """执行单个回填任务，返回数据行"""
+        api_url = self.bot.lixinger_config['api_url']
+        payload = dict(task['payload'], token=self.bot.lixinger_config['token'])
+        
+        data = self.bot.cache.get(api_url, payload)
+        if data is None:
+            self.rate_limiter.acquire()
+            response = self.bot.session.post(
+                api_url,
+                json=payload,
+                headers={'Content-Type': 'application/json'},
+                idempotent=True
+            )
+            response.raise_for_status()
+            data = response.json()
+            if 'data' not in data:
+                raise ValueError(f"API返回异常: {data}")
+            self.bot.cache.set(api_url, payload, data)
+        
+        rows = []
+        for item in data['data']:
+            metrics = {k: v for k, v in item.items() if k not in ('stockCode', 'date')}
+            rows.append((
+                self.market,
+                item.get('stockCode', ''),
+                item.get('date', '')[:10],
+                json.dumps(metrics, ensure_ascii=False)
+            ))
+        return rows
+    
+    def save_task(self, task, rows):
+        """批量写入数据并标记任务完成
+        
+        先写入历史存储，写入失败时任务不标记完成，重新运行会再次获取。
+        """
+        history = getattr(self.bot, 'history', None)
+        if history is not None:
+            history.append(self.market, backfill_rows((code, date, metrics) for _, code, date, metrics in rows))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO valuations (market, stock_code, date, metrics)"
+                " VALUES (?, ?, ?, ?)", rows
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO backfill_tasks (market, task_key, rows, completed_at)"
+                " VALUES (?, ?, ?, ?)", (self.market, task['key'], len(rows), time.time())
+            )
+    
+    def run(self, start_date, end_date):
+        """执行回填，返回本次写入的数据行数"""
+        tasks = self.plan_tasks(start_date, end_date)
+        completed = self.completed_task_keys()
+        pending = [task for task in tasks if task['key'] not in completed]
+        logger.info(f"回填 {self.market} {start_date} ~ {end_date}: "
+                    f"共 {len(tasks)} 个任务，已完成 {len(tasks) - len(pending)} 个")
+        
+        total_rows = 0
+        failed = 0
+        started_at = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='backfill') as executor:
+            futures = {executor.submit(self.fetch_task, task): task for task in pending}
+            for i, future in enumerate(as_completed(futures), 1):
+                task = futures[future]
+                try:
+                    rows = future.result()
+                    self.save_task(task, rows)
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"任务 {task['key']} 失败: {e}")
+                    continue
+                total_rows += len(rows)
+                logger.info(f"[{i}/{len(pending)}] {task['key']} 写入 {len(rows)} 行")
+        
+        elapsed = time.time() - started_at
+        logger.info(f"回填完成：写入 {total_rows} 行，失败 {failed} 个任务，耗时 {elapsed:.1f} 秒")
+        if failed:
+            logger.warning("存在失败的任务，重新运行即可从中断处继续")
+        return total_rows
+    
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='历史估值数据回填')
+    parser.add_argument('--market', choices=sorted(BOT_CLASSES), default='cn', help='市场')
+    parser.add_argument('--start', required=True, help='开始日期，如 2015-01-01')
+    parser.add_argument('--end', default=datetime.now().strftime('%Y-%m-%d'), help='结束日期，默认今天')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    args = parser.parse_args()
+    
+    try:
+        backfill = ValuationBackfill.from_config(args.market, args.config)
+        try:
+            backfill.run(args.start, args.end)
+        finally:
+            backfill.close()
+    except FileNotFoundError:
+        logger.error(f"配置文件 {args.config} 不存在")
+    except json.JSONDecodeError:
+        logger.error("配置文件格式错误")
+    except Exception as e:
+        logger.error(f"程序执行出错: {e}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,167 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from fakes import DINGTALK_PATH, FakeBackend, install_fake_akshare
+from hk_index_valuation import HKIndexValuationBot
+from index_valuation import IndexValuationBot
+from indicator import IndicatorBot
+from stock_valuation import StockValuationBot
+
+BOT_CLASSES = {
+    'cn': IndexValuationBot,
+    'hk': HKIndexValuationBot,
+    'stock': StockValuationBot,
+    'indicator': IndicatorBot,
+}
+
+def read_stages(metrics_path):
+    """读取本次运行写入的各阶段耗时（毫秒）"""
+    stages = {}
+    if not os.path.exists(metrics_path):
+        return stages
+    with open(metrics_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            stages[entry['stage']] = entry['duration_ms']
+    return stages
+
+def run_once(backend, bot_name, codes, args, trace_memory=False):
+    """在全新的本地数据目录中运行一次机器人（冷缓存），返回测量结果
+    
+    codes 对估值机器人是代码数（股票为全市场模式的股票数），对指标机器人是历史数据行数。
+    """
+    data_dir = tempfile.mkdtemp(prefix='pelog-bench-')
+    try:
+        config = backend.make_config(data_dir, codes)
+        install_fake_akshare(rows=codes, latency=args.akshare_latency)
+        backend.reset()
+        
+        if trace_memory:
+            tracemalloc.start()
+        started_at = time.perf_counter()
+        if bot_name == 'indicator':
+            bot = IndicatorBot(config=config)
+            success = bot.run()
+        else:
+            bot = BOT_CLASSES[bot_name](config=config)
+            success = bot.run(args.date)
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        peak_bytes = None
+        if trace_memory:
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        
+        if hasattr(bot, 'cache'):
+            bot.cache.close()
+        if hasattr(bot, 'store'):
+            bot.store.close()
+        if hasattr(bot, 'change_detector'):
+            bot.change_detector.close()
+        
+        dingtalk_requests = sum(count for path, count in backend.requests.items() if path.startswith(DINGTALK_PATH))
+        return {
+            'bot': bot_name,
+            'codes': codes,
+            'success': bool(success),
+            'total_ms': round(elapsed_ms, 2),
+            'stages': read_stages(config['metrics']['path']),
+            'peak_mb': round(peak_bytes / 1024 / 1024, 2) if peak_bytes is not None else None,
+            'lixinger_requests': sum(backend.requests.values()) - dingtalk_requests,
+            'dingtalk_requests': dingtalk_requests,
+            'message_bytes': backend.sent_bytes,
+        }
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+def measure(backend, bot_name, codes, args):
+    """计时与内存分开测量，避免 tracemalloc 的开销计入耗时"""
+    result = run_once(backend, bot_name, codes, args)
+    if not args.no_memory:
+        result['peak_mb'] = run_once(backend, bot_name, codes, args, trace_memory=True)['peak_mb']
+    return result
+
+def print_results(results):
+    """以表格输出测量结果"""
+    print(f"{'机器人':<10} {'代码数':>7} {'成功':>4} {'总耗时ms':>10} {'获取ms':>9} {'格式化ms':>9} "
+          f"{'发送ms':>9} {'峰值MB':>8} {'理杏仁':>6} {'钉钉':>5} {'消息KB':>8}")
+    for r in results:
+        stages = r['stages']
+        peak = f"{r['peak_mb']:.2f}" if r['peak_mb'] is not None else '-'
+        print(f"{r['bot']:<10} {r['codes']:>7} {'是' if r['success'] else '否':>4} {r['total_ms']:>10.1f} "
+              f"{stages.get('fetch', 0):>9.1f} {stages.get('format', 0):>9.1f} {stages.get('send', 0):>9.1f} "
+              f"{peak:>8} {r['lixinger_requests']:>6} {r['dingtalk_requests']:>5} {r['message_bytes'] / 1024:>8.1f}")
+
+def compare(results, baseline_path, max_slowdown, max_memory_growth):
+    """与基线结果对比，返回回退项列表"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['bot'], r['codes']): r for r in json.load(f)}
+    
+    regressions = []
+    for r in results:
+        base = baseline.get((r['bot'], r['codes']))
+        if base is None:
+            continue
+        if r['total_ms'] > base['total_ms'] * max_slowdown:
+            regressions.append(f"{r['bot']}@{r['codes']}: 耗时 {base['total_ms']:.1f} -> {r['total_ms']:.1f} ms")
+        if r['peak_mb'] and base.get('peak_mb') and r['peak_mb'] > base['peak_mb'] * max_memory_growth:
+            regressions.append(f"{r['bot']}@{r['codes']}: 峰值内存 {base['peak_mb']:.2f} -> {r['peak_mb']:.2f} MB")
+        if r['lixinger_requests'] > base['lixinger_requests']:
+            regressions.append(f"{r['bot']}@{r['codes']}: 理杏仁请求 {base['lixinger_requests']} -> {r['lixinger_requests']}")
+        if base['success'] and not r['success']:
+            regressions.append(f"{r['bot']}@{r['codes']}: 运行失败")
+    return regressions
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='离线基准：使用本地替身测量各机器人的耗时、内存和请求数')
+    parser.add_argument('--bots', default='cn,stock,indicator', help='逗号分隔的机器人：cn,hk,stock,indicator')
+    parser.add_argument('--sizes', default='10,100,1000,10000', help='逗号分隔的代码数')
+    parser.add_argument('--date', default='2024-12-31', help='估值日期（固定日期，跳过最新日期探测）')
+    parser.add_argument('--lixinger-latency', type=float, default=0.05, help='理杏仁替身每个请求的延迟（秒）')
+    parser.add_argument('--dingtalk-latency', type=float, default=0.05, help='钉钉替身每个请求的延迟（秒）')
+    parser.add_argument('--akshare-latency', type=float, default=0.2, help='akshare 替身每次调用的延迟（秒）')
+    parser.add_argument('--no-memory', action='store_true', help='不测量峰值内存')
+    parser.add_argument('--save', help='将结果保存为 JSON，可作为后续对比的基线')
+    parser.add_argument('--baseline', help='与基线 JSON 对比，出现回退时退出码为 1')
+    parser.add_argument('--max-slowdown', type=float, default=1.5, help='允许的耗时增长倍数')
+    parser.add_argument('--max-memory-growth', type=float, default=1.5, help='允许的峰值内存增长倍数')
+    parser.add_argument('--verbose', action='store_true', help='输出机器人日志')
+    args = parser.parse_args()
+    
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    
+    bots = args.bots.split(',')
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = []
+    with FakeBackend(args.lixinger_latency, args.dingtalk_latency) as backend:
+        for bot_name in bots:
+            for codes in sizes:
+                results.append(measure(backend, bot_name, codes, args))
+                print(f"完成 {bot_name} @ {codes}: {results[-1]['total_ms']:.1f} ms", file=sys.stderr)
+    
+    print_results(results)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_slowdown, args.max_memory_growth)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ 未发现性能回退")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,85 @@
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from metric_registry import MetricRegistry
+from stock_valuation import StockValuationBot
+
+METRICS_LIST = ['pe_ttm', 'pe_ttm.y3.cvpos', 'pe_ttm.y5.cvpos', 'pe_ttm.y10.cvpos']
+
+def make_valuation_data(rows, seed=0):
+    """生成模拟的全市场估值响应，包含缺失值和 0 值以覆盖回退逻辑"""
+    rng = random.Random(seed)
+    data = []
+    for i in range(rows):
+        item = {'stockCode': f"{i:06d}"}
+        if rng.random() > 0.05:
+            item['pe_ttm'] = rng.uniform(-50, 300)
+        for metric in METRICS_LIST[1:]:
+            value = rng.random()
+            if value < 0.1:
+                continue
+            item[metric] = 0 if value < 0.15 else rng.random()
+        data.append(item)
+    return {'data': data}
+
+def make_bot():
+    """不读取配置文件，直接构造只用于格式化的机器人"""
+    bot = StockValuationBot.__new__(StockValuationBot)
+    bot.stock_names = {}
+    bot.metric_registry = MetricRegistry.from_config({}, 'stock')
+    bot.metrics_list = bot.metric_registry.metrics_list
+    return bot
+
+def time_format(bot, valuation_data, repeat):
+    """多次格式化，返回耗时中位数（秒）"""
+    samples = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        bot.format_message(valuation_data, '2024-01-01')
+        samples.append(time.perf_counter() - started_at)
+    return statistics.median(samples)
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='评级与格式化的规模基准：验证耗时随行数线性增长')
+    parser.add_argument('--sizes', default='100,1000,10000', help='逗号分隔的行数')
+    parser.add_argument('--repeat', type=int, default=5, help='每个规模重复次数，取中位数')
+    parser.add_argument('--tolerance', type=float, default=2.0,
+                        help='最大规模的单行耗时不得超过 1000 行（或最小规模）单行耗时的倍数')
+    args = parser.parse_args()
+    
+    # 格式化过程的日志与基准无关，避免输出干扰计时
+    logging.disable(logging.CRITICAL)
+    
+    sizes = [int(size) for size in args.sizes.split(',')]
+    bot = make_bot()
+    # 预热：首次调用包含 pandas/numpy 的导入
+    time_format(bot, make_valuation_data(10), 1)
+    
+    per_row = {}
+    print(f"{'行数':>8} {'耗时(ms)':>10} {'单行(us)':>10}")
+    for size in sizes:
+        elapsed = time_format(bot, make_valuation_data(size), args.repeat)
+        per_row[size] = elapsed / size
+        print(f"{size:>8} {elapsed * 1000:>10.2f} {per_row[size] * 1e6:>10.2f}")
+    
+    # 小规模时固定开销占比高，以 1000 行（或最小规模）为线性基线
+    baseline = 1000 if 1000 in per_row else sizes[0]
+    largest = max(sizes)
+    ratio = per_row[largest] / per_row[baseline]
+    print(f"{largest} 行单行耗时为 {baseline} 行的 {ratio:.2f} 倍（上限 {args.tolerance}）")
+    if ratio > args.tolerance:
+        print("❌ 耗时增长超过线性")
+        sys.exit(1)
+    print("✅ 耗时随行数线性增长")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,185 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import types
+import zlib
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 基准使用的理杏仁接口路径，与 config.json 中的地址一一对应
+LIXINGER_PATHS = {
+    'cn_config': '/api/cn/index/fundamental',
+    'hk_config': '/api/hk/index/fundamental',
+    'stock_config': '/api/cn/company/fundamental/non_financial',
+}
+UNIVERSE_PATH = '/api/cn/company'
+DINGTALK_PATH = '/robot/send'
+
+def fake_codes(count, prefix=''):
+    """生成 count 个六位代码"""
+    return [f"{prefix}{i:06d}" for i in range(count)]
+
+def fake_metric(code, metric):
+    """按代码和指标名生成确定的模拟值，百分位在 0-1 之间"""
+    rng = random.Random(zlib.crc32(f"{code}:{metric}".encode('utf-8')))
+    if metric.endswith('cvpos'):
+        return rng.random()
+    if metric.split('.')[0] == 'dyr':
+        # 股息率为比率
+        return round(rng.uniform(0, 0.08), 4)
+    return round(rng.uniform(5, 60), 2)
+
+class FakeBackend:
+    """进程内的理杏仁与钉钉替身，使用本地 HTTP 服务，延迟可配置
+    
+    理杏仁接口按请求的 stockCodes 和 metricsList 返回模拟数据；
+    股票列表接口返回 universe_size 只非金融股；钉钉接口总是返回成功。
+    每个路径的请求次数记录在 requests 中。
+    
+    用法：
+        with FakeBackend(lixinger_latency=0.05) as backend:
+            config = backend.make_config(tmp_dir, codes=1000)
+    """
+    
+    def __init__(self, lixinger_latency=0.0, dingtalk_latency=0.0, universe_size=0):
+        self.lixinger_latency = lixinger_latency
+        self.dingtalk_latency = dingtalk_latency
+        self.universe_size = universe_size
+        self.requests = Counter()
+        self.sent_bytes = 0
+        self._lock = threading.Lock()
+        self._server = None
+    
+    def __enter__(self):
+        backend = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                data = json.dumps(backend.handle(self.path, body), ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, *args):
+                pass
+        
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._server.shutdown()
+        self._server.server_close()
+    
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+    
+    def reset(self):
+        """清空请求计数"""
+        with self._lock:
+            self.requests.clear()
+            self.sent_bytes = 0
+    
+    def handle(self, path, body):
+        with self._lock:
+            self.requests[path] += 1
+        if path.startswith(DINGTALK_PATH):
+            time.sleep(self.dingtalk_latency)
+            with self._lock:
+                self.sent_bytes += len(body.get('markdown', {}).get('text', '').encode('utf-8'))
+            return {'errcode': 0, 'errmsg': 'ok'}
+        
+        time.sleep(self.lixinger_latency)
+        if path == UNIVERSE_PATH:
+            return {'code': 1, 'data': [
+                {'stockCode': code, 'name': f"公司{code}", 'fsTableType': 'non_financial'}
+                for code in fake_codes(self.universe_size)
+            ]}
+        day = body.get('date', '')
+        return {'code': 1, 'data': [
+            dict(
+                {'stockCode': code, 'date': f"{day}T00:00:00+08:00"},
+                **{metric: fake_metric(code, metric) for metric in body.get('metricsList', [])}
+            )
+            for code in body.get('stockCodes', [])
+        ]}
+    
+    def make_config(self, data_dir, codes=10, config_file=None):
+        """基于仓库的 config.json 生成指向替身的配置，所有本地状态都写入 data_dir"""
+        with open(config_file or os.path.join(ROOT_DIR, 'config.json'), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        
+        self.universe_size = codes
+        for section, path in LIXINGER_PATHS.items():
+            config[section]['lixinger']['api_url'] = self.base_url + path
+            config[section]['dingtalk']['webhook_url'] = self.base_url + DINGTALK_PATH
+        for section in ('cn_config', 'hk_config'):
+            config[section]['stock_codes'] = fake_codes(codes)
+        config['stock_config']['full_market'] = {
+            'enabled': True,
+            'universe_api_url': self.base_url + UNIVERSE_PATH,
+            'chunk_size': 100,
+            'max_workers': config['stock_config'].get('full_market', {}).get('max_workers', 4),
+            # 替身没有配额限制，测量的是机器人自身的开销
+            'requests_per_minute': 1000000,
+        }
+        
+        config['lixinger_cache'] = dict(config.get('lixinger_cache', {}), path=os.path.join(data_dir, 'cache.db'))
+        config['indicator_store'] = dict(config.get('indicator_store', {}), path=os.path.join(data_dir, 'indicators.db'))
+        config['change_detection'] = dict(config.get('change_detection', {}),
+                                          path=os.path.join(data_dir, 'reported_state.db'))
+        config['history_store'] = dict(config.get('history_store', {}), path=os.path.join(data_dir, 'history'))
+        config['circuit_breaker'] = dict(config.get('circuit_breaker', {}),
+                                         path=os.path.join(data_dir, 'circuit_breaker.json'))
+        config['last_good'] = dict(config.get('last_good', {}), path=os.path.join(data_dir, 'last_good.db'))
+        config['percentile_engine'] = dict(config.get('percentile_engine', {}),
+                                           path=os.path.join(data_dir, 'percentile_state.db'))
+        config['backfill'] = dict(config.get('backfill', {}), db_path=os.path.join(data_dir, 'backfill.db'))
+        config['metrics'] = {'enabled': True, 'format': 'jsonl', 'path': os.path.join(data_dir, 'metrics.jsonl')}
+        config['trading_calendar'] = dict(
+            config.get('trading_calendar', {}),
+            path=os.path.join(data_dir, 'trading_calendar.json'),
+            state_path=os.path.join(data_dir, 'latest_date.json'),
+        )
+        # fork 启动的工作进程继承 install_fake_akshare 安装的替身模块
+        config['akshare_deadline'] = dict(config.get('akshare_deadline', {}), start_method='fork')
+        config['dingtalk_sender'] = dict(config.get('dingtalk_sender', {}), messages_per_minute=1000000, burst=1000)
+        return config
+
+def _trading_dates(rows):
+    end = date(2024, 12, 31)
+    return [end - timedelta(days=rows - 1 - i) for i in range(rows)]
+
+def install_fake_akshare(rows=1000, latency=0.0):
+    """以替身模块替换 akshare，各函数返回 rows 行历史数据，调用前等待 latency 秒"""
+    import pandas as pd
+    
+    def frame(date_column, **columns):
+        time.sleep(latency)
+        return pd.DataFrame(dict({date_column: _trading_dates(rows)}, **{
+            name: [value + i * 0.001 for i in range(rows)] for name, value in columns.items()
+        }))
+    
+    module = types.ModuleType('akshare')
+    module.stock_ebs_lg = lambda: frame('日期', 沪深300指数=3500.0, 股债利差=0.05, 股债利差均线=0.04)
+    module.stock_buffett_index_lg = lambda: frame('日期', 收盘价=3000.0, 总市值=80.0, GDP=120.0,
+                                                  近十年分位数=0.4, 总历史分位数=0.5)
+    module.stock_a_ttm_lyr = lambda: frame('date', middlePETTM=30.0, averagePETTM=40.0,
+                                           quantileInRecent10YearsMiddlePeTtm=0.5,
+                                           quantileInRecent10YearsAveragePeTtm=0.6)
+    module.tool_trade_date_hist_sina = lambda: pd.DataFrame({'trade_date': _trading_dates(rows)})
+    sys.modules['akshare'] = module
+    return module
\ No newline at end of file
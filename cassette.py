@@ -0,0 +1,258 @@
+import base64
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+from lixinger_cache import LixingerCache
+
+logger = logging.getLogger(__name__)
+
+# 2：akshare 结果改为 parquet（DataFrame）或 JSON 保存，不再使用 pickle
+CASSETTE_VERSION = 2
+
+# 当前进程中启用的录制/回放，None 表示正常访问网络
+_active = None
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """回放时找不到对应的录制记录，按连接失败处理"""
+
+def current():
+    """返回当前启用的录制/回放，未启用时返回 None"""
+    return _active
+
+def memo(name, func):
+    """录制时记录 func() 的结果，回放时直接返回记录值；未启用时直接调用
+    
+    用于依赖当前时间或本地状态的值（如今天的日期、已解析的最新数据日期），使回放结果可复现。
+    """
+    cassette = _active
+    if cassette is None:
+        return func()
+    return cassette.value(name, func)
+
+def _request_key(method, url, body):
+    """请求的匹配键：方法、去掉查询参数的地址、规范化后的请求体（不含 token）"""
+    if isinstance(body, dict):
+        body = LixingerCache.normalize_payload(body)
+    return json.dumps([method.upper(), url, body], ensure_ascii=False, sort_keys=True)
+
+def _strip_query(url):
+    """去掉查询参数，钉钉的 access_token 不写入录制文件"""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+
+def _is_message(body):
+    """是否为钉钉消息请求"""
+    return isinstance(body, dict) and 'msgtype' in body
+
+def _encode_result(result):
+    """akshare 结果转换为可写入 JSON 的记录：DataFrame 保存为 base64 编码的 parquet（保留列类型和索引），
+    其余结果须可直接序列化为 JSON"""
+    import pandas as pd
+    
+    if isinstance(result, pd.DataFrame):
+        buffer = io.BytesIO()
+        result.to_parquet(buffer, engine='pyarrow')
+        return {'type': 'parquet', 'data': base64.b64encode(buffer.getvalue()).decode('ascii')}
+    try:
+        json.dumps(result, ensure_ascii=False)
+    except TypeError as e:
+        raise TypeError(f"无法录制的 akshare 结果类型 {type(result).__name__}: {e}")
+    return {'type': 'json', 'data': result}
+
+def _decode_result(record):
+    """还原 _encode_result 的记录"""
+    if record['type'] == 'parquet':
+        import pandas as pd
+        
+        return pd.read_parquet(io.BytesIO(base64.b64decode(record['data'])), engine='pyarrow')
+    return record['data']
+
+class Cassette:
+    """外部调用的录制与回放
+    
+    mode 为 record 时，HttpClient、异步引擎和 akshare 的每次调用都会记录到 path（gzip 压缩的 JSON）；
+    为 replay 时从文件按请求返回记录的响应，不访问网络。
+    HTTP 请求按 方法+地址+请求体 精确匹配；钉钉消息（请求体含 msgtype）找不到时按 方法+地址 依次匹配，
+    因此修改消息格式后仍能回放发送。同一请求录制了多次时按顺序返回，用完后重复最后一条。
+    akshare 返回的 DataFrame 以 parquet 保存，其他结果以 JSON 保存，回放时不执行录制文件中的任何代码。
+    """
+    
+    def __init__(self, path, mode='replay'):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"未知的模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._http = []
+        self._akshare = []
+        self._values = {}
+        self._http_exact = defaultdict(deque)
+        self._http_by_url = defaultdict(deque)
+        self._akshare_calls = defaultdict(deque)
+        if mode == 'replay':
+            self._load()
+    
+    @property
+    def recording(self):
+        """是否为录制模式"""
+        return self.mode == 'record'
+    
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != CASSETTE_VERSION:
+            raise ValueError(f"不支持的录制文件版本: {data.get('version')}")
+        self._values = data.get('values', {})
+        for entry in data.get('http', []):
+            key = _request_key(entry['method'], entry['url'], entry['body'])
+            self._http_exact[key].append(entry)
+            if _is_message(entry['body']):
+                self._http_by_url[(entry['method'], entry['url'])].append(entry)
+        for entry in data.get('akshare', []):
+            self._akshare_calls[entry['func']].append(entry)
+        logger.info(f"已加载录制文件 {self.path}: {len(data.get('http', []))} 个HTTP请求，"
+                    f"{len(data.get('akshare', []))} 次 akshare 调用")
+    
+    def save(self):
+        """写入录制文件（先写临时文件再替换）"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {
+            'version': CASSETTE_VERSION,
+            'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'values': self._values,
+            'http': self._http,
+            'akshare': self._akshare,
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        logger.info(f"录制完成: {len(self._http)} 个HTTP请求，{len(self._akshare)} 次 akshare 调用 -> {self.path}")
+    
+    @staticmethod
+    def _next(queue):
+        """按顺序取出记录，只剩最后一条时重复返回"""
+        return queue.popleft() if len(queue) > 1 else queue[0]
+    
+    def value(self, name, func):
+        """录制时记录 func() 的结果，回放时返回记录值"""
+        with self._lock:
+            if not self.recording:
+                if name not in self._values:
+                    raise KeyError(f"录制文件中没有 {name}")
+                return self._values[name]
+        result = func()
+        with self._lock:
+            self._values.setdefault(name, result)
+        return result
+    
+    def record_http(self, method, url, body, status, headers, text):
+        """记录一次HTTP请求及其最终响应（重试之后）"""
+        if isinstance(body, dict):
+            body = LixingerCache.normalize_payload(body)
+        entry = {
+            'method': method.upper(),
+            'url': _strip_query(url),
+            'body': body,
+            'status': status,
+            'headers': {k: v for k, v in headers.items() if k.lower() in ('content-type', 'retry-after')},
+            'text': text,
+        }
+        with self._lock:
+            self._http.append(entry)
+    
+    def lookup_http(self, method, url, body):
+        """查找录制的响应，返回记录字典；找不到时抛出 CassetteMiss"""
+        method, url = method.upper(), _strip_query(url)
+        with self._lock:
+            exact = self._http_exact.get(_request_key(method, url, body))
+            if exact:
+                return self._next(exact)
+            by_url = self._http_by_url.get((method, url)) if _is_message(body) else None
+            if by_url:
+                return self._next(by_url)
+        raise CassetteMiss(f"录制文件中没有该请求: {method} {url}")
+    
+    def build_response(self, entry, url):
+        """将录制记录还原为 requests.Response"""
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers.update(entry['headers'])
+        response._content = entry['text'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = url
+        return response
+    
+    def akshare(self):
+        """返回包装后的 akshare：录制时调用真实模块并记录结果，回放时不导入 akshare"""
+        module = None
+        if self.recording:
+            import akshare as module
+        return _AkshareProxy(self, module)
+    
+    def call_akshare(self, module, func, args, kwargs):
+        """调用（录制）或回放一次 akshare 函数"""
+        if not self.recording:
+            with self._lock:
+                calls = self._akshare_calls.get(func)
+                if not calls:
+                    raise CassetteMiss(f"录制文件中没有 akshare.{func}")
+                entry = self._next(calls)
+            return _decode_result(entry['result'])
+        
+        result = getattr(module, func)(*args, **kwargs)
+        entry = {'func': func, 'result': _encode_result(result)}
+        with self._lock:
+            self._akshare.append(entry)
+        return result
+
+class _AkshareProxy:
+    """akshare 模块的替身，函数调用经由录制/回放"""
+    
+    def __init__(self, cassette, module):
+        self._cassette = cassette
+        self._module = module
+    
+    def __getattr__(self, func):
+        def call(*args, **kwargs):
+            return self._cassette.call_akshare(self._module, func, args, kwargs)
+        return call
+
+def configure(config, mode):
+    """调整配置使录制和回放可复现：关闭本地缓存、存储、变化检测、熔断及其回退数据和本地百分位引擎，
+    回放时不限制钉钉发送频率"""
+    config['lixinger_cache'] = dict(config.get('lixinger_cache', {}), enabled=False)
+    config['indicator_store'] = dict(config.get('indicator_store', {}), enabled=False)
+    config['change_detection'] = dict(config.get('change_detection', {}), enabled=False)
+    config['history_store'] = dict(config.get('history_store', {}), enabled=False)
+    config['circuit_breaker'] = dict(config.get('circuit_breaker', {}), enabled=False)
+    config['last_good'] = dict(config.get('last_good', {}), enabled=False)
+    config['percentile_engine'] = dict(config.get('percentile_engine', {}), enabled=False)
+    if mode == 'replay':
+        config['dingtalk_sender'] = dict(config.get('dingtalk_sender', {}), messages_per_minute=1000000, burst=1000)
+    return config
+
+@contextmanager
+def use(path, mode):
+    """在 with 块内启用录制或回放，录制模式在退出时写入文件"""
+    global _active
+    cassette = Cassette(path, mode)
+    _active = cassette
+    try:
+        yield cassette
+    finally:
+        _active = None
+        if cassette.recording:
+            cassette.save()
\ No newline at end of file
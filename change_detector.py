@@ -0,0 +1,129 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from valuation_frame import assign_bands
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_PATH = 'data/reported_state.db'
+
+class ChangeDetector:
+    """已播报估值的本地状态（SQLite）与增量模式的变化检测
+    
+    每次发送成功后记录各代码播报时的评级区间和百分位。delta_mode 为 True 时只播报：
+    - 首次出现的代码
+    - 评级区间发生变化的代码
+    - 百分位相对上次播报变动达到 min_change 个百分点的代码
+    全部无变化时机器人跳过格式化和发送。比较为整列的向量运算，全市场股票也只需一次查询。
+    """
+    
+    def __init__(self, path=DEFAULT_STATE_PATH, delta_mode=False, min_change=5.0, enabled=True):
+        self.path = path
+        self.delta_mode = delta_mode
+        self.min_change = min_change
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn = None
+        
+        if self.enabled:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS reported ("
+                " bot TEXT NOT NULL,"
+                " code TEXT NOT NULL,"
+                " band TEXT NOT NULL,"
+                " value REAL NOT NULL,"
+                " date TEXT NOT NULL,"
+                " reported_at REAL NOT NULL,"
+                " PRIMARY KEY (bot, code))"
+            )
+            self._conn.commit()
+        elif delta_mode:
+            logger.warning("变化检测未启用，增量模式将播报全部代码")
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置中的 change_detection 段创建检测器"""
+        return cls(**config.get('change_detection', {}))
+    
+    def load(self, bot_name):
+        """读取上次播报的状态，返回以代码为索引的 DataFrame（band、value 列）"""
+        import pandas as pd
+        
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT code, band, value FROM reported WHERE bot = ?", (bot_name,)
+            ).fetchall()
+        return pd.DataFrame(rows, columns=['code', 'band', 'value']).set_index('code')
+    
+    def detect(self, bot_name, codes, percentile, date):
+        """返回 (需要播报的布尔数组, 发送成功后待写入的状态行)
+        
+        percentile 为评级使用的百分位（0-1），缺失值不参与比较也不写入状态。
+        非增量模式下全部代码都需要播报，状态照常记录，切换到增量模式后即可使用。
+        """
+        import numpy as np
+        
+        codes = np.asarray(codes, dtype=object)
+        values = np.asarray(percentile, dtype=float)
+        if not self.enabled:
+            return np.ones(len(codes), dtype=bool), []
+        
+        bands = assign_bands(values)
+        has_data = ~np.isnan(values)
+        if self.delta_mode:
+            previous = self.load(bot_name).reindex(codes)
+            previous_value = previous['value'].to_numpy(dtype=float)
+            is_new = previous['band'].isna().to_numpy()
+            band_changed = bands != previous['band'].to_numpy(dtype=object)
+            with np.errstate(invalid='ignore'):
+                moved = np.abs(values - previous_value) * 100 >= self.min_change
+            selected = has_data & (is_new | band_changed | moved)
+            logger.info(f"{bot_name} 增量模式: {int(selected.sum())}/{len(codes)} 个代码需要播报"
+                        f"（新增 {int((has_data & is_new).sum())}）")
+        else:
+            selected = np.ones(len(codes), dtype=bool)
+        
+        record = selected & has_data
+        pending = list(zip(codes[record].tolist(), bands[record].tolist(), values[record].tolist(),
+                           [date] * int(record.sum())))
+        return selected, pending
+    
+    def select(self, bot_name, valuation_data, codes, percentile, date):
+        """按变化检测筛选理杏仁响应的 data，返回 (筛选后的响应, 待写入的状态行)
+        
+        全部无变化时响应为 None。
+        """
+        selected, pending = self.detect(bot_name, codes, percentile, date)
+        if selected.all():
+            return valuation_data, pending
+        if not selected.any():
+            return None, pending
+        items = valuation_data.get('data') or []
+        return dict(valuation_data, data=[item for item, keep in zip(items, selected) if keep]), pending
+    
+    def commit(self, bot_name, pending):
+        """发送成功后写入本次播报的评级和百分位"""
+        if not self.enabled or not pending:
+            return
+        now = time.time()
+        rows = [(bot_name, code, band, value, date, now) for code, band, value, date in pending]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO reported (bot, code, band, value, date, reported_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+        logger.info(f"{bot_name} 记录了 {len(rows)} 个代码的播报状态")
+    
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
\ No newline at end of file
@@ -0,0 +1,93 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# 各入口模块的导入耗时预算（毫秒）
+STARTUP_BUDGETS_MS = {
+    'indicator': 300,
+    'index_valuation': 300,
+    'hk_index_valuation': 300,
+    'stock_valuation': 300,
+    'backfill': 400,
+    'run_all': 400,
+    'daemon': 400,
+    'api_server': 300,
+}
+
+# 启动阶段禁止加载的重量级依赖，应在用到的代码路径中延迟导入
+FORBIDDEN_AT_STARTUP = ('akshare', 'pandas', 'numpy', 'pyarrow')
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 {模块名: 累计耗时(微秒)}"""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        name = parts[2].strip()
+        timings[name] = int(parts[1])
+    return timings
+
+def measure(module, runs=3):
+    """多次测量模块导入耗时，返回 (中位数毫秒, 最后一次的完整耗时表)"""
+    samples = []
+    timings = {}
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=ROOT_DIR, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+        timings = parse_importtime(result.stderr)
+        samples.append(timings.get(module, 0) / 1000)
+    return statistics.median(samples), timings
+
+def check(modules, runs=3, scale=1.0, top=5):
+    """检查各入口模块的导入耗时，返回是否全部通过"""
+    passed = True
+    for module in modules:
+        budget = STARTUP_BUDGETS_MS[module] * scale
+        elapsed, timings = measure(module, runs)
+        
+        forbidden = [name for name in timings if name.split('.')[0] in FORBIDDEN_AT_STARTUP]
+        ok = elapsed <= budget and not forbidden
+        passed = passed and ok
+        
+        status = 'OK' if ok else 'FAIL'
+        print(f"[{status}] {module}: {elapsed:.1f} ms (预算 {budget:.0f} ms)")
+        if forbidden:
+            roots = sorted({name.split('.')[0] for name in forbidden})
+            print(f"    启动时加载了重量级依赖: {', '.join(roots)}")
+        if not ok:
+            heaviest = sorted(
+                ((name, us) for name, us in timings.items() if '.' not in name and name != module),
+                key=lambda item: item[1], reverse=True
+            )[:top]
+            for name, us in heaviest:
+                print(f"    {name}: {us / 1000:.1f} ms")
+    return passed
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='检查各入口模块的启动导入耗时')
+    parser.add_argument('modules', nargs='*', help='要检查的模块，默认全部入口')
+    parser.add_argument('--runs', type=int, default=3, help='每个模块测量次数，取中位数')
+    parser.add_argument('--scale', type=float, default=1.0, help='预算缩放系数，慢速机器上可调大')
+    args = parser.parse_args()
+    
+    modules = args.modules or list(STARTUP_BUDGETS_MS)
+    unknown = [module for module in modules if module not in STARTUP_BUDGETS_MS]
+    if unknown:
+        parser.error(f"未配置预算的模块: {', '.join(unknown)}")
+    
+    sys.exit(0 if check(modules, args.runs, args.scale) else 1)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_PATH = 'data/circuit_breaker.json'
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """端点处于熔断状态，请求未发出"""
+
+class CircuitBreaker:
+    """按端点（主机+路径）的熔断器
+    
+    - 关闭：正常放行，连续失败（连接错误、超时、重试后仍为 429/5xx）达到 failure_threshold 次后打开
+    - 打开：直接抛出 CircuitOpenError，不再等待超时；打开 reset_seconds 秒后进入半开
+    - 半开：只放行一个探测请求，成功则关闭，失败则重新打开；探测请求未得出结果（取消、非网络异常）时
+      由调用方 release 释放，超过 reset_seconds 仍未结束的探测也视为已释放
+    定时任务每次运行都是新进程，状态保存在 path（JSON）中，故障期间后续的运行也能快速失败。
+    多个进程共用状态文件：文件修改后重新读取，记录结果时在文件锁内重新读取并只修改对应的端点。
+    """
+    
+    def __init__(self, path=DEFAULT_STATE_PATH, failure_threshold=3, reset_seconds=300, enabled=True):
+        self.path = path
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._states = {}
+        self._version = None
+        # 端点 -> 探测请求的开始时间
+        self._probing = {}
+        self._rejected = 0
+        
+        if self.enabled:
+            self._load()
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置中的 circuit_breaker 段创建熔断器"""
+        return cls(**config.get('circuit_breaker', {}))
+    
+    @staticmethod
+    def endpoint(url):
+        """端点标识：主机+路径，不含查询参数"""
+        parts = urlsplit(url)
+        return parts.netloc + parts.path
+    
+    def _file_version(self):
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    
+    def _load(self):
+        """读取状态文件，文件未变化时沿用已读取的状态"""
+        try:
+            version = self._file_version()
+        except FileNotFoundError:
+            self._states, self._version = {}, None
+            return
+        except OSError as e:
+            logger.warning(f"读取熔断状态失败，沿用当前状态: {e}")
+            return
+        if version == self._version:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._states = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取熔断状态失败，沿用当前状态: {e}")
+            return
+        self._version = version
+    
+    def _update(self, endpoint, change):
+        """在文件锁内重新读取状态，用 change(原状态) 的返回值替换单个端点（None 为删除）并写回
+        
+        只修改该端点，其他进程记录的其他端点不会被覆盖；返回原状态。调用方持有 self._lock。
+        """
+        with file_lock(self.path + '.lock'):
+            self._load()
+            previous = self._states.get(endpoint)
+            state = change(previous)
+            if state is None:
+                self._states.pop(endpoint, None)
+            else:
+                self._states[endpoint] = state
+            self._save()
+            self._version = self._file_version()
+        return previous
+    
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._states, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+    
+    def _opened_at(self, endpoint):
+        return self._states.get(endpoint, {}).get('opened_at')
+    
+    def before_request(self, url):
+        """请求前检查，熔断中抛出 CircuitOpenError；半开时只放行一个探测请求
+        
+        放行的是探测请求时返回 True，调用方须在请求结束后（无论结果）调用 release。
+        """
+        if not self.enabled:
+            return False
+        endpoint = self.endpoint(url)
+        with self._lock:
+            self._load()
+            opened_at = self._opened_at(endpoint)
+            if opened_at is None:
+                return False
+            now = time.time()
+            remaining = opened_at + self.reset_seconds - now
+            if remaining > 0:
+                self._rejected += 1
+                raise CircuitOpenError(f"{endpoint} 熔断中，{remaining:.0f} 秒后再次探测")
+            probe_started_at = self._probing.get(endpoint)
+            if probe_started_at is not None and now - probe_started_at < self.reset_seconds:
+                self._rejected += 1
+                raise CircuitOpenError(f"{endpoint} 熔断半开，探测请求进行中")
+            self._probing[endpoint] = now
+        logger.info(f"{endpoint} 熔断半开，发送探测请求")
+        return True
+    
+    def release(self, url):
+        """探测请求结束，未记录成功或失败（被取消、非网络异常）时允许下一个请求重新探测"""
+        with self._lock:
+            self._probing.pop(self.endpoint(url), None)
+    
+    def record_success(self, url):
+        """请求成功，关闭熔断并清零失败计数"""
+        if not self.enabled:
+            return
+        endpoint = self.endpoint(url)
+        with self._lock:
+            self._probing.pop(endpoint, None)
+            self._load()
+            if endpoint not in self._states:
+                return
+            previous = self._update(endpoint, lambda state: None)
+        if previous and previous.get('opened_at') is not None:
+            logger.info(f"{endpoint} 已恢复，熔断关闭")
+    
+    def record_failure(self, url):
+        """请求失败，连续失败达到阈值或半开探测失败时打开熔断"""
+        if not self.enabled:
+            return
+        endpoint = self.endpoint(url)
+        
+        def fail(state):
+            state = dict(state or {'failures': 0, 'opened_at': None})
+            state['failures'] += 1
+            if probing or (state['opened_at'] is None and state['failures'] >= self.failure_threshold):
+                state['opened_at'] = time.time()
+            return state
+        
+        with self._lock:
+            probing = self._probing.pop(endpoint, None) is not None
+            previous = self._update(endpoint, fail)
+            state = self._states[endpoint]
+        opened = state['opened_at'] is not None and state['opened_at'] != (previous or {}).get('opened_at')
+        if opened:
+            logger.warning(f"{endpoint} 连续失败 {state['failures']} 次，熔断打开 {self.reset_seconds} 秒")
+    
+    def is_open(self, url):
+        """端点是否处于熔断（含半开探测中）"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._load()
+            return self._opened_at(self.endpoint(url)) is not None
+    
+    def stats(self):
+        """返回熔断中的端点和被拒绝的请求数"""
+        with self._lock:
+            if self.enabled:
+                self._load()
+            return {
+                'open': [endpoint for endpoint, state in self._states.items() if state.get('opened_at') is not None],
+                'rejected': self._rejected,
+            }
@@ -0,0 +1,313 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from run_all import PIPELINES, UnifiedRunner
+from trading_calendar import LatestDateResolver
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 未配置 daemon.jobs 时的默认计划：A股收盘、港股收盘、宏观指标
+DEFAULT_JOBS = [
+    {'name': 'cn_close', 'cron': '35 15 * * 1-5', 'pipelines': ['cn', 'stock'], 'market': 'cn'},
+    {'name': 'hk_close', 'cron': '30 16 * * 1-5', 'pipelines': ['hk'], 'market': 'hk'},
+    {'name': 'indicators', 'cron': '0 18 * * 1-5', 'pipelines': ['indicator']},
+]
+
+# 配置中这些段都不变时，重新加载配置会沿用已有的连接池（含熔断器）、缓存和指标存储
+SHARED_RESOURCES = {
+    'session': ('http', 'circuit_breaker'),
+    'cache': ('lixinger_cache',),
+    'store': ('indicator_store',),
+}
+
+def _parse_field(field, low, high):
+    """解析 cron 的单个字段，支持 *、列表、区间和步长"""
+    values = set()
+    for part in field.split(','):
+        value, _, step = part.partition('/')
+        if value == '*':
+            start, end = low, high
+        elif '-' in value:
+            start, end = (int(x) for x in value.split('-'))
+        else:
+            start = end = int(value)
+            if step:
+                end = high
+        if start < low or end > high or start > end:
+            raise ValueError(f"cron 字段超出范围: {field}")
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return values
+
+class CronSchedule:
+    """五段式 cron 表达式：分 时 日 月 周（周日为 0 或 7）
+    
+    日和周同时受限时满足其一即可；以 * 开头的字段（包括 */n）视为不受限，
+    此时日和周需同时满足，与 Vixie cron 一致（如 "0 9 */2 * 1" 为单数日中的周一）。
+    """
+    
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 表达式需要 5 段: {expression}")
+        self.expression = expression
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        weekdays = _parse_field(fields[4], 0, 7)
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2].startswith('*')
+        self.any_weekday = fields[4].startswith('*')
+    
+    def _day_matches(self, day):
+        if day.month not in self.months:
+            return False
+        day_match = day.day in self.days
+        # Python 中周一为 0，cron 中周日为 0
+        weekday_match = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_match and weekday_match
+        return day_match or weekday_match
+    
+    def next_after(self, moment):
+        """返回 moment 之后（不含）的下一个触发时间"""
+        start = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"cron 表达式没有可触发的时间: {self.expression}")
+
+class ScheduledJob:
+    """一个定时任务：在 cron 时间运行指定的流水线"""
+    
+    def __init__(self, name, cron, pipelines, market=None, trading_days_only=True):
+        unknown = [pipeline for pipeline in pipelines if pipeline not in PIPELINES]
+        if unknown:
+            raise ValueError(f"未知的流水线: {', '.join(unknown)}")
+        self.name = name
+        self.schedule = CronSchedule(cron)
+        self.pipelines = pipelines
+        self.market = market
+        # 指定了市场时，非交易日（如节假日）跳过
+        self.trading_days_only = trading_days_only
+        self.next_run = None
+    
+    def plan(self, now):
+        """计算 now 之后的下一次运行时间"""
+        self.next_run = self.schedule.next_after(now)
+
+class BotDaemon:
+    """常驻进程：按计划运行播报任务
+    
+    机器人、HTTP 连接池、理杏仁缓存和指标存储在各次运行之间保持常驻；
+    config.json 修改后在下一次检查时重新加载，未变化的共享资源会被沿用。
+    """
+    
+    def __init__(self, config_file='config.json'):
+        self.config_file = config_file
+        self.config_mtime = None
+        self.runner = None
+        self.calendar = None
+        self.jobs = []
+        self.poll_seconds = 5
+        self._stop = threading.Event()
+        # 运行中的任务名；重新加载配置会重建任务对象，因此按名称记录
+        self._running = set()
+        self._running_lock = threading.Lock()
+        # 重新加载配置前的运行器及其沿用给新运行器的资源，没有运行中的任务后关闭
+        self._retired = []
+        self._executor = None
+        self.load_config()
+    
+    def load_config(self):
+        """读取配置并重建任务与机器人，配置有误时保留当前状态"""
+        mtime = os.path.getmtime(self.config_file)
+        with open(self.config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        
+        options = config.get('daemon', {})
+        jobs = [ScheduledJob(**job) for job in options.get('jobs', DEFAULT_JOBS)]
+        pipelines = []
+        for job in jobs:
+            pipelines.extend(name for name in job.pipelines if name not in pipelines)
+        
+        previous_runner = self.runner
+        shared = {}
+        if self.runner is not None:
+            for attribute, sections in SHARED_RESOURCES.items():
+                if all(self.runner.config.get(section) == config.get(section) for section in sections):
+                    shared[attribute] = getattr(self.runner, attribute)
+        self.runner = UnifiedRunner(self.config_file, pipelines=pipelines, config=config, **shared)
+        self.calendar = LatestDateResolver.from_config(config).calendar
+        
+        now = datetime.now()
+        previous_jobs = {job.name: job for job in self.jobs}
+        for job in jobs:
+            previous = previous_jobs.get(job.name)
+            if previous is not None and previous.schedule.expression == job.schedule.expression:
+                # 计划未变的任务沿用下次运行时间，已到期尚未触发的运行不会因重新加载被跳过
+                job.next_run = previous.next_run
+            else:
+                job.plan(now)
+        self.jobs = jobs
+        self.poll_seconds = options.get('poll_seconds', 5)
+        self.config_mtime = mtime
+        
+        if previous_runner is not None:
+            with self._running_lock:
+                self._retired.append((previous_runner, set(shared)))
+            self._close_retired()
+        if shared:
+            logger.info(f"沿用已有资源: {', '.join(shared)}")
+        for job in self.jobs:
+            logger.info(f"任务 {job.name}（{job.schedule.expression}）: {', '.join(job.pipelines)}，"
+                        f"下次运行 {job.next_run:%Y-%m-%d %H:%M}")
+    
+    def _close_retired(self):
+        """没有运行中的任务时关闭重新加载前的运行器（机器人的状态库连接和未沿用的资源）"""
+        with self._running_lock:
+            if self._running:
+                return
+            retired, self._retired = self._retired, []
+        for runner, keep in retired:
+            try:
+                runner.close(keep)
+            except Exception as e:
+                logger.warning(f"关闭旧的运行器失败: {e}")
+    
+    def reload_if_changed(self):
+        """配置文件修改时间变化时重新加载"""
+        try:
+            mtime = os.path.getmtime(self.config_file)
+        except OSError as e:
+            logger.error(f"无法读取配置文件: {e}")
+            return False
+        if mtime == self.config_mtime:
+            return False
+        
+        logger.info("检测到配置文件变化，重新加载")
+        try:
+            self.load_config()
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            # 配置写了一半或格式有误，保留当前配置，等待下一次修改
+            logger.error(f"重新加载配置失败，继续使用当前配置: {e}")
+            self.config_mtime = mtime
+            return False
+        return True
+    
+    def is_trading_day(self, job, moment):
+        """任务指定了市场时，判断 moment 是否为该市场的交易日"""
+        if not job.market or not job.trading_days_only:
+            return True
+        return bool(self.calendar.trading_days(job.market, moment, moment))
+    
+    def run_job(self, job, date=None):
+        """执行一个任务，返回 {流水线: 是否成功}"""
+        try:
+            return self.runner.run(date, pipelines=job.pipelines)
+        except Exception as e:
+            logger.error(f"任务 {job.name} 执行失败: {e}", exc_info=True)
+            return {}
+        finally:
+            with self._running_lock:
+                self._running.discard(job.name)
+            self._close_retired()
+    
+    def warm_up(self):
+        """预先导入延迟加载的重量级依赖，第一次触发时无需等待导入"""
+        started_at = time.time()
+        try:
+            # 只为提前加载模块，导入后不直接使用
+            import pandas
+            if 'indicator' in self.runner.bots:
+                from indicator import load_akshare
+                load_akshare()
+        except Exception as e:
+            logger.warning(f"预热失败，将在首次运行时导入: {e}")
+            return
+        logger.info(f"预热完成，耗时 {time.time() - started_at:.1f} 秒")
+    
+    def _trigger(self, job, now):
+        scheduled = job.next_run
+        # 按当前时间计划下一次，进程挂起后恢复时不会补跑错过的多次
+        job.plan(now)
+        if not self.is_trading_day(job, scheduled):
+            logger.info(f"{scheduled:%Y-%m-%d} 不是 {job.market} 交易日，跳过任务 {job.name}")
+            return
+        with self._running_lock:
+            if job.name in self._running:
+                logger.warning(f"任务 {job.name} 上一次运行尚未结束，跳过本次")
+                return
+            self._running.add(job.name)
+        logger.info(f"触发任务 {job.name}（计划时间 {scheduled:%H:%M}，延迟 {(now - scheduled).total_seconds():.2f} 秒）")
+        self._executor.submit(self.run_job, job)
+    
+    def run_forever(self):
+        """主循环：睡眠到最近的触发时间，期间定期检查配置变化"""
+        self._executor = ThreadPoolExecutor(max_workers=max(len(self.jobs), 1) + 1, thread_name_prefix='job')
+        self._executor.submit(self.warm_up)
+        logger.info("常驻进程已启动")
+        try:
+            while not self._stop.is_set():
+                self.reload_if_changed()
+                now = datetime.now()
+                for job in self.jobs:
+                    if job.next_run <= now:
+                        self._trigger(job, now)
+                
+                next_run = min(job.next_run for job in self.jobs)
+                timeout = min((next_run - datetime.now()).total_seconds(), self.poll_seconds)
+                self._stop.wait(max(timeout, 0))
+        finally:
+            logger.info("常驻进程正在退出，等待运行中的任务结束")
+            self._executor.shutdown(wait=True)
+    
+    def stop(self, *args):
+        """停止主循环（可作为信号处理函数）"""
+        self._stop.set()
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='常驻进程：按计划运行播报任务')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    parser.add_argument('--run-now', metavar='JOB', help='立即运行指定任务一次后退出')
+    args = parser.parse_args()
+    
+    try:
+        daemon = BotDaemon(args.config)
+        if args.run_now:
+            jobs = {job.name: job for job in daemon.jobs}
+            if args.run_now not in jobs:
+                logger.error(f"未知的任务: {args.run_now}，可选: {', '.join(jobs)}")
+                return
+            daemon.run_job(jobs[args.run_now])
+            return
+        
+        signal.signal(signal.SIGTERM, daemon.stop)
+        signal.signal(signal.SIGINT, daemon.stop)
+        daemon.run_forever()
+    
+    except FileNotFoundError:
+        logger.error(f"配置文件 {args.config} 不存在")
+    except json.JSONDecodeError:
+        logger.error("配置文件格式错误")
+    except Exception as e:
+        logger.error(f"程序执行出错: {e}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+import importlib
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing.connection import wait
+
+logger = logging.getLogger(__name__)
+
+class DeadlineExceeded(TimeoutError):
+    """调用超过硬性时限，工作进程已被终止"""
+
+def _work(module_name, func, args, kwargs, conn):
+    """工作进程入口：导入模块并调用函数，结果（或异常）经管道返回"""
+    try:
+        module = importlib.import_module(module_name)
+        conn.send((True, getattr(module, func)(*args, **kwargs)))
+    except BaseException as e:
+        try:
+            conn.send((False, e))
+        except Exception:
+            # 异常对象无法序列化时只传回说明
+            conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+    finally:
+        conn.close()
+
+class DeadlineRunner:
+    """在可终止的独立进程中执行同步抓取，保证硬性时限
+    
+    线程无法被强制结束，卡住的 akshare 抓取会一直占住调用方；这里每次调用启动一个工作进程，
+    超过 deadline_seconds 仍未返回时直接终止进程并抛出 DeadlineExceeded。
+    hedge_after_seconds 不为空时，首次尝试在该时间内未返回则再启动一个相同的对冲尝试，
+    先返回的结果生效，其余进程随即终止；总耗时仍不超过 deadline_seconds。
+    
+    默认使用 forkserver（不可用时为 spawn）启动进程，forkserver 预先导入 akshare，
+    工作进程无需每次重新导入；start_method 可设为 fork 以继承调用方的模块（测试替身）。
+    """
+    
+    def __init__(self, deadline_seconds=60, hedge_after_seconds=None, start_method=None,
+                 preload=('akshare',), enabled=True):
+        self.deadline_seconds = deadline_seconds
+        self.hedge_after_seconds = hedge_after_seconds
+        self.enabled = enabled
+        
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.start_method = start_method
+        self._context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver' and preload:
+            # 预加载失败（如未安装）时 forkserver 会忽略，由工作进程自行导入并报错
+            self._context.set_forkserver_preload(list(preload))
+        
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._timeouts = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置中的 akshare_deadline 段创建执行器"""
+        return cls(**config.get('akshare_deadline', {}))
+    
+    def _start(self, module_name, func, args, kwargs):
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_work, args=(module_name, func, args, kwargs, writer),
+            name=f"deadline-{func}", daemon=True
+        )
+        process.start()
+        # 父进程关闭写端，工作进程异常退出时读端才能收到 EOF
+        writer.close()
+        return process, reader
+    
+    @staticmethod
+    def _stop(attempt):
+        process, reader = attempt
+        if process.is_alive():
+            process.kill()
+        process.join(1)
+        reader.close()
+    
+    def call(self, module_name, func, args=(), kwargs=None):
+        """在工作进程中调用 module_name.func(*args, **kwargs)，超时抛出 DeadlineExceeded"""
+        kwargs = kwargs or {}
+        started_at = time.monotonic()
+        deadline_at = started_at + self.deadline_seconds
+        hedge_at = started_at + self.hedge_after_seconds if self.hedge_after_seconds else None
+        first_attempt = self._start(module_name, func, args, kwargs)
+        attempts = [first_attempt]
+        with self._lock:
+            self._calls += 1
+        
+        error = None
+        try:
+            while attempts:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise DeadlineExceeded(f"{func} 超过 {self.deadline_seconds} 秒未返回")
+                wake_at = deadline_at if hedge_at is None else min(deadline_at, hedge_at)
+                
+                for reader in wait([reader for _, reader in attempts], timeout=max(wake_at - now, 0)):
+                    attempt = next(attempt for attempt in attempts if attempt[1] is reader)
+                    attempts.remove(attempt)
+                    try:
+                        ok, result = reader.recv()
+                    except EOFError:
+                        ok, result = False, None
+                    self._stop(attempt)
+                    if result is None and not ok:
+                        result = RuntimeError(f"{func} 工作进程异常退出（退出码 {attempt[0].exitcode}）")
+                    if ok:
+                        if attempt is not first_attempt:
+                            with self._lock:
+                                self._hedge_wins += 1
+                            logger.info(f"{func} 由对冲尝试先返回")
+                        return result
+                    error = result
+                
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    # 首次尝试已失败时不再对冲，直接返回其异常
+                    if attempts:
+                        logger.warning(f"{func} 超过 {self.hedge_after_seconds} 秒未返回，启动对冲尝试")
+                        attempts.append(self._start(module_name, func, args, kwargs))
+                        with self._lock:
+                            self._hedges += 1
+            raise error
+        finally:
+            for attempt in attempts:
+                self._stop(attempt)
+    
+    def module(self, module_name):
+        """返回模块代理，函数调用均在工作进程中以硬性时限执行"""
+        return DeadlineModule(self, module_name)
+    
+    def stats(self):
+        """返回调用、超时、对冲及对冲先返回的次数"""
+        with self._lock:
+            return {
+                'calls': self._calls,
+                'timeouts': self._timeouts,
+                'hedges': self._hedges,
+                'hedge_wins': self._hedge_wins,
+            }
+
+class DeadlineModule:
+    """模块代理：属性访问返回在工作进程中执行的函数"""
+    
+    def __init__(self, runner, module_name):
+        self._runner = runner
+        self._module_name = module_name
+    
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            return self._runner.call(self._module_name, name, args, kwargs)
+        return call
\ No newline at end of file
@@ -0,0 +1,170 @@
+import logging
+import threading
+
+import requests
+
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# 钉钉 markdown 消息正文上限约 20000 字节，预留余量
+MAX_MESSAGE_BYTES = 18000
+# 钉钉机器人发送过快时返回的错误码
+ERRCODE_SEND_TOO_FAST = 130101
+# 单次发送的结果
+SENT = 'sent'
+FAILED = 'failed'
+THROTTLED = 'throttled'
+
+# 同一个机器人的限流器在进程内共享，多个播报任务不会叠加超限
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(webhook_url, messages_per_minute, burst):
+    """获取指定机器人的共享限流器"""
+    with _limiters_lock:
+        limiter = _limiters.get(webhook_url)
+        if limiter is None:
+            limiter = RateLimiter.per_minute(messages_per_minute, capacity=burst)
+            _limiters[webhook_url] = limiter
+        return limiter
+
+def _split_line(line, max_bytes):
+    """将超长的单行按字节切分，不截断多字节字符"""
+    pieces = []
+    current = ''
+    current_bytes = 0
+    for char in line:
+        char_bytes = len(char.encode('utf-8'))
+        if current and current_bytes + char_bytes > max_bytes:
+            pieces.append(current)
+            current, current_bytes = '', 0
+        current += char
+        current_bytes += char_bytes
+    if current:
+        pieces.append(current)
+    return pieces
+
+def split_message(message, max_bytes=MAX_MESSAGE_BYTES, separator='\n'):
+    """按行边界将消息切分为不超过 max_bytes 字节的若干段"""
+    if len(message.encode('utf-8')) <= max_bytes:
+        return [message]
+    
+    separator_bytes = len(separator.encode('utf-8'))
+    parts = []
+    current = []
+    current_bytes = 0
+    for line in message.split(separator):
+        line_bytes = len(line.encode('utf-8'))
+        if line_bytes > max_bytes:
+            pieces = _split_line(line, max_bytes)
+        else:
+            pieces = [line]
+        for piece in pieces:
+            piece_bytes = len(piece.encode('utf-8'))
+            extra = piece_bytes + (separator_bytes if current else 0)
+            if current and current_bytes + extra > max_bytes:
+                parts.append(separator.join(current))
+                current, current_bytes = [], 0
+                extra = piece_bytes
+            current.append(piece)
+            current_bytes += extra
+    if current:
+        parts.append(separator.join(current))
+    return parts
+
+class DingTalkSender:
+    """钉钉机器人消息发送
+    
+    超长消息按行切分并编号，所有分段经令牌桶限流后依次发送，
+    默认每分钟 15 条、突发 5 条，任意一分钟内不超过钉钉每分钟 20 条的限制。
+    被钉钉限流（130101）时暂停限流器 throttle_pause_seconds 秒后重试，最多 max_throttle_retries 次。
+    同步发送和异步引擎共用分段、请求体和结果检查，只有等待和请求方式不同。
+    """
+    
+    def __init__(self, webhook_url, session, separator='\n', max_bytes=MAX_MESSAGE_BYTES,
+                 messages_per_minute=15, burst=5, max_throttle_retries=3, throttle_pause_seconds=10):
+        self.webhook_url = webhook_url
+        self.session = session
+        self.separator = separator
+        self.max_bytes = max_bytes
+        self.max_throttle_retries = max_throttle_retries
+        self.throttle_pause_seconds = throttle_pause_seconds
+        self.rate_limiter = get_rate_limiter(webhook_url, messages_per_minute, burst)
+    
+    @classmethod
+    def from_config(cls, config, webhook_url, session, separator='\n'):
+        """根据完整配置中的 dingtalk_sender 段创建发送器"""
+        return cls(webhook_url, session, separator=separator, **config.get('dingtalk_sender', {}))
+    
+    def split(self, message, title):
+        """切分消息，多段时每段前加上编号标题"""
+        # 为编号标题预留空间
+        header_bytes = len(f"**{title} (99/99)**".encode('utf-8')) + len(self.separator.encode('utf-8'))
+        parts = split_message(message, self.max_bytes - header_bytes, self.separator)
+        if len(parts) == 1:
+            return parts
+        total = len(parts)
+        return [f"**{title} ({i}/{total})**{self.separator}{part}" for i, part in enumerate(parts, 1)]
+    
+    def payloads(self, message, title):
+        """切分消息并生成各段的请求体，多段时标题带编号"""
+        parts = self.split(message, title)
+        if len(parts) > 1:
+            logger.info(f"消息长度超过限制，拆分为 {len(parts)} 段发送")
+        return [
+            {
+                "msgtype": "markdown",
+                "markdown": {
+                    "title": title if len(parts) == 1 else f"{title} ({i}/{len(parts)})",
+                    "text": part
+                }
+            }
+            for i, part in enumerate(parts, 1)
+        ]
+    
+    def check_result(self, status, result, attempt):
+        """检查一次发送的结果，返回 SENT、FAILED 或 THROTTLED（已暂停限流器，应重试）"""
+        if status != 200:
+            logger.error(f"钉钉请求失败，状态码: {status}")
+            return FAILED
+        errcode = result.get('errcode') if isinstance(result, dict) else None
+        if errcode == 0:
+            logger.info("消息发送成功")
+            return SENT
+        if errcode == ERRCODE_SEND_TOO_FAST and attempt < self.max_throttle_retries:
+            # 被钉钉限流（例如其他进程也在使用同一机器人），限流器暂停一段时间后重试
+            logger.warning(f"钉钉限流，{self.throttle_pause_seconds} 秒后重试: {result}")
+            self.rate_limiter.pause(self.throttle_pause_seconds)
+            return THROTTLED
+        logger.error(f"钉钉API返回错误: {result}")
+        return FAILED
+    
+    def send(self, message, title):
+        """发送消息，所有分段都发送成功时返回 True"""
+        payloads = self.payloads(message, title)
+        for i, payload in enumerate(payloads, 1):
+            if not self._send_part(payload):
+                logger.error(f"第 {i}/{len(payloads)} 段发送失败，停止发送剩余分段")
+                return False
+        return True
+    
+    def _send_part(self, payload):
+        for attempt in range(self.max_throttle_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                logger.info("正在发送消息到钉钉...")
+                response = self.session.post(
+                    self.webhook_url,
+                    json=payload,
+                    headers={'Content-Type': 'application/json'}
+                )
+                result = response.json() if response.status_code == 200 else None
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.error(f"钉钉请求异常: {e}")
+                return False
+            
+            outcome = self.check_result(response.status_code, result, attempt)
+            if outcome != THROTTLED:
+                return outcome == SENT
+        return False
@@ -0,0 +1,36 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 没有 flock，退化为进程内的锁
+    fcntl = None
+
+_local_locks = {}
+_local_locks_lock = threading.Lock()
+
+@contextmanager
+def file_lock(path):
+    """以 path 为锁文件的排他锁，多个进程（以及同一进程的多个线程）读改写同一份文件时串行执行
+    
+    使用 fcntl.flock，进程退出时由系统释放，不会残留死锁；锁文件本身不删除。
+    不支持 flock 的平台上只在进程内加锁。
+    """
+    if fcntl is None:
+        with _local_locks_lock:
+            lock = _local_locks.setdefault(os.path.abspath(path), threading.Lock())
+        with lock:
+            yield
+        return
+    
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,336 @@
+import argparse
+import importlib.util
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import date as Date
+
+from file_lock import file_lock
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_PATH = 'data/history'
+PARTITION_SUFFIX = '.arrow'
+# 每个市场目录下的写入锁文件
+LOCK_NAME = '.lock'
+# 每个市场目录下的最新值索引（每个代码、指标一行，格式同分区文件），不计入分区
+LATEST_NAME = 'latest.index'
+# 长表的列：日期、代码（指标为数据源名称）、指标名、数值
+COLUMNS = ['date', 'code', 'metric', 'value']
+
+def _to_float(value):
+    """转换为有限浮点数，非数值（字符串、缺失、NaN）返回 None"""
+    if isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+def valuation_rows(valuation_data, metrics, date):
+    """理杏仁响应转换为 (日期, 代码, 指标, 数值) 行，日期优先使用响应中的数据日期"""
+    rows = []
+    for item in (valuation_data or {}).get('data') or []:
+        code = item.get('stockCode')
+        if not code:
+            continue
+        day = str(item.get('date') or date)[:10]
+        for metric in metrics:
+            value = _to_float(item.get(metric))
+            if value is not None:
+                rows.append((day, code, metric, value))
+    return rows
+
+def backfill_rows(rows):
+    """回填数据库的 (代码, 日期, 指标 JSON) 行转换为 (日期, 代码, 指标, 数值) 行，只保留数值"""
+    result = []
+    for code, date, metrics_json in rows:
+        for metric, value in json.loads(metrics_json).items():
+            value = _to_float(value)
+            if value is not None:
+                result.append((date, code, metric, value))
+    return result
+
+def indicator_rows(indicators_data, sources):
+    """指标最新数据转换为行：代码为数据源名称，只保留数值字段"""
+    rows = []
+    for source in sources:
+        data = indicators_data.get(source['name'])
+        if not isinstance(data, dict):
+            continue
+        date_column = source.get('date_column', 'date')
+        date_key = (source.get('field_mapping') or {}).get(date_column, date_column)
+        if not data.get(date_key):
+            continue
+        day = str(data[date_key])[:10]
+        for key, value in data.items():
+            value = _to_float(value)
+            if key != date_key and value is not None:
+                rows.append((day, source['name'], key, value))
+    return rows
+
+class HistoryStore:
+    """估值与指标的列式历史存储（Arrow IPC 文件，按市场和月份分区）
+    
+    分区文件为 <path>/<market>/<YYYY-MM>.arrow，保存长表 date(date32)、code、metric（字典编码）、
+    value(float64)，按 code、date 排序。市场与回填、运行器的流水线名一致：cn、hk、stock、indicator。
+    - 追加时只重写涉及的月份文件（写临时文件后替换），相同 date+code+metric 以新值为准；
+      读改写在市场目录的文件锁内进行，机器人、回填和 API 服务等多个进程写入同一分区时不会丢失数据
+    - 读取时内存映射分区文件，列数据直接引用映射的页面，不复制到堆内存，
+      常驻内存不随历史长度增长；已打开的分区按文件身份缓存
+    - 每个市场另有最新值索引 latest.index，追加时在同一文件锁内更新，latest 只读取该索引
+    需要 pyarrow，未安装时存储自动关闭。
+    """
+    
+    def __init__(self, path=DEFAULT_HISTORY_PATH, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._tables = {}
+        
+        if self.enabled and importlib.util.find_spec('pyarrow') is None:
+            logger.warning("未安装 pyarrow，历史存储已关闭")
+            self.enabled = False
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置中的 history_store 段创建存储"""
+        return cls(**config.get('history_store', {}))
+    
+    def _partition_path(self, market, month):
+        return os.path.join(self.path, market, month + PARTITION_SUFFIX)
+    
+    def partitions(self, market, start_date=None, end_date=None):
+        """按月份顺序返回与日期区间相交的分区文件路径"""
+        directory = os.path.join(self.path, market)
+        if not self.enabled or not os.path.isdir(directory):
+            return []
+        months = sorted(name[:-len(PARTITION_SUFFIX)] for name in os.listdir(directory)
+                        if name.endswith(PARTITION_SUFFIX))
+        return [
+            os.path.join(directory, month + PARTITION_SUFFIX) for month in months
+            if (not start_date or month >= start_date[:7]) and (not end_date or month <= end_date[:7])
+        ]
+    
+    def _open(self, path):
+        """内存映射打开分区文件，文件被替换后重新映射"""
+        import pyarrow as pa
+        
+        stat = os.stat(path)
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._tables.get(path)
+            if cached is not None and cached[0] == identity:
+                return cached[1]
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        with self._lock:
+            self._tables[path] = (identity, table)
+        return table
+    
+    @staticmethod
+    def _to_frame(table):
+        """分区或索引文件转换为 DataFrame，字典编码的代码和指标列转换为字符串"""
+        frame = table.to_pandas()
+        for column in ('date', 'code', 'metric'):
+            frame[column] = frame[column].astype(str)
+        return frame
+    
+    @staticmethod
+    def _keep_latest(frame):
+        """每个代码、指标只保留日期最大的行，日期相同时以后出现的行为准"""
+        return frame.sort_values('date', kind='stable').drop_duplicates(['code', 'metric'], keep='last')
+    
+    def _scan_latest(self, market):
+        """扫描全部分区得到每个代码、指标的最新行，用于重建缺失的索引
+        
+        从最新的月份分区向前读取，已找到的 (代码, 指标) 不再取更早的值。
+        """
+        import pandas as pd
+        
+        latest = pd.DataFrame(columns=COLUMNS)
+        for path in reversed(self.partitions(market)):
+            frame = self._keep_latest(self._to_frame(self._open(path)))
+            if len(latest):
+                known = pd.MultiIndex.from_frame(latest[['code', 'metric']])
+                frame = frame[~pd.MultiIndex.from_frame(frame[['code', 'metric']]).isin(known)]
+            latest = pd.concat([latest, frame], ignore_index=True) if len(latest) else frame
+        return latest
+    
+    def _load_latest(self, market):
+        """读取最新值索引，索引不存在（旧版本写入的存储）时扫描分区并写入索引，调用方需持有写入锁"""
+        path = os.path.join(self.path, market, LATEST_NAME)
+        if os.path.exists(path):
+            return self._to_frame(self._open(path))
+        latest = self._scan_latest(market)
+        if len(latest):
+            self._write(path, latest.sort_values(['code', 'metric'], kind='stable'))
+        return latest
+    
+    def _write(self, path, frame):
+        import pyarrow as pa
+        
+        table = pa.table({
+            'date': pa.array(frame['date'].to_numpy(dtype=object).astype('datetime64[D]'), pa.date32()),
+            'code': pa.array(frame['code'].to_numpy(dtype=object), pa.string()).dictionary_encode(),
+            'metric': pa.array(frame['metric'].to_numpy(dtype=object), pa.string()).dictionary_encode(),
+            'value': pa.array(frame['value'].to_numpy(dtype=float), pa.float64()),
+        })
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        # 不压缩，读取时才能直接映射
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    
+    def append(self, market, rows):
+        """追加 (日期, 代码, 指标, 数值) 行，返回写入行数"""
+        if not self.enabled or not rows:
+            return 0
+        import pandas as pd
+        
+        frame = pd.DataFrame(rows, columns=COLUMNS)
+        frame['date'] = frame['date'].astype(str).str[:10]
+        # 写入串行执行（线程间和进程间），避免两次追加同时重写同一个月份文件
+        with self._write_lock, file_lock(os.path.join(self.path, market, LOCK_NAME)):
+            for month, part in frame.groupby(frame['date'].str[:7]):
+                path = self._partition_path(market, month)
+                if os.path.exists(path):
+                    part = pd.concat([self._to_frame(self._open(path)), part], ignore_index=True)
+                part = part.drop_duplicates(['date', 'code', 'metric'], keep='last')
+                self._write(path, part.sort_values(['code', 'date', 'metric'], kind='stable'))
+            # 新行排在索引之后，日期相同时以新值为准；回填的更早数据不会替换已有的最新值
+            latest = self._keep_latest(pd.concat([self._load_latest(market), frame], ignore_index=True))
+            self._write(os.path.join(self.path, market, LATEST_NAME),
+                        latest.sort_values(['code', 'metric'], kind='stable'))
+        logger.info(f"历史存储 {market} 写入 {len(frame)} 行")
+        return len(frame)
+    
+    def read(self, market, metric=None, codes=None, start_date=None, end_date=None):
+        """读取历史数据，返回 pyarrow.Table（列引用内存映射的分区，过滤后只复制命中的行）"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        
+        tables = [self._open(path) for path in self.partitions(market, start_date, end_date)]
+        if not tables:
+            return pa.table({
+                'date': pa.array([], pa.date32()),
+                'code': pa.array([], pa.string()),
+                'metric': pa.array([], pa.string()),
+                'value': pa.array([], pa.float64()),
+            })
+        table = pa.concat_tables(tables)
+        
+        conditions = []
+        if metric:
+            conditions.append(pc.equal(table['metric'], metric))
+        if codes:
+            conditions.append(pc.is_in(table['code'], value_set=pa.array(list(codes), pa.string())))
+        if start_date:
+            conditions.append(pc.greater_equal(table['date'], pa.scalar(Date.fromisoformat(start_date[:10]), pa.date32())))
+        if end_date:
+            conditions.append(pc.less_equal(table['date'], pa.scalar(Date.fromisoformat(end_date[:10]), pa.date32())))
+        if not conditions:
+            return table
+        mask = conditions[0]
+        for condition in conditions[1:]:
+            mask = pc.and_(mask, condition)
+        return table.filter(mask)
+    
+    def series(self, market, code, metric, start_date=None, end_date=None):
+        """单个代码单个指标的日期序列，返回以日期为索引的 pandas Series"""
+        import pandas as pd
+        
+        table = self.read(market, metric, [code], start_date, end_date)
+        return pd.Series(
+            table['value'].to_numpy(),
+            index=pd.DatetimeIndex(table['date'].to_numpy().astype('datetime64[ns]')),
+            name=metric
+        )
+    
+    def latest(self, market):
+        """每个代码、每个指标最后一个数据日期的行，按代码、指标排序，无数据时为空表
+        
+        各行的日期为其自身的数据日期：停牌的代码、停止更新的指标返回最后一个数值，不会因
+        其他代码有更新的数据而缺失。只读取追加时维护的最新值索引，不扫描分区。
+        """
+        import pyarrow as pa
+        
+        if not self.partitions(market):
+            return self.read(market)
+        path = os.path.join(self.path, market, LATEST_NAME)
+        if not os.path.exists(path):
+            with self._write_lock, file_lock(os.path.join(self.path, market, LOCK_NAME)):
+                self._load_latest(market)
+        table = self._open(path)
+        return pa.table({
+            'date': table['date'],
+            'code': table['code'].cast(pa.string()),
+            'metric': table['metric'].cast(pa.string()),
+            'value': table['value'],
+        })
+    
+    def version(self, market):
+        """分区文件的版本标识，任一分区被写入或新增后改变"""
+        identities = []
+        for path in self.partitions(market):
+            stat = os.stat(path)
+            identities.append((path, stat.st_ino, stat.st_mtime_ns))
+        return hash(tuple(identities))
+    
+    def import_backfill(self, db_path, market):
+        """导入回填数据库（backfill.py 写入的 valuations 表）中指定市场的全部数据"""
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = backfill_rows(conn.execute(
+                "SELECT stock_code, date, metrics FROM valuations WHERE market = ?", (market,)
+            ))
+        finally:
+            conn.close()
+        return self.append(market, rows)
+    
+    def close(self):
+        """释放已映射的分区"""
+        with self._lock:
+            self._tables.clear()
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='查询本地列式历史存储')
+    parser.add_argument('--market', required=True, choices=['cn', 'hk', 'stock', 'indicator'], help='市场')
+    parser.add_argument('--metric', help='指标名，如 pe_ttm.y10.mcw.cvpos')
+    parser.add_argument('--code', nargs='+', help='代码（指标市场为数据源名称）')
+    parser.add_argument('--start', help='开始日期 YYYY-MM-DD')
+    parser.add_argument('--end', help='结束日期 YYYY-MM-DD')
+    parser.add_argument('--import-backfill', action='store_true', help='先从回填数据库导入该市场的数据')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    args = parser.parse_args()
+    
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    store = HistoryStore.from_config(config)
+    if not store.enabled:
+        logger.error("历史存储未启用")
+        return
+    
+    if args.import_backfill:
+        db_path = config.get('backfill', {}).get('db_path', 'data/backfill.db')
+        store.import_backfill(db_path, args.market)
+    
+    started_at = time.perf_counter()
+    table = store.read(args.market, args.metric, args.code, args.start, args.end)
+    elapsed_ms = (time.perf_counter() - started_at) * 1000
+    logger.info(f"读取 {table.num_rows} 行，{len(store.partitions(args.market, args.start, args.end))} 个分区，"
+                f"耗时 {elapsed_ms:.1f} ms")
+    print(table.slice(max(table.num_rows - 20, 0)).to_pandas().to_string(index=False))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -2,16 +2,47 @@ import json
 import requests
 from datetime import datetime, timedelta
 import logging
+from change_detector import ChangeDetector
+from dingtalk_sender import DingTalkSender
+from history_store import HistoryStore, valuation_rows
+from http_client import HttpClient
+from last_good_store import LastGoodStore
+from lixinger_cache import LixingerCache
+from metric_registry import MetricRegistry
+from metrics import MetricsRecorder
+from percentile_engine import PercentileEngine
+from report_renderer import MARKDOWN, ValuationReport
+from trading_calendar import LatestDateResolver
+from valuation_frame import assign_bands, display_names, format_percent
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class HKIndexValuationBot:
-    def __init__(self, config_file='config.json'):
-        """初始化配置"""
-        with open(config_file, 'r', encoding='utf-8') as f:
-            config = json.load(f)
+    # 钉钉消息标题
+    report_title = "港股指数估值播报"
+    # 指标和状态记录中使用的名称，交易日历市场，以及历史存储的分区
+    bot_name = "hk_index"
+    market = "hk"
+    history_market = "hk"
+    # 消息模板，导入时预编译
+    report_template = ValuationReport(
+        heading="🇭🇰 **港股指数估值播报**",
+        unavailable="📊 港股指数估值数据获取失败",
+        cells=["📈 **{name}**", "估值: **{percentile}%**", "{extra}", "{level}"],
+        separator="\n\n",
+        line_end=""
+    )
+    
+    def __init__(self, config_file='config.json', config=None, session=None, cache=None):
+        """初始化配置
+        
+        config/session/cache 可由统一调度器传入，以共享配置、连接池和缓存
+        """
+        if config is None:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
         
         # 使用港股配置
         self.config = config['hk_config']
@@ -19,6 +50,53 @@ class HKIndexValuationBot:
         self.dingtalk_config = self.config['dingtalk']
         self.stock_codes = self.config['stock_codes']
         self.index_names = self.config.get('index_names', {})
+        # 指标注册表：内置指标与配置中追加的指标合并为一个 metricsList
+        self.metric_registry = MetricRegistry.from_config(config, self.history_market)
+        self.metrics_list = self.metric_registry.metrics_list
+        
+        # 理杏仁API响应缓存
+        self.cache = cache or LixingerCache.from_config(config)
+        # HTTP会话，复用连接
+        self.session = session or HttpClient.from_config(config)
+        # 钉钉消息发送（分段、限流）
+        self.dingtalk = DingTalkSender.from_config(
+            config, self.dingtalk_config['webhook_url'], self.session, separator="\n\n"
+        )
+        # 最新数据日期解析（交易日历 + 探测）
+        self.date_resolver = LatestDateResolver.from_config(config)
+        # 各阶段耗时与结果指标
+        self.metrics = MetricsRecorder.from_config(config, self.bot_name, self.session)
+        # 已播报状态与增量模式的变化检测
+        self.change_detector = ChangeDetector.from_config(config)
+        # 获取到的估值写入本地列式历史存储
+        self.history = HistoryStore.from_config(config)
+        # 最近一次成功获取的数据，接口熔断时回退
+        self.last_good = LastGoodStore.from_config(config)
+        # 本地百分位引擎（启用时），每日获取的数据追加到其持久化状态，理杏仁未返回的窗口百分位写入历史存储
+        self.percentile_engine = PercentileEngine.open(config, self.history_market)
+        self._pending_changes = []
+    
+    def build_payload(self, date):
+        """构建理杏仁请求参数"""
+        return {
+            "token": self.lixinger_config['token'],
+            "date": date,
+            "stockCodes": self.stock_codes,
+            "metricsList": self.metrics_list
+        }
+    
+    def resolve_date(self, date=None):
+        """确定估值日期，未指定时使用已发布数据的最近交易日"""
+        if date is None:
+            date = self.date_resolver.resolve(
+                self.bot_name, self.market,
+                lambda d: LatestDateResolver.has_data(self.get_index_valuation(d), self.metric_registry.rating)
+            )
+        if date is None:
+            # 探测失败时使用7天前的日期（避免使用未来日期）
+            seven_days_ago = datetime.now() - timedelta(days=7)
+            date = seven_days_ago.strftime('%Y-%m-%d')
+        return date
     
     def get_index_valuation(self, date=None):
         """获取港股指数估值数据"""
@@ -26,25 +104,23 @@ class HKIndexValuationBot:
             date = datetime.now().strftime('%Y-%m-%d')
         
         # 构建请求参数
-        payload = {
-            "token": self.lixinger_config['token'],
-            "date": date,
-            "stockCodes": self.stock_codes,
-            "metricsList": [
-                "pe_ttm.y10.mcw.cvpos"  # 市盈率TTM 10年历史百分位
-            ]
-        }
+        payload = self.build_payload(date)
         
         # 添加详细日志输出
         logger.info(f"请求参数: {json.dumps(payload, ensure_ascii=False, indent=2)}")
         
+        cached_data = self.cache.get(self.lixinger_config['api_url'], payload)
+        if cached_data is not None:
+            logger.info(f"命中本地缓存，跳过API请求 - {self.cache.stats()}")
+            return cached_data
+        
         try:
             logger.info(f"正在获取 {date} 的港股指数估值数据...")
-            response = requests.post(
+            response = self.session.post(
                 self.lixinger_config['api_url'],
                 json=payload,
                 headers={'Content-Type': 'application/json'},
-                timeout=30
+                idempotent=True
             )
             
             logger.info(f"API响应状态码: {response.status_code}")
@@ -64,6 +140,9 @@ class HKIndexValuationBot:
                 else:
                     logger.warning("API返回数据中没有 'data' 字段或数据为空")
                 
+                if 'data' in data:
+                    self.cache.set(self.lixinger_config['api_url'], payload, data)
+                
                 return data
             else:
                 logger.error(f"API请求失败，状态码: {response.status_code}")
@@ -74,155 +153,164 @@ class HKIndexValuationBot:
             logger.error(f"请求异常: {e}")
             return None
     
-    def format_message(self, valuation_data, date):
-        """格式化钉钉消息"""
-        logger.info(f"开始格式化消息，数据: {json.dumps(valuation_data, ensure_ascii=False) if valuation_data else 'None'}")
+    def rating_percentile(self, frame):
+        """评级使用的百分位（0-1）：由注册表的 rating 指定，默认为市盈率TTM 10年历史百分位"""
+        return self.metric_registry.rating_percentile(frame)
+    
+    def save_history(self, valuation_data, date):
+        """将本次获取的估值写入历史存储并记为最近一次成功获取的数据，写入失败不影响播报"""
+        try:
+            self.last_good.save(self.bot_name, date, valuation_data)
+            self.history.append(self.history_market, valuation_rows(valuation_data, self.metrics_list, date))
+            if self.percentile_engine is not None:
+                self.percentile_engine.update(valuation_data, date)
+                self.history.append(self.history_market, self.percentile_engine.history_rows(valuation_data, date))
+        except Exception as e:
+            logger.warning(f"写入历史存储失败: {e}")
+    
+    def last_known_good(self, date):
+        """理杏仁接口熔断时返回最近一次成功获取的 (数据, 数据日期)，未熔断或没有记录时返回 (None, date)"""
+        if not self.session.circuit_open(self.lixinger_config['api_url']):
+            return None, date
+        last_good = self.last_good.load(self.bot_name)
+        if last_good is None:
+            logger.warning("理杏仁接口熔断中，且没有可用的历史数据")
+            return None, date
+        logger.warning(f"理杏仁接口熔断中，使用 {last_good[0]} 的数据并标记为非最新")
+        return last_good[1], last_good[0]
+    
+    def select_changes(self, valuation_data, date):
+        """按变化检测筛选要播报的代码，增量模式下全部无变化时返回 None
         
+        本次播报的状态暂存，发送成功后由 confirm_changes 写入。
+        """
+        if not self.change_detector.enabled:
+            return valuation_data
+        frame = self.metric_registry.load(valuation_data)
+        valuation_data, self._pending_changes = self.change_detector.select(
+            self.bot_name, valuation_data, frame['stockCode'], self.rating_percentile(frame), date
+        )
+        return valuation_data
+    
+    def confirm_changes(self):
+        """消息发送成功后记录本次播报的评级和百分位"""
+        self.change_detector.commit(self.bot_name, self._pending_changes)
+        self._pending_changes = []
+    
+    def format_message(self, valuation_data, date, output_format=MARKDOWN, stale=False):
+        """格式化消息，output_format 为 markdown（钉钉）或 text（纯文本），stale 标记数据非最新"""
         if not valuation_data or 'data' not in valuation_data:
             logger.warning("估值数据为空或缺少data字段")
-            return "📊 港股指数估值数据获取失败"
-        
-        message_lines = [
-            "🇭🇰 **港股指数估值播报**",
-            f"📅 **日期**: {date}",
-            ""
-        ]
-        
-        logger.info(f"可用的指数名称映射: {json.dumps(self.index_names, ensure_ascii=False)}")
+            return self.report_template.unavailable
         
         try:
-            processed_count = 0
-            for item in valuation_data['data']:
-                stock_code = item.get('stockCode', '')
-                logger.info(f"处理指数: {stock_code}")
-                
-                # 使用配置文件中的指数名称映射
-                index_name = self.index_names.get(stock_code, f"指数{stock_code}")
-                logger.info(f"指数名称: {index_name}")
-                
-                # 获取估值百分位
-                pe_percentile = None
-                logger.info(f"原始数据结构: {json.dumps(item, ensure_ascii=False)}")
-                
-                # 直接从扁平化的键名获取百分位数据
-                pe_percentile = item.get('pe_ttm.y10.mcw.cvpos')
-                
-                if pe_percentile is not None:
-                    logger.info(f"提取到百分位: {pe_percentile}")
-                    # 转换为百分比
-                    pe_percentile_percent = pe_percentile * 100
-                    # 根据百分位给出评级
-                    if pe_percentile_percent <= 20:
-                        level = "🟢 低估"
-                    elif pe_percentile_percent <= 40:
-                        level = "🟡 偏低"
-                    elif pe_percentile_percent <= 60:
-                        level = "🟠 适中"
-                    elif pe_percentile_percent <= 80:
-                        level = "🔴 偏高"
-                    else:
-                        level = "🔴 高估"
-                    
-                    line = f"📈 **{index_name}** | 估值: **{pe_percentile_percent:.1f}%** | {level}"
-                    message_lines.append(line)
-                    logger.info(f"添加消息行: {line}")
-                    processed_count += 1
-                else:
-                    line = f"📈 **{index_name}** | 状态: ❌ 数据获取失败"
-                    message_lines.append(line)
-                    logger.warning(f"指数 {stock_code} 未能获取到百分位数据")
-            
-            logger.info(f"成功处理 {processed_count} 个指数的数据")
-            
-            message_lines.extend([
-                "",
-                "---",
-                "",
-                "💡 **估值说明**",
-                "",
-                "百分位越低表示估值越便宜：",
-                "",
-                "🟢 **0-20%**: 低估区域",
-                "🟡 **20-40%**: 偏低区域", 
-                "🟠 **40-60%**: 适中区域",
-                "🔴 **60-80%**: 偏高区域",
-                "🔴 **80-100%**: 高估区域"
-            ])
+            import numpy as np
             
+            # 整个结果集载入列式表，评级和格式化均为批量向量运算
+            frame = self.metric_registry.load(valuation_data)
+            pe_percentile = self.rating_percentile(frame)
+            has_data = ~np.isnan(pe_percentile)
+            columns = {
+                'name': display_names(frame['stockCode'], self.index_names, "指数"),
+                'percentile': format_percent(pe_percentile),
+                # 配置中追加展示的指标（PB、股息率等）
+                'extra': self.metric_registry.render(frame),
+                'level': assign_bands(pe_percentile),
+            }
+            message = self.report_template.render(date, columns, has_data, output_format, stale)
         except Exception as e:
             logger.error(f"数据解析错误: {e}", exc_info=True)
-            message_lines.append("❌ 数据解析失败")
+            return self.report_template.render_error(date, output_format)
         
-        final_message = "\n\n".join(message_lines)
-        logger.info(f"最终消息内容: {final_message}")
-        return final_message
+        missing_codes = frame['stockCode'][~has_data].tolist()
+        if missing_codes:
+            logger.warning(f"指数 {', '.join(missing_codes)} 未能获取到百分位数据")
+        logger.info(f"成功处理 {int(has_data.sum())} 个指数的数据，消息 {len(message)} 字符")
+        return message
     
-    def send_to_dingtalk(self, message):
-        """发送消息到钉钉机器人"""
-        payload = {
-            "msgtype": "markdown",
-            "markdown": {
-                "title": "港股指数估值播报",
-                "text": message
-            }
-        }
+    def send_to_dingtalk(self, message, title=None):
+        """发送消息到钉钉机器人，超长消息自动分段并限流发送"""
+        return self.dingtalk.send(message, title or self.report_title)
+    
+    def build_message(self, date=None):
+        """获取估值数据并格式化消息，获取失败返回 None，增量模式下无变化返回空字符串"""
+        date = self.resolve_date(date)
         
-        try:
-            logger.info("正在发送消息到钉钉...")
-            response = requests.post(
-                self.dingtalk_config['webhook_url'],
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('errcode') == 0:
-                    logger.info("消息发送成功")
-                    return True
-                else:
-                    logger.error(f"钉钉API返回错误: {result}")
-                    return False
-            else:
-                logger.error(f"钉钉请求失败，状态码: {response.status_code}")
-                return False
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"钉钉请求异常: {e}")
-            return False
+        logger.info(f"开始执行港股指数估值播报任务，日期: {date}")
+        
+        # 获取估值数据
+        with self.metrics.stage('fetch') as stage:
+            valuation_data = self.get_index_valuation(date)
+            stage['success'] = bool(valuation_data)
+            if valuation_data:
+                stage['items'] = len(valuation_data.get('data') or [])
+                stage['payload_bytes'] = len(json.dumps(valuation_data, ensure_ascii=False).encode('utf-8'))
+        
+        # 接口熔断时回退到最近一次成功获取的数据
+        stale = False
+        if not valuation_data:
+            valuation_data, date = self.last_known_good(date)
+            stale = valuation_data is not None
+        
+        if not valuation_data:
+            logger.error("获取估值数据失败")
+            return None
+        
+        if not stale:
+            self.save_history(valuation_data, date)
+        
+        # 增量模式下只保留评级变化的代码
+        valuation_data = self.select_changes(valuation_data, date)
+        if valuation_data is None:
+            logger.info("估值评级无变化，跳过格式化和发送")
+            return ""
+        
+        # 格式化消息
+        with self.metrics.stage('format') as stage:
+            message = self.format_message(valuation_data, date, stale=stale)
+            stage['items'] = len(valuation_data.get('data') or [])
+            stage['payload_bytes'] = len(message.encode('utf-8'))
+        return message
     
     def run(self, date=None):
         """运行港股估值播报任务"""
         success = False
-        try:
-            # 如果没有指定日期，使用7天前的日期（避免使用未来日期）
-            if date is None:
-                seven_days_ago = datetime.now() - timedelta(days=7)
-                date = seven_days_ago.strftime('%Y-%m-%d')
-            
-            logger.info(f"开始执行港股指数估值播报任务，日期: {date}")
-            
-            # 获取估值数据
-            valuation_data = self.get_index_valuation(date)
-            
-            if valuation_data:
-                # 格式化消息
-                message = self.format_message(valuation_data, date)
+        with self.metrics.stage('total') as total:
+            try:
+                message = self.build_message(date)
                 
-                # 发送到钉钉
-                if self.send_to_dingtalk(message):
-                    logger.info("任务执行成功")
+                if message == "":
                     success = True
-                else:
-                    logger.error("钉钉消息发送失败")
-            else:
-                logger.error("获取估值数据失败")
-                
-        except Exception as e:
-            logger.error(f"任务执行失败: {e}", exc_info=True)
+                elif message:
+                    # 发送到钉钉
+                    with self.metrics.stage('send') as stage:
+                        sent = self.send_to_dingtalk(message)
+                        stage['success'] = sent
+                        stage['payload_bytes'] = len(message.encode('utf-8'))
+                    
+                    if sent:
+                        self.confirm_changes()
+                        logger.info("任务执行成功")
+                        success = True
+                    else:
+                        logger.error("钉钉消息发送失败")
+            
+            except Exception as e:
+                logger.error(f"任务执行失败: {e}", exc_info=True)
+            
+            total['success'] = success
         
+        logger.info(f"缓存统计: {self.cache.stats()}")
+        logger.info(f"HTTP统计: {self.session.stats()}")
         return success
+    
+    def close(self):
+        """关闭机器人自身的状态库连接，会话和缓存可能与其他机器人共享，由创建方关闭"""
+        self.change_detector.close()
+        self.history.close()
+        self.last_good.close()
+        if self.percentile_engine is not None:
+            self.percentile_engine.close()
 
 def main():
     """主函数"""
@@ -0,0 +1,222 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError, NewConnectionError
+
+from cassette import current as current_cassette
+from circuit_breaker import CircuitBreaker
+from single_flight import default_group, request_key
+
+logger = logging.getLogger(__name__)
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# 非幂等请求只在被限流时按状态码重试：502/504 等可能发生在请求已被处理之后
+NON_IDEMPOTENT_RETRYABLE_STATUS = {429}
+# 默认视为幂等、读超时后可安全重试的方法
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+# 只有这些参数时才合并相同的进行中请求，其余参数（stream、auth、cookies、files 等）不进入合并键；
+# allow_redirects 由 get() 等方法默认传入，关闭重定向的请求不合并
+COALESCE_KWARGS = {'json', 'data', 'params', 'headers', 'timeout', 'allow_redirects'}
+
+def is_connect_error(error):
+    """连接尚未建立的错误（连接失败、DNS 解析失败、连接超时），此时请求一定没有发出"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+class HttpClient(requests.Session):
+    """所有机器人共享的HTTP客户端
+    
+    在 requests.Session 的基础上提供：
+    - 连接池与 keep-alive
+    - 连接超时与读取超时分别配置
+    - 对连接错误和 429/5xx 按指数退避（带随机抖动）重试，并遵循 Retry-After
+    - 按主机统计请求耗时
+    
+    POST 请求默认非幂等：只在连接未建立（连接失败、连接超时）或返回 429 时重试，
+    读超时、连接中断和 5xx 都可能发生在请求已被处理之后，重试会重复发送钉钉消息。
+    传入 idempotent=True 的请求按上述全部情况重试。
+    coalesce 为 True 时，进程内相同的幂等请求同时进行时只发送一次，所有调用方共享同一个响应。
+    传入 breaker 时按端点熔断：熔断中的请求直接抛出 CircuitOpenError（RequestException 的子类）。
+    """
+    
+    def __init__(self, connect_timeout=5, read_timeout=30, max_retries=3, backoff_factor=0.5,
+                 backoff_max=30, pool_connections=10, pool_maxsize=10, latency_window=1000, coalesce=True,
+                 breaker=None):
+        super().__init__()
+        self.coalesce = coalesce
+        self.breaker = breaker
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.latency_window = latency_window
+        
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        
+        self._stats_lock = threading.Lock()
+        self._host_stats = {}
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置中的 http 段创建客户端，熔断器取自 circuit_breaker 段"""
+        return cls(breaker=CircuitBreaker.from_config(config), **config.get('http', {}))
+    
+    def request(self, method, url, idempotent=None, max_retries=None, **kwargs):
+        """发送请求，失败时按退避策略重试"""
+        kwargs.setdefault('timeout', self.timeout)
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        if max_retries is None:
+            max_retries = self.max_retries
+        host = urlparse(url).netloc
+        body = kwargs.get('json', kwargs.get('data'))
+        
+        cassette = current_cassette()
+        if cassette is not None and not cassette.recording:
+            return cassette.build_response(cassette.lookup_http(method, url, body), url)
+        probe = self.breaker is not None and self.breaker.before_request(url)
+        try:
+            coalesce = set(kwargs) <= COALESCE_KWARGS and kwargs.get('allow_redirects', True)
+            if not (self.coalesce and idempotent and coalesce):
+                return self._guarded_send(method, url, idempotent, max_retries, host, body, cassette, **kwargs)
+            # 共享的响应内容已读取完毕，各调用方可以分别调用 json()/text；
+            # 合并键包含会话与本次请求合并后的请求头，不同客户端的认证头不会混用
+            headers = dict(self.headers, **(kwargs.get('headers') or {}))
+            response, _ = default_group.do(
+                request_key(method, url, body, kwargs.get('params'), headers),
+                lambda: self._guarded_send(method, url, idempotent, max_retries, host, body, cassette, **kwargs)
+            )
+            return response
+        finally:
+            # 探测请求因非网络异常未记录结果时，允许下一个请求重新探测
+            if probe:
+                self.breaker.release(url)
+    
+    def _guarded_send(self, method, url, idempotent, max_retries, host, body, cassette, **kwargs):
+        """发送请求，并将最终结果（重试之后）计入熔断器"""
+        if self.breaker is None:
+            return self._send(method, url, idempotent, max_retries, host, body, cassette, **kwargs)
+        try:
+            response = self._send(method, url, idempotent, max_retries, host, body, cassette, **kwargs)
+        except requests.exceptions.RequestException:
+            self.breaker.record_failure(url)
+            raise
+        if response.status_code in RETRYABLE_STATUS:
+            self.breaker.record_failure(url)
+        else:
+            self.breaker.record_success(url)
+        return response
+    
+    def circuit_open(self, url):
+        """url 所在端点是否处于熔断"""
+        return self.breaker is not None and self.breaker.is_open(url)
+    
+    def _send(self, method, url, idempotent, max_retries, host, body, cassette, **kwargs):
+        """发送请求并按退避策略重试"""
+        attempt = 0
+        while True:
+            started_at = time.monotonic()
+            try:
+                response = super().request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._record(host, time.monotonic() - started_at, error=True)
+                # 请求发出后的超时或中断可能已被处理，非幂等请求不重试
+                retryable = idempotent or is_connect_error(e)
+                if not retryable or attempt >= max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                reason = str(e)
+            else:
+                self._record(host, time.monotonic() - started_at,
+                             error=response.status_code >= 500)
+                retryable_status = RETRYABLE_STATUS if idempotent else NON_IDEMPOTENT_RETRYABLE_STATUS
+                if response.status_code not in retryable_status or attempt >= max_retries:
+                    if cassette is not None:
+                        cassette.record_http(method, url, body, response.status_code,
+                                             response.headers, response.text)
+                    return response
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                reason = f"状态码 {response.status_code}"
+                response.close()
+            
+            attempt += 1
+            self._record_retry(host)
+            logger.warning(f"请求 {host} 失败（{reason}），{delay:.2f} 秒后第 {attempt} 次重试")
+            time.sleep(delay)
+    
+    def _backoff(self, attempt):
+        """指数退避，使用 full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * (2 ** attempt)))
+    
+    def _retry_after(self, response):
+        """解析 Retry-After 响应头，返回等待秒数"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(seconds, 0.0), self.backoff_max)
+    
+    def _host(self, host):
+        stats = self._host_stats.get(host)
+        if stats is None:
+            stats = {'requests': 0, 'errors': 0, 'retries': 0,
+                     'latencies': deque(maxlen=self.latency_window)}
+            self._host_stats[host] = stats
+        return stats
+    
+    def _record(self, host, elapsed, error=False):
+        with self._stats_lock:
+            stats = self._host(host)
+            stats['requests'] += 1
+            stats['latencies'].append(elapsed)
+            if error:
+                stats['errors'] += 1
+    
+    def _record_retry(self, host):
+        with self._stats_lock:
+            self._host(host)['retries'] += 1
+    
+    def stats(self):
+        """返回按主机统计的请求数、错误数、重试数和耗时（毫秒）"""
+        result = {}
+        with self._stats_lock:
+            for host, stats in self._host_stats.items():
+                latencies = sorted(stats['latencies'])
+                entry = {
+                    'requests': stats['requests'],
+                    'errors': stats['errors'],
+                    'retries': stats['retries'],
+                }
+                if latencies:
+                    entry.update({
+                        'avg_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+                        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+                        'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+                        'max_ms': round(latencies[-1] * 1000, 1),
+                    })
+                result[host] = entry
+        return result
\ No newline at end of file
@@ -1,245 +1,299 @@
-import akshare as ak
-import pandas as pd
 from datetime import datetime
 import json
-import requests
 import logging
+import sys
+from cassette import current as current_cassette, memo
+from deadline_runner import DeadlineExceeded, DeadlineRunner
+from dingtalk_sender import DingTalkSender
+from history_store import HistoryStore, indicator_rows
+from http_client import HttpClient
+from indicator_store import IndicatorStore
+from metrics import MetricsRecorder
+from report_renderer import MARKDOWN, IndicatorReport
+from single_flight import CoalescingModule
+from concurrent.futures import ThreadPoolExecutor
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# A股市盈率指标字段映射关系
+PE_FIELD_MAPPING = {
+    'date': '日期',
+    'middlePETTM': '全A股滚动市盈率(TTM)中位数',
+    'averagePETTM': '全A股滚动市盈率(TTM)等权平均',
+    'quantileInRecent10YearsMiddlePeTtm': '当前"TTM(滚动市盈率)中位数"在最近10年数据上的分位数',
+    'quantileInRecent10YearsAveragePeTtm': '当前"TTM(滚动市盈率)等权平均"在在最近10年数据上的分位数'
+}
+
+# 数据源返回空表时的说明，播报中显示，摘要中省略该指标
+EMPTY_DATA = "数据为空"
+
+# 指标数据源注册表，新增指标只需在此追加一项：
+#   name: 指标名称（消息中的标题，也是本地存储中的序列名）
+#   func: akshare 函数名
+#   date_column: 日期列名，用于本地增量存储
+#   desc: 日志中使用的描述，默认同 name
+#   field_mapping: 可选，只保留并重命名指定字段
+#   icon: 消息中标题前的图标，默认 📊
+#   quantile_percent: 可选，为 True 时分位数字段（0-1）显示为百分比
+INDICATOR_SOURCES = [
+    {
+        'name': '股债利差',
+        'func': 'stock_ebs_lg',
+        'date_column': '日期',
+        'icon': '📈',
+    },
+    {
+        'name': '巴菲特指标',
+        'func': 'stock_buffett_index_lg',
+        'date_column': '日期',
+        'icon': '💰',
+    },
+    {
+        'name': 'A股市盈率指标',
+        'func': 'stock_a_ttm_lyr',
+        'date_column': 'date',
+        'desc': 'A股等权重与中位数市盈率',
+        'field_mapping': PE_FIELD_MAPPING,
+        'icon': '📈',
+        'quantile_percent': True,
+    },
+]
+
+def load_akshare(runner=None):
+    """延迟导入 akshare
+    
+    akshare 导入需要数秒并会加载大量依赖，只在真正抓取数据时才导入，
+    使只格式化或发送消息的代码路径和测试能够快速启动。
+    启用录制/回放时返回经由录制文件的包装，回放时不导入 akshare。
+    传入启用的 runner 时返回工作进程代理，每次调用在可终止的进程中以硬性时限执行。
+    返回的模块会合并进程内同时进行的相同调用（如机器人和摘要函数同时抓取股债利差）。
+    """
+    cassette = current_cassette()
+    if cassette is not None:
+        return CoalescingModule(cassette.akshare(), prefix='akshare')
+    if runner is not None and runner.enabled:
+        return CoalescingModule(runner.module('akshare'), prefix='akshare')
+    import akshare
+    return CoalescingModule(akshare, prefix='akshare')
+
+def select_fields(source, row):
+    """按数据源的字段映射筛选并重命名一行数据，返回字典或错误说明"""
+    field_mapping = source.get('field_mapping')
+    if not field_mapping:
+        return row
+    
+    # 检查哪些字段存在
+    available_columns = [col for col in field_mapping.keys() if col in row]
+    if not available_columns:
+        logger.warning(f"{source.get('desc', source['name'])}未找到指定的字段")
+        return "指定字段不存在"
+    
+    # 重命名字段
+    return {field_mapping[col]: row[col] for col in available_columns}
+
+def extract_latest(source, df):
+    """从完整历史数据中提取最新一行，返回字典或错误说明"""
+    if df.empty:
+        logger.warning(f"{source.get('desc', source['name'])}数据为空")
+        return EMPTY_DATA
+    return select_fields(source, df.iloc[-1].to_dict())
+
+def fetch_indicator(source, store=None, full_refresh=False, runner=None):
+    """获取单个指标数据源的最新数据
+    
+    传入 store 时，本地数据仍在有效期内则直接读取；否则重新抓取并增量合并到本地。
+    传入 runner 时抓取在工作进程中执行，超过时限的数据源记为缺失，不阻塞播报。
+    """
+    desc = source.get('desc', source['name'])
+    
+    if store is not None and not full_refresh and store.is_fresh(source['name']):
+        latest = store.latest(source['name'])
+        if latest is not None:
+            logger.info(f"{desc}使用本地存储数据")
+            return select_fields(source, latest)
+    
+    logger.info(f"正在获取{desc}数据...")
+    try:
+        ak = load_akshare(runner)
+        df = getattr(ak, source['func'])()
+        latest = None
+        # 抓取结果为空时如实报告，不回退到本地存储中的旧数据
+        if store is not None and not df.empty:
+            store.merge(source['name'], df, source.get('date_column', 'date'), full_refresh)
+            latest = store.latest(source['name'])
+        if latest is not None:
+            result = select_fields(source, latest)
+        else:
+            result = extract_latest(source, df)
+        if isinstance(result, dict):
+            logger.info(f"{source['name']}数据获取成功")
+        return result
+    except DeadlineExceeded as e:
+        logger.error(f"获取{desc}数据超时，本次记为缺失: {e}")
+        return f"数据缺失: 超过 {runner.deadline_seconds} 秒未返回"
+    except Exception as e:
+        logger.error(f"获取{desc}数据失败: {e}")
+        return f"获取失败: {e}"
+
+def fetch_indicators(sources, max_workers=None, store=None, full_refresh=False, runner=None):
+    """并发获取多个指标数据源，结果按注册顺序返回
+    
+    每个数据源占用一个工作线程，总耗时约等于最慢的数据源；传入 runner 时不超过其时限。
+    """
+    if not sources:
+        return {}
+    
+    with ThreadPoolExecutor(max_workers=max_workers or len(sources),
+                            thread_name_prefix='indicator') as executor:
+        futures = [
+            (source['name'], executor.submit(fetch_indicator, source, store, full_refresh, runner))
+            for source in sources
+        ]
+        return {name: future.result() for name, future in futures}
+
 class IndicatorBot:
-    def __init__(self, config_file='config.json'):
-        """初始化配置"""
-        with open(config_file, 'r', encoding='utf-8') as f:
-            self.config = json.load(f)
+    # 钉钉消息标题
+    report_title = "股票指标数据播报"
+    # 指标记录中使用的名称，以及历史存储的分区
+    bot_name = "indicator"
+    history_market = "indicator"
+    # 消息模板，导入时预编译
+    report_template = IndicatorReport(
+        heading="📊 **股票指标数据播报**",
+        sections=INDICATOR_SOURCES,
+        notes=[
+            "📊 股债利差：股票收益率与债券收益率的差值",
+            "💰 巴菲特指标：股市总市值与GDP的比值",
+            "📈 市盈率分位数：当前估值在历史数据中的相对位置"
+        ]
+    )
+    
+    def __init__(self, config_file='config.json', config=None, session=None, store=None):
+        """初始化配置
+        
+        config/session/store 可由统一调度器传入，以共享配置、连接池和本地存储
+        """
+        if config is None:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        self.config = config
         
         self.dingtalk_config = self.config['cn_config']['dingtalk']
+        # HTTP会话，复用连接
+        self.session = session or HttpClient.from_config(config)
+        # 钉钉消息发送（分段、限流）
+        self.dingtalk = DingTalkSender.from_config(
+            config, self.dingtalk_config['webhook_url'], self.session, separator="\n\n"
+        )
+        # 指标历史序列本地存储
+        self.store = store or IndicatorStore.from_config(config)
+        # akshare 抓取在可终止的工作进程中执行，超过时限的数据源记为缺失
+        self.runner = DeadlineRunner.from_config(config)
+        # 各指标的最新值写入本地列式历史存储
+        self.history = HistoryStore.from_config(config)
+        # 各阶段耗时与结果指标
+        self.metrics = MetricsRecorder.from_config(config, self.bot_name, self.session)
     
-    def get_stock_indicators(self):
-        """获取股票相关指标数据"""
-        logger.info(f"开始获取股票指标数据 - {datetime.now()}")
+    def get_stock_indicators(self, full_refresh=False):
+        """获取股票相关指标数据（各数据源并发获取）
         
-        indicators_data = {}
+        full_refresh 为 True 时忽略本地存储，重新抓取并覆盖全量历史
+        """
+        logger.info(f"开始获取股票指标数据 - {datetime.now()}")
         
-        # 1. 股债利差 - 只取最新日期的数据
-        logger.info("正在获取股债利差数据...")
-        try:
-            stock_ebs_lg_df = ak.stock_ebs_lg()
-            if not stock_ebs_lg_df.empty:
-                # 取最新日期的数据
-                latest_ebs = stock_ebs_lg_df.iloc[-1]
-                indicators_data['股债利差'] = latest_ebs.to_dict()
-                logger.info("股债利差数据获取成功")
-            else:
-                logger.warning("股债利差数据为空")
-                indicators_data['股债利差'] = "数据为空"
-        except Exception as e:
-            logger.error(f"获取股债利差数据失败: {e}")
-            indicators_data['股债利差'] = f"获取失败: {e}"
+        indicators_data = fetch_indicators(
+            INDICATOR_SOURCES, store=self.store, full_refresh=full_refresh, runner=self.runner
+        )
         
-        # 2. 巴菲特指标 - 只取最新日期的数据
-        logger.info("正在获取巴菲特指标数据...")
+        logger.info(f"数据获取完成 - {datetime.now()}，工作进程统计: {self.runner.stats()}")
+        return indicators_data
+    
+    def save_history(self, indicators_data):
+        """将各指标的最新值写入历史存储，写入失败不影响播报"""
         try:
-            stock_buffett_index_lg_df = ak.stock_buffett_index_lg()
-            if not stock_buffett_index_lg_df.empty:
-                # 取最新日期的数据
-                latest_buffett = stock_buffett_index_lg_df.iloc[-1]
-                indicators_data['巴菲特指标'] = latest_buffett.to_dict()
-                logger.info("巴菲特指标数据获取成功")
-            else:
-                logger.warning("巴菲特指标数据为空")
-                indicators_data['巴菲特指标'] = "数据为空"
+            self.history.append(self.history_market, indicator_rows(indicators_data, INDICATOR_SOURCES))
         except Exception as e:
-            logger.error(f"获取巴菲特指标数据失败: {e}")
-            indicators_data['巴菲特指标'] = f"获取失败: {e}"
+            logger.warning(f"写入历史存储失败: {e}")
+    
+    def format_message(self, indicators_data, output_format=MARKDOWN):
+        """格式化消息，output_format 为 markdown（钉钉）或 text（纯文本）"""
+        # 回放时使用录制当天的日期，保证消息可复现
+        current_date = memo('today', lambda: datetime.now().strftime('%Y-%m-%d'))
         
-        # 3. A股等权重与中位数市盈率 - 新增字段并重命名
-        logger.info("正在获取A股等权重与中位数市盈率数据...")
         try:
-            stock_a_ttm_lyr_df = ak.stock_a_ttm_lyr()
-            if not stock_a_ttm_lyr_df.empty:
-                # 定义字段映射关系
-                field_mapping = {
-                    'date': '日期',
-                    'middlePETTM': '全A股滚动市盈率(TTM)中位数',
-                    'averagePETTM': '全A股滚动市盈率(TTM)等权平均',
-                    'quantileInRecent10YearsMiddlePeTtm': '当前"TTM(滚动市盈率)中位数"在最近10年数据上的分位数',
-                    'quantileInRecent10YearsAveragePeTtm': '当前"TTM(滚动市盈率)等权平均"在在最近10年数据上的分位数'
-                }
-                
-                # 检查哪些字段存在
-                available_columns = [col for col in field_mapping.keys() if col in stock_a_ttm_lyr_df.columns]
-                
-                if available_columns:
-                    latest_pe_data = stock_a_ttm_lyr_df[available_columns].iloc[-1]
-                    # 重命名字段
-                    renamed_data = {}
-                    for col in available_columns:
-                        renamed_data[field_mapping[col]] = latest_pe_data[col]
-                    indicators_data['A股市盈率指标'] = renamed_data
-                    logger.info("A股市盈率指标数据获取成功")
-                else:
-                    logger.warning("未找到指定的字段")
-                    indicators_data['A股市盈率指标'] = "指定字段不存在"
-            else:
-                logger.warning("A股等权重与中位数市盈率数据为空")
-                indicators_data['A股市盈率指标'] = "数据为空"
+            message = self.report_template.render(current_date, indicators_data, output_format)
         except Exception as e:
-            logger.error(f"获取A股等权重与中位数市盈率数据失败: {e}")
-            indicators_data['A股市盈率指标'] = f"获取失败: {e}"
-        
-        logger.info(f"数据获取完成 - {datetime.now()}")
-        return indicators_data
+            logger.error(f"消息格式化错误: {e}", exc_info=True)
+            return self.report_template.render_error(current_date, output_format)
+        logger.info(f"消息格式化完成，{len(message)} 字符")
+        return message
+    
+    def send_to_dingtalk(self, message, title=None):
+        """发送消息到钉钉机器人，超长消息自动分段并限流发送"""
+        return self.dingtalk.send(message, title or self.report_title)
     
-    def format_message(self, indicators_data):
-        """格式化钉钉消息"""
-        logger.info("开始格式化消息")
+    def build_message(self, full_refresh=False):
+        """获取指标数据并格式化消息，获取失败返回 None"""
+        logger.info("开始执行股票指标播报任务")
         
-        current_date = datetime.now().strftime('%Y-%m-%d')
+        # 获取指标数据
+        with self.metrics.stage('fetch') as stage:
+            indicators_data = self.get_stock_indicators(full_refresh)
+            stage['items'] = sum(1 for value in indicators_data.values() if isinstance(value, dict))
+            stage['success'] = bool(indicators_data) and stage['items'] > 0
         
-        message_lines = [
-            "📊 **股票指标数据播报**",
-            f"📅 **日期**: {current_date}",
-            ""
-        ]
+        if not indicators_data:
+            logger.error("获取指标数据失败")
+            return None
         
-        try:
-            # 股债利差
-            if '股债利差' in indicators_data:
-                message_lines.append("📈 **股债利差**")
-                ebs_data = indicators_data['股债利差']
-                if isinstance(ebs_data, dict):
-                    for key, value in ebs_data.items():
-                        if key == 'date':
-                            message_lines.append(f"📅 日期: {value}")
-                        else:
-                            message_lines.append(f"📊 {key}: {value}")
-                else:
-                    message_lines.append(f"❌ {ebs_data}")
-                message_lines.append("")
-            
-            # 巴菲特指标
-            if '巴菲特指标' in indicators_data:
-                message_lines.append("💰 **巴菲特指标**")
-                buffett_data = indicators_data['巴菲特指标']
-                if isinstance(buffett_data, dict):
-                    for key, value in buffett_data.items():
-                        if key == 'date':
-                            message_lines.append(f"📅 日期: {value}")
-                        else:
-                            message_lines.append(f"📊 {key}: {value}")
-                else:
-                    message_lines.append(f"❌ {buffett_data}")
-                message_lines.append("")
-            
-            # A股市盈率指标
-            if 'A股市盈率指标' in indicators_data:
-                message_lines.append("📈 **A股市盈率指标**")
-                pe_data = indicators_data['A股市盈率指标']
-                if isinstance(pe_data, dict):
-                    for key, value in pe_data.items():
-                        if '日期' in key:
-                            message_lines.append(f"📅 {key}: {value}")
-                        elif '分位数' in key:
-                            # 分位数转换为百分比显示
-                            if isinstance(value, (int, float)):
-                                percentage = value * 100
-                                message_lines.append(f"📊 {key}: {percentage:.1f}%")
-                            else:
-                                message_lines.append(f"📊 {key}: {value}")
-                        else:
-                            message_lines.append(f"📊 {key}: {value}")
-                else:
-                    message_lines.append(f"❌ {pe_data}")
-                message_lines.append("")
-            
-            message_lines.extend([
-                "---",
-                "",
-                "💡 **数据说明**",
-                "",
-                "📊 股债利差：股票收益率与债券收益率的差值",
-                "💰 巴菲特指标：股市总市值与GDP的比值",
-                "📈 市盈率分位数：当前估值在历史数据中的相对位置"
-            ])
-            
-        except Exception as e:
-            logger.error(f"消息格式化错误: {e}", exc_info=True)
-            message_lines.append("❌ 数据格式化失败")
+        self.save_history(indicators_data)
         
-        # 钉钉需要使用双换行来确保分行
-        final_message = "\n\n".join(message_lines)
-        logger.info("消息格式化完成")
-        return final_message
+        # 格式化消息
+        with self.metrics.stage('format') as stage:
+            message = self.format_message(indicators_data)
+            stage['items'] = len(indicators_data)
+            stage['payload_bytes'] = len(message.encode('utf-8'))
+        return message
     
-    def send_to_dingtalk(self, message):
-        """发送消息到钉钉机器人"""
-        payload = {
-            "msgtype": "markdown",
-            "markdown": {
-                "title": "股票指标数据播报",
-                "text": message
-            }
-        }
-        
-        try:
-            logger.info("正在发送消息到钉钉...")
-            response = requests.post(
-                self.dingtalk_config['webhook_url'],
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('errcode') == 0:
-                    logger.info("消息发送成功")
-                    return True
-                else:
-                    logger.error(f"钉钉API返回错误: {result}")
-                    return False
-            else:
-                logger.error(f"钉钉请求失败，状态码: {response.status_code}")
-                return False
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"钉钉请求异常: {e}")
-            return False
-    
-    def run(self):
+    def run(self, full_refresh=False):
         """运行指标播报任务"""
         success = False
-        try:
-            logger.info("开始执行股票指标播报任务")
+        with self.metrics.stage('total') as total:
+            try:
+                message = self.build_message(full_refresh)
+                
+                if message:
+                    # 发送到钉钉
+                    with self.metrics.stage('send') as stage:
+                        sent = self.send_to_dingtalk(message)
+                        stage['success'] = sent
+                        stage['payload_bytes'] = len(message.encode('utf-8'))
+                    
+                    if sent:
+                        logger.info("任务执行成功")
+                        success = True
+                    else:
+                        logger.error("钉钉消息发送失败")
             
-            # 获取指标数据
-            indicators_data = self.get_stock_indicators()
+            except Exception as e:
+                logger.error(f"任务执行失败: {e}", exc_info=True)
             
-            if indicators_data:
-                # 格式化消息
-                message = self.format_message(indicators_data)
-                
-                # 发送到钉钉
-                if self.send_to_dingtalk(message):
-                    logger.info("任务执行成功")
-                    success = True
-                else:
-                    logger.error("钉钉消息发送失败")
-            else:
-                logger.error("获取指标数据失败")
-                
-        except Exception as e:
-            logger.error(f"任务执行失败: {e}", exc_info=True)
+            total['success'] = success
         
+        logger.info(f"HTTP统计: {self.session.stats()}")
         return success
+    
+    def close(self):
+        """关闭机器人自身的历史存储，会话和指标存储可能与其他机器人共享，由创建方关闭"""
+        self.history.close()
 
 # 保留原有的独立函数，用于向后兼容
 def get_stock_indicators():
     """获取股票相关指标数据（原有函数，保持兼容性）"""
     print(f"开始获取股票指标数据 - {datetime.now()}")
+    ak = load_akshare()
     
     # 1. 股债利差 - 只取最新日期的数据
     print("正在获取股债利差数据...")
@@ -276,14 +330,7 @@ def get_stock_indicators():
     try:
         stock_a_ttm_lyr_df = ak.stock_a_ttm_lyr()
         if not stock_a_ttm_lyr_df.empty:
-            # 定义字段映射关系
-            field_mapping = {
-                'date': '日期',
-                'middlePETTM': '全A股滚动市盈率(TTM)中位数',
-                'averagePETTM': '全A股滚动市盈率(TTM)等权平均',
-                'quantileInRecent10YearsMiddlePeTtm': '当前"TTM(滚动市盈率)中位数"在最近10年数据上的分位数',
-                'quantileInRecent10YearsAveragePeTtm': '当前"TTM(滚动市盈率)等权平均"在在最近10年数据上的分位数'
-            }
+            field_mapping = PE_FIELD_MAPPING
             
             # 检查哪些字段存在
             available_columns = [col for col in field_mapping.keys() if col in stock_a_ttm_lyr_df.columns]
@@ -314,61 +361,18 @@ def get_stock_indicators():
     
     print(f"数据获取完成 - {datetime.now()}")
 
-def get_latest_indicators_summary():
-    """获取所有指标的最新数据摘要（原有函数，保持兼容性）"""
-    summary = {}
-    
-    try:
-        # 股债利差最新数据
-        ebs_df = ak.stock_ebs_lg()
-        if not ebs_df.empty:
-            summary['股债利差'] = ebs_df.iloc[-1].to_dict()
-    except Exception as e:
-        summary['股债利差'] = f"获取失败: {e}"
-    
-    try:
-        # 巴菲特指标最新数据
-        buffett_df = ak.stock_buffett_index_lg()
-        if not buffett_df.empty:
-            summary['巴菲特指标'] = buffett_df.iloc[-1].to_dict()
-    except Exception as e:
-        summary['巴菲特指标'] = f"获取失败: {e}"
-    
-    try:
-        # A股市盈率指定字段最新数据
-        pe_df = ak.stock_a_ttm_lyr()
-        if not pe_df.empty:
-            # 定义字段映射关系
-            field_mapping = {
-                'date': '日期',
-                'middlePETTM': '全A股滚动市盈率(TTM)中位数',
-                'averagePETTM': '全A股滚动市盈率(TTM)等权平均',
-                'quantileInRecent10YearsMiddlePeTtm': '当前"TTM(滚动市盈率)中位数"在最近10年数据上的分位数',
-                'quantileInRecent10YearsAveragePeTtm': '当前"TTM(滚动市盈率)等权平均"在在最近10年数据上的分位数'
-            }
-            
-            available_columns = [col for col in field_mapping.keys() if col in pe_df.columns]
-            if available_columns:
-                latest_pe_data = pe_df[available_columns].iloc[-1]
-                # 重命名字段
-                renamed_data = {}
-                for col in available_columns:
-                    renamed_data[field_mapping[col]] = latest_pe_data[col]
-                summary['A股市盈率指标'] = renamed_data
-            else:
-                summary['A股市盈率指标'] = "指定字段不存在"
-    except Exception as e:
-        summary['A股市盈率指标'] = f"获取失败: {e}"
-    
-    return summary
+def get_latest_indicators_summary(store=None, runner=None):
+    """获取所有指标的最新数据摘要（原有函数，保持兼容性），数据为空的指标不出现在摘要中"""
+    summary = fetch_indicators(INDICATOR_SOURCES, store=store, runner=runner)
+    return {name: value for name, value in summary.items() if value != EMPTY_DATA}
 
 def main():
     """主函数"""
     try:
         bot = IndicatorBot()
         
-        # 运行指标播报任务
-        bot.run()
+        # 运行指标播报任务，带 --full-refresh 参数时重新抓取全量历史
+        bot.run(full_refresh='--full-refresh' in sys.argv)
         
     except FileNotFoundError:
         logger.error("配置文件 config.json 不存在")
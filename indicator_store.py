@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = 'data/indicators.db'
+
+def _normalize_date(value):
+    """将 date/datetime/Timestamp/字符串统一为 YYYY-MM-DD"""
+    return str(value)[:10]
+
+def _to_json_value(value):
+    """json 无法直接序列化的值：numpy 标量转换为原生类型，其余（日期等）转换为字符串"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+class IndicatorStore:
+    """akshare 全量历史指标序列的本地增量存储（SQLite）
+    
+    每次抓取后只合并比本地最新日期更新的行；在 max_age_hours 内再次运行时
+    直接从本地读取最新值，不再重新抓取和解析全量历史。
+    """
+    
+    def __init__(self, path=DEFAULT_STORE_PATH, max_age_hours=12, enabled=True):
+        self.path = path
+        self.max_age_hours = max_age_hours
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn = None
+        
+        if self.enabled:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS series ("
+                " source TEXT NOT NULL,"
+                " date TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " PRIMARY KEY (source, date))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS series_meta ("
+                " source TEXT PRIMARY KEY,"
+                " columns TEXT NOT NULL,"
+                " refreshed_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置中的 indicator_store 段创建存储"""
+        return cls(**config.get('indicator_store', {}))
+    
+    def is_fresh(self, source):
+        """本地数据是否在有效期内"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT refreshed_at FROM series_meta WHERE source = ?", (source,)
+            ).fetchone()
+        return row is not None and time.time() - row[0] < self.max_age_hours * 3600
+    
+    def last_date(self, source):
+        """本地最新日期，无数据返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(date) FROM series WHERE source = ?", (source,)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def merge(self, source, df, date_column, full_refresh=False):
+        """合并新抓取的全量数据，只写入比本地最新日期更新的行，返回新增行数
+        
+        抓取结果缺少日期列时抛出 ValueError，避免把本地的旧数据当作本次抓取的最新值。
+        """
+        if not self.enabled or df.empty:
+            return 0
+        if date_column not in df.columns:
+            raise ValueError(f"{source} 抓取结果缺少日期列 {date_column}")
+        
+        last_date = None if full_refresh else self.last_date(source)
+        dates = df[date_column].map(_normalize_date)
+        new_rows = df[dates > last_date] if last_date else df
+        if new_rows.empty:
+            self._touch(source, df.columns)
+            return 0
+        
+        # 数值按原值保存（json 写入浮点数的完整精度），与直接使用抓取结果时一致
+        new_rows = new_rows.assign(**{date_column: dates[new_rows.index]})
+        rows = [
+            (source, record[date_column], json.dumps(record, ensure_ascii=False, default=_to_json_value))
+            for record in new_rows.to_dict(orient='records')
+        ]
+        
+        with self._lock:
+            with self._conn:
+                if full_refresh:
+                    self._conn.execute("DELETE FROM series WHERE source = ?", (source,))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO series (source, date, data) VALUES (?, ?, ?)", rows
+                )
+                self._update_meta(source, df.columns)
+        logger.info(f"{source} 本地存储新增 {len(rows)} 行")
+        return len(rows)
+    
+    def _touch(self, source, columns):
+        with self._lock:
+            with self._conn:
+                self._update_meta(source, columns)
+    
+    def _update_meta(self, source, columns):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO series_meta (source, columns, refreshed_at) VALUES (?, ?, ?)",
+            (source, json.dumps([str(col) for col in columns], ensure_ascii=False), time.time())
+        )
+    
+    def latest(self, source):
+        """读取最新一行，返回字典，无数据返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM series WHERE source = ? ORDER BY date DESC LIMIT 1", (source,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def history(self, source, start_date=None, end_date=None):
+        """读取历史数据，返回按日期排序的 DataFrame，存储未启用时为空表"""
+        import pandas as pd
+        
+        if not self.enabled:
+            return pd.DataFrame()
+        query = "SELECT data FROM series WHERE source = ?"
+        params = [source]
+        if start_date:
+            query += " AND date >= ?"
+            params.append(start_date)
+        if end_date:
+            query += " AND date <= ?"
+            params.append(end_date)
+        query += " ORDER BY date"
+        
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return pd.DataFrame([json.loads(row[0]) for row in rows])
+    
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
\ No newline at end of file
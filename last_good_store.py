@@ -0,0 +1,70 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LAST_GOOD_PATH = 'data/last_good.db'
+
+class LastGoodStore:
+    """各机器人最近一次成功获取的完整数据（SQLite），理杏仁接口熔断时用于回退
+    
+    每个机器人只保留一条记录，不淘汰；与响应缓存分开保存，关闭缓存不影响熔断回退。
+    """
+    
+    def __init__(self, path=DEFAULT_LAST_GOOD_PATH, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn = None
+        
+        if self.enabled:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS last_good ("
+                " name TEXT PRIMARY KEY,"
+                " date TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " saved_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置中的 last_good 段创建存储"""
+        return cls(**config.get('last_good', {}))
+    
+    def save(self, name, date, data):
+        """记录 name（机器人）最近一次成功获取的数据及其日期"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO last_good (name, date, response, saved_at) VALUES (?, ?, ?, ?)",
+                (name, date, json.dumps(data, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+    
+    def load(self, name):
+        """返回 name 最近一次成功获取的 (日期, 数据)，没有记录时返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT date, response FROM last_good WHERE name = ?", (name,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+    
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
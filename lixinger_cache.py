@@ -0,0 +1,149 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = 'data/lixinger_cache.db'
+
+class LixingerCache:
+    """理杏仁API响应的本地磁盘缓存（SQLite）
+    
+    缓存键为去掉 token 后规范化的请求参数：
+    - 历史日期的数据永不过期
+    - 当天（及未来）日期的数据，以及 data 为空的响应（数据可能尚未发布）只缓存 today_ttl 秒
+    - 条目数超过 max_entries 时按最近访问时间淘汰
+    """
+    
+    def __init__(self, path=DEFAULT_CACHE_PATH, today_ttl=600, max_entries=5000, enabled=True):
+        self.path = path
+        self.today_ttl = today_ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        
+        if self.enabled:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " api_url TEXT NOT NULL,"
+                " request TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " expires_at REAL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)"
+            )
+            self._conn.commit()
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置中的 lixinger_cache 段创建缓存"""
+        return cls(**config.get('lixinger_cache', {}))
+    
+    @staticmethod
+    def normalize_payload(payload):
+        """规范化请求参数：去掉 token，代码和指标列表排序"""
+        normalized = {k: v for k, v in payload.items() if k != 'token'}
+        for field in ('stockCodes', 'metricsList'):
+            if isinstance(normalized.get(field), list):
+                normalized[field] = sorted(normalized[field])
+        return normalized
+    
+    @classmethod
+    def make_key(cls, api_url, payload):
+        """生成缓存键"""
+        normalized = json.dumps(
+            [api_url, cls.normalize_payload(payload)],
+            ensure_ascii=False, sort_keys=True, separators=(',', ':')
+        )
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    
+    def _expires_at(self, payload, data, now):
+        """计算过期时间，有数据的历史日期返回 None 表示永不过期"""
+        date = payload.get('endDate') or payload.get('date')
+        today = datetime.now().strftime('%Y-%m-%d')
+        has_data = isinstance(data, dict) and bool(data.get('data'))
+        if has_data and date and date[:10] < today:
+            return None
+        return now + self.today_ttl
+    
+    def get(self, api_url, payload):
+        """读取缓存，未命中或已过期返回 None"""
+        if not self.enabled:
+            return None
+        
+        key = self.make_key(api_url, payload)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+    
+    def set(self, api_url, payload, data):
+        """写入缓存，并按容量淘汰最久未访问的条目"""
+        if not self.enabled:
+            return
+        
+        key = self.make_key(api_url, payload)
+        now = time.time()
+        request = json.dumps(self.normalize_payload(payload), ensure_ascii=False, sort_keys=True)
+        response = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses"
+                " (key, api_url, request, response, created_at, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, api_url, request, response, now, self._expires_at(payload, data, now), now)
+            )
+            self._evict()
+            self._conn.commit()
+    
+    def _evict(self):
+        """删除过期条目，超出容量时淘汰最久未访问的条目"""
+        self._conn.execute(
+            "DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        )
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN"
+                " (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)", (overflow,)
+            )
+            logger.info(f"缓存淘汰 {overflow} 条记录")
+    
+    def stats(self):
+        """返回缓存命中统计"""
+        entries = 0
+        if self.enabled:
+            with self._lock:
+                entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+    
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
\ No newline at end of file
@@ -0,0 +1,166 @@
+import logging
+
+from percentile_engine import DEFAULT_METRICS as ENGINE_METRICS
+from valuation_frame import fallback_percentile, format_number, join_parts, load_frame
+
+logger = logging.getLogger(__name__)
+
+# 各市场的内置指标：base 为机器人消息模板必需的指标，rating 为评级使用的百分位（按顺序取第一个有效值）
+DEFAULT_MARKETS = {
+    'cn': {
+        'base': ["pe_ttm.y10.mcw.cvpos"],
+        'rating': ["pe_ttm.y10.mcw.cvpos"],
+    },
+    'hk': {
+        'base': ["pe_ttm.y10.mcw.cvpos"],
+        'rating': ["pe_ttm.y10.mcw.cvpos"],
+    },
+    'stock': {
+        'base': ["pe_ttm", "pe_ttm.y3.cvpos", "pe_ttm.y5.cvpos", "pe_ttm.y10.cvpos"],
+        'rating': ["pe_ttm.y10.cvpos", "pe_ttm.y5.cvpos", "pe_ttm.y3.cvpos"],
+    },
+}
+# 理杏仁指标名的显示名称
+METRIC_LABELS = {
+    'pe_ttm': "PE",
+    'pb': "PB",
+    'ps_ttm': "PS",
+    'pcf_ttm': "PCF",
+    'dyr': "股息率",
+    'mc': "市值",
+}
+# 数值本身为比率、按百分数显示的指标
+RATIO_METRICS = {'dyr'}
+# 指数的计算方式（市值加权、等权等），不同方式同时展示时才需要区分
+METHOD_LABELS = {
+    'mcw': "市值加权",
+    'ew': "等权",
+    'ewpvo': "正数等权",
+    'avg': "平均值",
+    'median': "中位数",
+}
+# 历史统计值，cvpos 为当前值在区间内的百分位
+STATISTIC_LABELS = {
+    'cvpos': "分位",
+    'cv': "当前值",
+    'minv': "最小值",
+    'maxv': "最大值",
+    'avgv': "平均值",
+    'q2v': "20%分位值",
+    'q5v': "50%分位值",
+    'q8v': "80%分位值",
+}
+
+def engine_metrics(config, market):
+    """本地百分位引擎启用时需要额外获取的原始序列指标（如指数的 pe_ttm.mcw），未启用时为空"""
+    options = config.get('percentile_engine', {})
+    if not options.get('enabled', False) or market not in ENGINE_METRICS:
+        return []
+    return [options.get('metrics', ENGINE_METRICS).get(market, ENGINE_METRICS[market])]
+
+def parse_metric_key(key):
+    """解析理杏仁的扁平指标名，返回 (指标, 年数, 计算方式, 统计值)，不存在的部分为 None
+    
+    如 pe_ttm.y10.mcw.cvpos -> ('pe_ttm', 10, 'mcw', 'cvpos')，pe_ttm.mcw -> ('pe_ttm', None, 'mcw', None)
+    """
+    base, *rest = key.split('.')
+    years = method = statistic = None
+    for part in rest:
+        if part in STATISTIC_LABELS:
+            statistic = part
+        elif part[:1] == 'y' and part[1:].isdigit():
+            years = int(part[1:])
+        else:
+            method = part
+    return base, years, method, statistic
+
+class MetricSpec:
+    """单个展示指标：key 为理杏仁指标名，label 为显示名称，format 为 percent 或 printf 格式"""
+    
+    def __init__(self, key, label=None, format=None, digits=None):
+        self.key = key
+        base, years, method, statistic = parse_metric_key(key)
+        if label is None:
+            label = METRIC_LABELS.get(base, base)
+            if method and method != 'mcw':
+                label += METHOD_LABELS.get(method, method)
+            if years:
+                label += f" {years}年"
+            if statistic:
+                label += STATISTIC_LABELS[statistic]
+        if format is None:
+            format = 'percent' if statistic == 'cvpos' or (base in RATIO_METRICS and not statistic) else '%.2f'
+        if digits is None:
+            digits = 1 if statistic == 'cvpos' else 2
+        self.label = label
+        self.format = format
+        self.digits = digits
+    
+    @classmethod
+    def parse(cls, entry):
+        """配置项可以是指标名字符串，或包含 key 及可选 label、format、digits 的字典"""
+        if isinstance(entry, str):
+            return cls(entry)
+        return cls(**entry)
+    
+    def render(self, values):
+        """批量格式化为 "名称: 数值"，缺失值返回空字符串"""
+        import numpy as np
+        
+        if self.format == 'percent':
+            text = format_number(np.asarray(values, dtype=float) * 100, f'%.{self.digits}f%%')
+        else:
+            text = format_number(values, self.format)
+        return np.where(text == '', '', self.label + ": " + text)
+
+class MetricRegistry:
+    """单个市场的声明式指标注册表
+    
+    指标分三类，合并为一个 metricsList 在同一次请求中获取，指标再多也只需一次往返：
+    - base：机器人消息模板必需的内置指标
+    - display：配置中追加展示的指标（PB、PS、股息率、多个周期的百分位等），由 render 统一渲染
+    - fetch：只获取并写入历史存储、不展示的指标，本地百分位引擎启用时包括其原始序列指标
+    指标名在创建时解析一次；响应按整个结果集一次载入列式表。
+    """
+    
+    def __init__(self, market, base=(), rating=(), display=(), fetch=()):
+        self.market = market
+        self.rating = list(rating)
+        self.display = [MetricSpec.parse(entry) for entry in display]
+        # 合并去重，保持声明顺序
+        self.metrics_list = list(dict.fromkeys(
+            list(base) + self.rating + [spec.key for spec in self.display] + list(fetch)
+        ))
+    
+    @classmethod
+    def from_config(cls, config, market):
+        """根据完整配置中 metric_registry 段下该市场的配置创建注册表，rating 可覆盖内置的评级百分位"""
+        defaults = DEFAULT_MARKETS.get(market, {})
+        options = config.get('metric_registry', {}).get(market, {})
+        registry = cls(
+            market,
+            base=defaults.get('base', []),
+            rating=options.get('rating', defaults.get('rating', [])),
+            display=options.get('display', []),
+            fetch=options.get('fetch', []) + engine_metrics(config, market)
+        )
+        if registry.display or options.get('fetch'):
+            logger.debug(f"{market} 指标注册表: {len(registry.metrics_list)} 个指标，"
+                         f"展示 {', '.join(spec.key for spec in registry.display)}")
+        return registry
+    
+    def load(self, valuation_data):
+        """将理杏仁响应载入列式表，注册表中的全部指标均为数值列"""
+        return load_frame(valuation_data, self.metrics_list)
+    
+    def rating_percentile(self, frame):
+        """评级使用的百分位（0-1）"""
+        return fallback_percentile(frame, self.rating)
+    
+    def render(self, frame, separator=" | "):
+        """渲染配置中追加展示的指标，返回每行一个字符串（无展示指标或全部缺失时为空字符串）"""
+        import numpy as np
+        
+        if not self.display:
+            return np.full(len(frame), '', dtype=object)
+        return join_parts([spec.render(frame[spec.key].to_numpy(dtype=float)) for spec in self.display], separator)
\ No newline at end of file
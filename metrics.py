@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 多个机器人在同一进程中共用指标文件时的写入锁
+_write_lock = threading.Lock()
+
+class MetricsRecorder:
+    """记录每个机器人各阶段（获取、格式化、发送）的耗时与结果
+    
+    format 为 jsonl 时每个阶段结束后向 path 追加一行 JSON；
+    为 prometheus 时在 textfile_dir 下覆盖写入 <bot>.prom，供 node_exporter 的
+    textfile collector 采集。
+    """
+    
+    def __init__(self, bot, format='jsonl', path='data/metrics/bot_metrics.jsonl',
+                 textfile_dir='data/metrics', enabled=True, session=None):
+        self.bot = bot
+        self.format = format
+        self.path = path
+        self.textfile_dir = textfile_dir
+        self.enabled = enabled
+        self.session = session
+        self._latest = {}
+    
+    @classmethod
+    def from_config(cls, config, bot, session=None):
+        """根据完整配置中的 metrics 段创建记录器"""
+        return cls(bot, session=session, **config.get('metrics', {}))
+    
+    def _total_retries(self):
+        if self.session is None or not hasattr(self.session, 'stats'):
+            return 0
+        return sum(stats['retries'] for stats in self.session.stats().values())
+    
+    @contextmanager
+    def stage(self, name):
+        """记录一个阶段，调用方可在返回的字典中填写 items、payload_bytes、success"""
+        record = {'items': None, 'payload_bytes': None, 'success': True}
+        retries_before = self._total_retries()
+        started_at = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record['success'] = False
+            record['error'] = str(e)
+            raise
+        finally:
+            record['duration_ms'] = round((time.perf_counter() - started_at) * 1000, 2)
+            # 共享会话时并发任务的重试也会计入，结果为近似值
+            record['retries'] = self._total_retries() - retries_before
+            self.record(name, record)
+    
+    def record(self, stage, record):
+        """写入一条阶段指标"""
+        if not self.enabled:
+            return
+        
+        entry = {
+            'ts': round(time.time(), 3),
+            'bot': self.bot,
+            'stage': stage,
+            'duration_ms': record.get('duration_ms'),
+            'success': bool(record.get('success')),
+            'items': record.get('items'),
+            'payload_bytes': record.get('payload_bytes'),
+            'retries': record.get('retries', 0),
+        }
+        if record.get('error'):
+            entry['error'] = record['error']
+        
+        try:
+            if self.format == 'prometheus':
+                self._latest[stage] = entry
+                self._write_textfile()
+            else:
+                self._append_jsonl(entry)
+        except OSError as e:
+            logger.error(f"写入指标失败: {e}")
+    
+    def _append_jsonl(self, entry):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with _write_lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+    
+    def _write_textfile(self):
+        """以 Prometheus 文本格式写入当前各阶段的最新指标"""
+        metrics = [
+            ('bot_stage_duration_seconds', '阶段耗时', lambda e: round(e['duration_ms'] / 1000, 6)),
+            ('bot_stage_success', '阶段是否成功', lambda e: 1 if e['success'] else 0),
+            ('bot_stage_items', '处理条目数', lambda e: e['items']),
+            ('bot_stage_payload_bytes', '数据大小', lambda e: e['payload_bytes']),
+            ('bot_stage_retries', 'HTTP重试次数', lambda e: e['retries']),
+            ('bot_stage_last_run_timestamp_seconds', '最近运行时间', lambda e: e['ts']),
+        ]
+        lines = []
+        for metric, help_text, getter in metrics:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for stage, entry in self._latest.items():
+                value = getter(entry)
+                if value is not None:
+                    lines.append(f'{metric}{{bot="{self.bot}",stage="{stage}"}} {value}')
+        
+        os.makedirs(self.textfile_dir, exist_ok=True)
+        path = os.path.join(self.textfile_dir, f"{self.bot}.prom")
+        # 先写临时文件再替换，避免采集到写了一半的文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
\ No newline at end of file
@@ -0,0 +1,468 @@
+import argparse
+import bisect
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 各市场用于计算百分位的 PE 序列：指数为市值加权，个股为自身 PE-TTM
+DEFAULT_METRICS = {
+    'cn': 'pe_ttm.mcw',
+    'hk': 'pe_ttm.mcw',
+    'stock': 'pe_ttm',
+}
+DEFAULT_HORIZONS = [3, 5, 10]
+DEFAULT_STATE_PATH = 'data/percentile_state.db'
+
+class _SortedValues:
+    """有序多重集合：优先使用 sortedcontainers（插入删除 O(log n)），
+    未安装时退化为 bisect 维护的列表（查找 O(log n)，插入删除需移动元素）
+    
+    values 为已排序的初始数据（持久化状态恢复时使用），有序输入的建立为 O(n)。
+    """
+    
+    def __init__(self, values=()):
+        try:
+            from sortedcontainers import SortedList
+        except ImportError:
+            self._values = None
+            self._list = list(values)
+        else:
+            self._values = SortedList(values)
+    
+    def add(self, value):
+        if self._values is not None:
+            self._values.add(value)
+        else:
+            bisect.insort(self._list, value)
+    
+    def remove(self, value):
+        if self._values is not None:
+            self._values.remove(value)
+        else:
+            del self._list[bisect.bisect_left(self._list, value)]
+    
+    def count_below(self, value):
+        """严格小于 value 的个数"""
+        if self._values is not None:
+            return self._values.bisect_left(value)
+        return bisect.bisect_left(self._list, value)
+    
+    def values(self):
+        """按从小到大的顺序返回全部数据"""
+        return list(self._values) if self._values is not None else list(self._list)
+    
+    def __len__(self):
+        return len(self._values) if self._values is not None else len(self._list)
+
+def _to_value(value):
+    """转换为有限浮点数，非数值（字符串、缺失、NaN）返回 None"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value) if math.isfinite(value) else None
+
+def _parse_date(date):
+    return datetime.strptime(str(date)[:10], '%Y-%m-%d') if not isinstance(date, datetime) else date
+
+def window_start(date, years):
+    """返回截至 date 的 years 年窗口的起始日期（不含）"""
+    if float(years).is_integer():
+        try:
+            return date.replace(year=date.year - int(years))
+        except ValueError:
+            # 2月29日
+            return date.replace(year=date.year - int(years), day=28)
+    return date - timedelta(days=round(years * 365.25))
+
+def horizon_label(years):
+    """窗口年数对应的理杏仁粒度名，如 10 -> y10，2.5 -> y2.5"""
+    return f"y{int(years)}" if float(years).is_integer() else f"y{years}"
+
+def cvpos_metric(metric, years):
+    """百分位指标名，与理杏仁一致：pe_ttm -> pe_ttm.y10.cvpos，pe_ttm.mcw -> pe_ttm.y10.mcw.cvpos"""
+    base, _, method = metric.partition('.')
+    if method:
+        return f"{base}.{horizon_label(years)}.{method}.cvpos"
+    return f"{base}.{horizon_label(years)}.cvpos"
+
+class RollingPercentile:
+    """单个代码在单个时间窗口上的滚动百分位
+    
+    按日期顺序追加数据，窗口外的旧数据随之移出。百分位与理杏仁 cvpos 的定义一致：
+    窗口内严格低于当前值的数据个数 / (窗口内数据个数 - 1)，窗口内只有一个数据时为 0。
+    每次追加为 O(log n)（移出的旧数据均摊到每次追加）。
+    """
+    
+    def __init__(self, years):
+        self.years = years
+        self._window = deque()
+        self._values = _SortedValues()
+        self._last_date = None
+    
+    @classmethod
+    def restore(cls, years, last_date, entries):
+        """从持久化的日数据恢复：entries 为按日期排列的 (日期, 数值)，只保留截至 last_date 的窗口内部分，
+        排序一次后直接建立有序集合，不逐个插入"""
+        rolling = cls(years)
+        rolling._last_date = last_date
+        start = window_start(last_date, years)
+        rolling._window = deque(entry for entry in entries if entry[0] > start)
+        rolling._values = _SortedValues(sorted(value for _, value in rolling._window))
+        return rolling
+    
+    @property
+    def last_date(self):
+        """最近一次追加的日期"""
+        return self._last_date
+    
+    def entries(self):
+        """窗口内按日期排列的 (日期, 数值)"""
+        return list(self._window)
+    
+    def sorted_values(self):
+        """窗口内数值的有序列表"""
+        return self._values.values()
+    
+    def advance(self, date):
+        """推进到 date 但不追加数据（当天数值缺失），用于恢复时重放末尾的空值日"""
+        self.append(date, None)
+    
+    def append(self, date, value):
+        """追加一天的数据并返回当天的百分位，date 为 datetime，value 为空时跳过"""
+        if self._last_date is not None and date <= self._last_date:
+            raise ValueError(f"日期必须递增: {date:%Y-%m-%d} <= {self._last_date:%Y-%m-%d}")
+        self._last_date = date
+        
+        start = window_start(date, self.years)
+        while self._window and self._window[0][0] <= start:
+            _, expired = self._window.popleft()
+            self._values.remove(expired)
+        
+        if value is None:
+            return None
+        self._window.append((date, value))
+        self._values.add(value)
+        return self.percentile(value)
+    
+    def percentile(self, value):
+        """value 在当前窗口中的百分位（0-1）"""
+        count = len(self._values)
+        if count == 0:
+            return None
+        if count == 1:
+            return 0.0
+        return self._values.count_below(value) / (count - 1)
+    
+    def __len__(self):
+        return len(self._window)
+
+class PercentileEngine:
+    """基于本地 PE 日序列的增量百分位引擎
+    
+    每个代码、每个窗口维护一个 RollingPercentile，支持任意年数的窗口（如 7 年、15 年），
+    输出的指标名与理杏仁一致，可直接替代 API 返回的 cvpos 指标。
+    
+    用法：
+        engine = PercentileEngine.from_backfill('data/backfill.db', 'stock', horizons=[3, 5, 7, 10])
+        engine.append('300172', '2024-01-03', 25.6)
+        engine.latest('300172')  # {'pe_ttm.y3.cvpos': ..., ...}
+    
+    指定 path 时每个代码每天的数值作为一行写入 SQLite，每日 update 只插入当天新增的行，
+    并删除已移出最长窗口的旧行。代码在首次用到时读取其窗口内的行，排序一次重建有序集合，
+    启动时不再重放回填数据库。首次打开或指标、窗口配置变化时由 open 从回填数据库重放一次。
+    """
+    
+    def __init__(self, metric='pe_ttm', horizons=None, market=None, path=None):
+        self.metric = metric
+        self.horizons = list(horizons or DEFAULT_HORIZONS)
+        self.market = market
+        self.path = path
+        self._windows = {}
+        self._latest = {}
+        # 已追加、尚未写入状态库的 (代码, 日期, 数值)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._conn = None
+        
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS engines ("
+                " market TEXT PRIMARY KEY,"
+                " metric TEXT NOT NULL,"
+                " horizons TEXT NOT NULL)"
+            )
+            # 数值为空的行只记录日期，恢复时窗口同样推进到该日
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS observations ("
+                " market TEXT NOT NULL,"
+                " code TEXT NOT NULL,"
+                " date TEXT NOT NULL,"
+                " value REAL,"
+                " PRIMARY KEY (market, code, date))"
+            )
+            self._conn.commit()
+    
+    def _signature(self):
+        return json.dumps(self.horizons)
+    
+    def is_current(self):
+        """状态库中该市场的数据是否按当前的指标和窗口计算"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT metric, horizons FROM engines WHERE market = ?", (self.market,)
+            ).fetchone()
+        return row is not None and row == (self.metric, self._signature())
+    
+    def _restore(self, code):
+        """从状态库读取代码的日数据并重建各窗口，已加载或没有记录时不做任何事"""
+        if self._conn is None or code in self._windows:
+            return
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date, value FROM observations WHERE market = ? AND code = ? ORDER BY date",
+                (self.market, code)
+            ).fetchall()
+        if not rows:
+            return
+        rows = [(_parse_date(day), value) for day, value in rows]
+        entries = [(day, value) for day, value in rows if value is not None]
+        if not entries:
+            self._windows[code] = [RollingPercentile.restore(years, rows[-1][0], []) for years in self.horizons]
+            return
+        # 先恢复到最后一个有数值的日期并计算当天的结果，再推进末尾数值为空的日期
+        last_day, last_value = entries[-1]
+        windows = [RollingPercentile.restore(years, last_day, entries) for years in self.horizons]
+        self._latest[code] = dict(
+            {cvpos_metric(self.metric, window.years): window.percentile(last_value) for window in windows},
+            date=last_day.strftime('%Y-%m-%d'), **{self.metric: last_value}
+        )
+        for day, _ in rows:
+            if day > last_day:
+                for window in windows:
+                    window.advance(day)
+        self._windows[code] = windows
+    
+    def save(self):
+        """将追加后尚未保存的日数据写入状态库，并删除已移出最长窗口的旧数据"""
+        pending, self._pending = self._pending, []
+        if self._conn is None:
+            return
+        rows = [(self.market, code, day.strftime('%Y-%m-%d'), value) for code, day, value in pending]
+        longest = max(self.horizons)
+        expired = [
+            (self.market, code, window_start(self._windows[code][0].last_date, longest).strftime('%Y-%m-%d'))
+            for code in dict.fromkeys(code for code, _, _ in pending)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?)", rows)
+            self._conn.executemany(
+                "DELETE FROM observations WHERE market = ? AND code = ? AND date <= ?", expired
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO engines VALUES (?, ?, ?)", (self.market, self.metric, self._signature())
+            )
+            self._conn.commit()
+    
+    def reset(self):
+        """清空状态库中该市场的数据和已加载的窗口"""
+        self._windows.clear()
+        self._latest.clear()
+        self._pending = []
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM observations WHERE market = ?", (self.market,))
+            self._conn.execute("DELETE FROM engines WHERE market = ?", (self.market,))
+            self._conn.commit()
+    
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    
+    def append(self, code, date, value):
+        """追加一个代码一天的数据，返回 {百分位指标名: 值}"""
+        date = _parse_date(date)
+        self._restore(code)
+        windows = self._windows.get(code)
+        if windows is None:
+            windows = [RollingPercentile(years) for years in self.horizons]
+            self._windows[code] = windows
+        
+        result = {
+            cvpos_metric(self.metric, window.years): window.append(date, value)
+            for window in windows
+        }
+        if self._conn is not None:
+            self._pending.append((code, date, value))
+        if value is not None:
+            self._latest[code] = dict(result, date=date.strftime('%Y-%m-%d'), **{self.metric: value})
+        return result
+    
+    def update(self, valuation_data, date):
+        """追加理杏仁响应中各代码当天的数据并写入状态库（每个代码一行），返回追加的代码数
+        
+        日期优先使用响应中的数据日期；已有该日期或更晚数据的代码跳过，同一天重复运行不会重复追加。
+        """
+        updated = []
+        for item in (valuation_data or {}).get('data') or []:
+            code = item.get('stockCode')
+            if not code:
+                continue
+            day = _parse_date(item.get('date') or date)
+            self._restore(code)
+            windows = self._windows.get(code)
+            if windows and windows[0].last_date is not None and day <= windows[0].last_date:
+                continue
+            self.append(code, day, _to_value(item.get(self.metric)))
+            updated.append(code)
+        self.save()
+        return len(updated)
+    
+    def latest(self, code):
+        """代码最近一个有数据日期的百分位结果，没有数据时返回 None"""
+        self._restore(code)
+        return self._latest.get(code)
+    
+    def history_rows(self, valuation_data, date):
+        """响应中各代码当天的本地百分位，返回可写入历史存储的 (日期, 代码, 指标, 数值) 行
+        
+        响应中已有的同名指标以理杏仁的数值为准，只补充理杏仁未返回的窗口（如 7 年、15 年）。
+        """
+        rows = []
+        for item in (valuation_data or {}).get('data') or []:
+            latest = self.latest(item.get('stockCode'))
+            if latest is None or latest['date'] != str(item.get('date') or date)[:10]:
+                continue
+            for years in self.horizons:
+                metric = cvpos_metric(self.metric, years)
+                if latest[metric] is not None and _to_value(item.get(metric)) is None:
+                    rows.append((latest['date'], item['stockCode'], metric, latest[metric]))
+        return rows
+    
+    def codes(self):
+        """已加载的代码列表"""
+        return list(self._windows)
+    
+    @classmethod
+    def from_config(cls, market, config_file='config.json', horizons=None, on_row=None):
+        """根据配置文件，从回填数据库加载指定市场的 PE 序列"""
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        options = config.get('percentile_engine', {})
+        db_path = config.get('backfill', {}).get('db_path', 'data/backfill.db')
+        metric = options.get('metrics', DEFAULT_METRICS).get(market, DEFAULT_METRICS[market])
+        horizons = horizons or options.get('horizons', DEFAULT_HORIZONS)
+        return cls.from_backfill(db_path, market, metric, horizons, on_row)
+    
+    @classmethod
+    def open(cls, config, market):
+        """根据完整配置中的 percentile_engine 段打开指定市场的持久化引擎，未启用时返回 None
+        
+        状态库中没有该市场的数据，或指标、窗口配置已变化时，从回填数据库重放一次并保存。
+        """
+        options = config.get('percentile_engine', {})
+        if not options.get('enabled', False):
+            return None
+        metric = options.get('metrics', DEFAULT_METRICS).get(market, DEFAULT_METRICS[market])
+        engine = cls(metric, options.get('horizons', DEFAULT_HORIZONS), market,
+                     options.get('path', DEFAULT_STATE_PATH))
+        if not engine.is_current():
+            engine.reset()
+            db_path = config.get('backfill', {}).get('db_path', 'data/backfill.db')
+            if os.path.exists(db_path):
+                try:
+                    engine.replay(db_path)
+                except sqlite3.Error as e:
+                    logger.warning(f"读取回填数据库失败，百分位引擎从空状态开始: {e}")
+            engine.save()
+        return engine
+    
+    @classmethod
+    def from_backfill(cls, db_path, market, metric=None, horizons=None, on_row=None):
+        """从回填数据库（backfill.py 写入的 valuations 表）按日期顺序重放 PE 序列
+        
+        on_row(code, date, metrics, result) 在每行计算后调用，可用于导出或校验。
+        """
+        engine = cls(metric or DEFAULT_METRICS[market], horizons)
+        engine.replay(db_path, market, on_row)
+        return engine
+    
+    def replay(self, db_path, market=None, on_row=None):
+        """按日期顺序追加回填数据库中指定市场（默认为引擎的市场）的全部数据"""
+        market = market or self.market
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = conn.execute(
+                "SELECT stock_code, date, metrics FROM valuations WHERE market = ?"
+                " ORDER BY stock_code, date", (market,)
+            )
+            count = 0
+            for code, date, metrics_json in rows:
+                metrics = json.loads(metrics_json)
+                result = self.append(code, date, metrics.get(self.metric))
+                if on_row is not None:
+                    on_row(code, date, metrics, result)
+                count += 1
+        finally:
+            conn.close()
+        logger.info(f"从 {db_path} 加载 {market} 的 {self.metric} 序列：{len(self.codes())} 个代码，{count} 行")
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='根据本地回填数据计算 PE 历史百分位')
+    parser.add_argument('--market', choices=sorted(DEFAULT_METRICS), default='stock', help='市场')
+    parser.add_argument('--horizons', help='逗号分隔的窗口年数，如 3,5,7,10,15')
+    parser.add_argument('--code', action='append', help='只输出指定代码，可重复')
+    parser.add_argument('--verify', action='store_true', help='与回填数据中理杏仁返回的百分位对比')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    args = parser.parse_args()
+    
+    horizons = [float(h) if '.' in h else int(h) for h in args.horizons.split(',')] if args.horizons else None
+    diffs = {}
+    
+    def verify(code, date, metrics, result):
+        for name, value in result.items():
+            expected = metrics.get(name)
+            if value is not None and expected is not None:
+                diffs.setdefault(name, []).append(abs(value - expected))
+    
+    try:
+        engine = PercentileEngine.from_config(args.market, args.config, horizons,
+                                              on_row=verify if args.verify else None)
+    except FileNotFoundError:
+        logger.error(f"配置文件 {args.config} 不存在")
+        return
+    except sqlite3.Error as e:
+        logger.error(f"读取回填数据库失败，请先运行 backfill.py: {e}")
+        return
+    
+    for code in args.code or engine.codes():
+        latest = engine.latest(code)
+        if latest is None:
+            logger.warning(f"{code} 没有本地数据")
+            continue
+        print(json.dumps({'stockCode': code, **latest}, ensure_ascii=False))
+    
+    if args.verify:
+        if not diffs:
+            logger.warning("回填数据中没有可对比的理杏仁百分位")
+        for name, values in sorted(diffs.items()):
+            logger.info(f"{name}: 对比 {len(values)} 行，最大偏差 {max(values):.6f}，"
+                        f"平均偏差 {sum(values) / len(values):.6f}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
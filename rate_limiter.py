@@ -0,0 +1,53 @@
+import threading
+import time
+
+class RateLimiter:
+    """线程安全的令牌桶限流器
+    
+    rate 为每秒补充的令牌数，capacity 为桶容量（允许的突发请求数）。
+    """
+    
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def per_minute(cls, count, capacity=1):
+        """按每分钟请求数创建限流器"""
+        return cls(count / 60.0, capacity)
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+    
+    def try_acquire(self):
+        """尝试获取一个令牌，不等待"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+    
+    def wait_time(self):
+        """返回获取下一个令牌还需等待的秒数"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                return 0.0
+            return (1 - self._tokens) / self.rate
+    
+    def pause(self, seconds):
+        """清空令牌，seconds 秒内不再发放（如被服务端限流时），等待仍通过 acquire/wait_time"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 1 - seconds * self.rate)
+    
+    def acquire(self):
+        """阻塞直到获取一个令牌"""
+        while not self.try_acquire():
+            time.sleep(self.wait_time())
\ No newline at end of file
@@ -0,0 +1,202 @@
+import logging
+import string
+
+logger = logging.getLogger(__name__)
+
+# 输出格式：钉钉 markdown 与纯文本
+MARKDOWN = 'markdown'
+TEXT = 'text'
+
+# 估值报告的说明与评级图例，所有估值报告共用
+VALUATION_NOTES = ["", "---", "", "💡 **估值说明**", "", "百分位越低表示估值越便宜：", ""]
+VALUATION_LEGEND = [
+    "🟢 **0-20%**: 低估区域",
+    "🟡 **20-40%**: 偏低区域",
+    "🟠 **40-60%**: 适中区域",
+    "🔴 **60-80%**: 偏高区域",
+    "🔴 **80-100%**: 高估区域",
+]
+# 没有数据的行：首段（名称）之后的说明
+FAILURE_CELL = "状态: ❌ 数据获取失败"
+# 接口熔断时使用最近一次成功获取的数据，标题下方的提示
+STALE_NOTICE = "⚠️ **理杏仁接口暂时不可用，以下为最近一次成功获取的数据（非最新）**"
+# 部分数据获取失败时，标题下方的提示
+INCOMPLETE_NOTICE = "⚠️ **部分数据获取失败，以下结果不完整**"
+CELL_SEPARATOR = " | "
+
+def strip_markup(text):
+    """去掉 markdown 加粗标记，用于纯文本输出"""
+    return text.replace('**', '')
+
+class RowTemplate:
+    """预编译的行模板
+    
+    各段模板在创建时转换为位置参数的格式串；第一段为行标题，总是保留，其余段内任一字段为空字符串时省略该段，
+    按各行的段组合分组，每种组合的整行格式串只拼接一次并缓存，渲染时每行只做一次 format。
+    """
+    
+    def __init__(self, cells, separator=CELL_SEPARATOR, suffix=""):
+        self.fields = []
+        self.cells = []
+        for cell in cells:
+            text = ''
+            indexes = []
+            for literal, field, _, _ in string.Formatter().parse(cell):
+                text += literal.replace('{', '{{').replace('}', '}}')
+                if field is not None:
+                    if field not in self.fields:
+                        self.fields.append(field)
+                    indexes.append(self.fields.index(field))
+                    text += '{%d}' % indexes[-1]
+            self.cells.append((text, indexes))
+        self.separator = separator
+        self.suffix = suffix
+        self._formats = {}
+    
+    def _format(self, code):
+        fmt = self._formats.get(code)
+        if fmt is None:
+            fmt = self.separator.join(text for i, (text, _) in enumerate(self.cells) if code >> i & 1) + self.suffix
+            self._formats[code] = fmt
+        return fmt
+    
+    def render(self, columns, rows):
+        """渲染 rows（行号数组）对应的行，返回字符串列表"""
+        import numpy as np
+        
+        values = [np.asarray(columns[field], dtype=object)[rows] for field in self.fields]
+        present = [value != '' for value in values]
+        codes = np.ones(len(rows), dtype=np.int64)
+        for i, (_, indexes) in enumerate(self.cells[1:], 1):
+            cell_present = np.logical_and.reduce([present[index] for index in indexes]) if indexes else True
+            codes |= np.where(cell_present, 1 << i, 0)
+        
+        unique_codes = np.unique(codes).tolist()
+        if len(unique_codes) == 1:
+            fmt = self._format(unique_codes[0])
+            return [fmt.format(*row) for row in zip(*(value.tolist() for value in values))]
+        
+        result = [None] * len(rows)
+        for code in unique_codes:
+            selected = np.flatnonzero(codes == code)
+            fmt = self._format(code)
+            rendered = (fmt.format(*row) for row in zip(*(value[selected].tolist() for value in values)))
+            for index, text in zip(selected.tolist(), rendered):
+                result[index] = text
+        return result
+
+class ValuationReport:
+    """估值报告模板（A股指数、港股指数、股票）
+    
+    cells 为每行各段的模板（字段用 {name} 表示），第一段（名称）总是保留，其余段内任一字段为空时省略该段，各段以 " | " 连接；
+    没有数据的行使用第一段加失败说明，stale 为 True 时日期下方加注数据非最新，incomplete 为 True 时加注结果不完整。
+    separator 和 line_end 是钉钉 markdown 的换行方式，
+    纯文本输出使用单换行、无行尾空格并去掉加粗标记。两种格式的模板在创建时各编译一次。
+    """
+    
+    def __init__(self, heading, unavailable, cells, separator="\n", line_end=""):
+        self.unavailable = unavailable
+        self._compiled = {
+            MARKDOWN: self._compile(heading, cells, separator, line_end, lambda text: text),
+            TEXT: self._compile(heading, cells, "\n", "", strip_markup),
+        }
+    
+    @staticmethod
+    def _compile(heading, cells, separator, line_end, markup):
+        cells = [markup(cell) for cell in cells]
+        return {
+            'separator': separator,
+            'heading': markup(heading),
+            'date_prefix': markup("📅 **日期**: "),
+            'stale': markup(STALE_NOTICE),
+            'incomplete': markup(INCOMPLETE_NOTICE),
+            'success': RowTemplate(cells, suffix=line_end),
+            'failure': RowTemplate([cells[0], FAILURE_CELL], suffix=line_end),
+            'tail': [markup(line) for line in VALUATION_NOTES] + [markup(line) + line_end for line in VALUATION_LEGEND],
+        }
+    
+    def _head(self, compiled, date, stale=False, incomplete=False):
+        head = [compiled['heading'], compiled['date_prefix'] + str(date)]
+        if stale:
+            head.append(compiled['stale'])
+        if incomplete:
+            head.append(compiled['incomplete'])
+        return head + [""]
+    
+    def render(self, date, columns, has_data, output_format=MARKDOWN, stale=False, incomplete=False):
+        """渲染报告：columns 为 字段名 -> 字符串数组，has_data 标记有数据的行，stale 标记数据非最新，
+        incomplete 标记结果不完整"""
+        import numpy as np
+        
+        compiled = self._compiled[output_format]
+        has_data = np.asarray(has_data, dtype=bool)
+        rows = [None] * len(has_data)
+        for template, selected in ((compiled['success'], np.flatnonzero(has_data)),
+                                   (compiled['failure'], np.flatnonzero(~has_data))):
+            if len(selected):
+                for index, text in zip(selected.tolist(), template.render(columns, selected)):
+                    rows[index] = text
+        return compiled['separator'].join(self._head(compiled, date, stale, incomplete) + rows + compiled['tail'])
+    
+    def render_error(self, date, output_format=MARKDOWN):
+        """数据解析失败时的报告"""
+        compiled = self._compiled[output_format]
+        return compiled['separator'].join(self._head(compiled, date) + ["❌ 数据解析失败"])
+
+class IndicatorReport:
+    """指标报告模板
+    
+    sections 为指标数据源注册表，按其中的 icon 显示标题，quantile_percent 为 True 时
+    分位数字段显示为百分比。每个指标的值为字典时逐项列出，否则显示为错误说明。
+    日期行使用 📅：有 field_mapping 的数据源字段已重命名，名称含"日期"的字段为日期行；
+    其他数据源保留原始列名，只有 date 列为日期行（显示为"日期"）。
+    """
+    
+    def __init__(self, heading, sections, notes, separator="\n\n"):
+        self.sections = {source['name']: source for source in sections}
+        self._compiled = {
+            MARKDOWN: self._compile(heading, notes, separator, lambda text: text),
+            TEXT: self._compile(heading, notes, "\n", strip_markup),
+        }
+    
+    @staticmethod
+    def _compile(heading, notes, separator, markup):
+        return {
+            'separator': separator,
+            'heading': markup(heading),
+            'date_prefix': markup("📅 **日期**: "),
+            'strong': (lambda text: f"**{text}**") if markup("**") else (lambda text: text),
+            'tail': [markup(line) for line in ["---", "", "💡 **数据说明**", ""] + list(notes)],
+        }
+    
+    @staticmethod
+    def _item_line(key, value, mapped, quantile_percent):
+        if mapped:
+            if '日期' in key:
+                return f"📅 {key}: {value}"
+        elif key == 'date':
+            return f"📅 日期: {value}"
+        if quantile_percent and '分位数' in key and isinstance(value, (int, float)):
+            return f"📊 {key}: {value * 100:.1f}%"
+        return f"📊 {key}: {value}"
+    
+    def render(self, date, indicators_data, output_format=MARKDOWN):
+        """渲染报告，indicators_data 为 指标名 -> 最新数据字典或错误说明"""
+        compiled = self._compiled[output_format]
+        lines = [compiled['heading'], compiled['date_prefix'] + str(date), ""]
+        for name, data in indicators_data.items():
+            source = self.sections.get(name, {})
+            lines.append(f"{source.get('icon', '📊')} {compiled['strong'](name)}")
+            if isinstance(data, dict):
+                mapped = bool(source.get('field_mapping'))
+                quantile_percent = source.get('quantile_percent', False)
+                lines.extend(self._item_line(key, value, mapped, quantile_percent) for key, value in data.items())
+            else:
+                lines.append(f"❌ {data}")
+            lines.append("")
+        return compiled['separator'].join(lines + compiled['tail'])
+    
+    def render_error(self, date, output_format=MARKDOWN):
+        """数据格式化失败时的报告"""
+        compiled = self._compiled[output_format]
+        return compiled['separator'].join([compiled['heading'], compiled['date_prefix'] + str(date), "", "❌ 数据格式化失败"])
\ No newline at end of file
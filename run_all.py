@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cassette
+import single_flight
+from async_engine import AsyncEngine
+from hk_index_valuation import HKIndexValuationBot
+from http_client import HttpClient
+from index_valuation import IndexValuationBot
+from indicator import IndicatorBot
+from indicator_store import IndicatorStore
+from lixinger_cache import LixingerCache
+from metrics import MetricsRecorder
+from stock_valuation import StockValuationBot
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 流水线名称 -> 机器人类，顺序即合并报告中的顺序
+PIPELINES = {
+    'cn': IndexValuationBot,
+    'hk': HKIndexValuationBot,
+    'stock': StockValuationBot,
+    'indicator': IndicatorBot,
+}
+
+class UnifiedRunner:
+    """在单进程内并发运行所有播报任务
+    
+    配置只读取一次，所有机器人共享同一个HTTP连接池和理杏仁缓存。
+    combine_report 为 True 时通过第一个流水线的钉钉机器人发送一条合并报告。
+    config/session/cache/store 可由常驻进程传入，以便重新加载配置时保留连接池和缓存。
+    """
+    
+    def __init__(self, config_file='config.json', pipelines=None, combine_report=None, use_async=None,
+                 config=None, session=None, cache=None, store=None):
+        if config is None:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        self.config = config
+        
+        runner_config = self.config.get('runner', {})
+        self.pipelines = pipelines or runner_config.get('pipelines', list(PIPELINES))
+        if combine_report is None:
+            combine_report = runner_config.get('combine_report', False)
+        self.combine_report = combine_report
+        if use_async is None:
+            use_async = runner_config.get('use_async', False)
+        self.use_async = use_async
+        
+        self.session = session or HttpClient.from_config(self.config)
+        self.cache = cache or LixingerCache.from_config(self.config)
+        self.store = store or IndicatorStore.from_config(self.config)
+        self.metrics = MetricsRecorder.from_config(self.config, 'run_all', self.session)
+        self.bots = {}
+        for name in self.pipelines:
+            bot_class = PIPELINES[name]
+            if bot_class is IndicatorBot:
+                self.bots[name] = bot_class(config=self.config, session=self.session, store=self.store)
+            else:
+                self.bots[name] = bot_class(config=self.config, session=self.session, cache=self.cache)
+    
+    def close(self, keep=()):
+        """关闭各机器人的状态库连接，以及 keep（属性名）之外的连接池、缓存和指标存储"""
+        for bot in self.bots.values():
+            bot.close()
+        for attribute in ('session', 'cache', 'store'):
+            if attribute not in keep:
+                getattr(self, attribute).close()
+    
+    def _run_bot(self, name, date):
+        """运行单个流水线，返回是否成功，异常只影响该流水线"""
+        bot = self.bots[name]
+        try:
+            if isinstance(bot, IndicatorBot):
+                return bot.run()
+            return bot.run(date)
+        except Exception as e:
+            logger.error(f"{name} 执行失败: {e}", exc_info=True)
+            return False
+    
+    def _build_message(self, name, date):
+        """生成单个流水线的消息，失败返回 None，增量模式下无变化返回空字符串"""
+        bot = self.bots[name]
+        try:
+            if isinstance(bot, IndicatorBot):
+                return bot.build_message()
+            return bot.build_message(date)
+        except Exception as e:
+            logger.error(f"{name} 消息生成失败: {e}", exc_info=True)
+            return None
+    
+    def run(self, date=None, pipelines=None):
+        """并发运行所有（或指定的）流水线，返回 {流水线: 是否成功}"""
+        pipelines = pipelines or self.pipelines
+        started_at = time.time()
+        logger.info(f"开始统一播报任务: {', '.join(pipelines)}")
+        
+        if self.use_async:
+            outcome = asyncio.run(self._run_async(date, pipelines))
+            if self.combine_report:
+                messages = outcome
+            else:
+                results = outcome
+        else:
+            with ThreadPoolExecutor(max_workers=len(pipelines), thread_name_prefix='pipeline') as executor:
+                if self.combine_report:
+                    futures = {name: executor.submit(self._build_message, name, date) for name in pipelines}
+                    messages = {name: future.result() for name, future in futures.items()}
+                else:
+                    futures = {name: executor.submit(self._run_bot, name, date) for name in pipelines}
+                    results = {name: future.result() for name, future in futures.items()}
+        
+        if self.combine_report:
+            results = self.send_combined(messages)
+        
+        logger.info(f"统一播报任务完成，耗时 {time.time() - started_at:.1f} 秒，结果: {results}")
+        logger.info(f"缓存统计: {self.cache.stats()}")
+        logger.info(f"HTTP统计: {self.session.stats()}")
+        logger.info(f"请求合并统计: {single_flight.default_group.stats()}")
+        return results
+    
+    async def _run_async(self, date, pipelines):
+        """使用异步引擎在单线程内运行指定流水线
+        
+        合并报告时返回 {流水线: 消息}，否则返回 {流水线: 是否成功}
+        """
+        bots = [self.bots[name] for name in pipelines]
+        async with AsyncEngine.from_config(self.config) as engine:
+            if self.combine_report:
+                messages = await asyncio.gather(
+                    *(engine.build_message(bot, date) for bot in bots), return_exceptions=True
+                )
+                return {
+                    name: None if isinstance(message, Exception) else message
+                    for name, message in zip(pipelines, messages)
+                }
+            results = await engine.run_bots(bots, date)
+            return dict(zip(pipelines, results))
+    
+    def send_combined(self, messages):
+        """合并各流水线消息并发送一条钉钉消息"""
+        sections = [message for message in messages.values() if message]
+        if not sections:
+            if all(message == "" for message in messages.values()):
+                logger.info("所有流水线估值评级均无变化，跳过发送")
+                return {name: True for name in messages}
+            logger.error("所有流水线均未生成消息")
+            return {name: False for name in messages}
+        
+        combined = "\n\n---\n\n".join(sections)
+        sender = self.bots[next(iter(messages))]
+        with self.metrics.stage('send') as stage:
+            sent = sender.send_to_dingtalk(combined, title="每日估值汇总播报")
+            stage['success'] = sent
+            stage['items'] = len(sections)
+            stage['payload_bytes'] = len(combined.encode('utf-8'))
+        if sent:
+            for name, message in messages.items():
+                if message and hasattr(self.bots[name], 'confirm_changes'):
+                    self.bots[name].confirm_changes()
+        return {name: message == "" or (bool(message) and sent) for name, message in messages.items()}
+
+def main():
+    """主函数，返回退出码：全部流水线成功为 0，否则为 1"""
+    parser = argparse.ArgumentParser(description='统一运行所有播报任务')
+    parser.add_argument('--date', help='估值日期，默认使用各机器人的默认日期')
+    parser.add_argument('--only', nargs='+', choices=list(PIPELINES), help='只运行指定流水线')
+    parser.add_argument('--combine', action='store_true', default=None, help='合并为一条钉钉消息')
+    parser.add_argument('--async', dest='use_async', action='store_true', default=None,
+                        help='使用异步引擎在单线程内并发执行')
+    parser.add_argument('--config', default='config.json', help='配置文件路径')
+    parser.add_argument('--delta', action='store_true', help='增量模式：只播报评级变化的代码')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', metavar='FILE', help='录制所有外部调用到文件')
+    group.add_argument('--replay', metavar='FILE', help='从录制文件回放外部调用，不访问网络')
+    args = parser.parse_args()
+    
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        if args.delta:
+            config['change_detection'] = dict(config.get('change_detection', {}), delta_mode=True)
+        if args.record or args.replay:
+            mode = 'record' if args.record else 'replay'
+            config = cassette.configure(config, mode)
+            with cassette.use(args.record or args.replay, mode):
+                runner = UnifiedRunner(args.config, pipelines=args.only, combine_report=args.combine,
+                                       use_async=args.use_async, config=config)
+                results = runner.run(args.date)
+        else:
+            runner = UnifiedRunner(args.config, pipelines=args.only, combine_report=args.combine,
+                                   use_async=args.use_async, config=config)
+            results = runner.run(args.date)
+        return 0 if all(results.values()) else 1
+    
+    except FileNotFoundError:
+        logger.error(f"配置文件 {args.config} 不存在")
+    except json.JSONDecodeError:
+        logger.error("配置文件格式错误")
+    except Exception as e:
+        logger.error(f"程序执行出错: {e}")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
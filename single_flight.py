@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+def request_key(method, url, body, params=None, headers=None):
+    """HTTP 请求的合并键：方法、完整地址、查询参数、请求体（含 token，不同账号的请求不会合并）和请求头
+    
+    查询参数为字典时按键排序，请求头名称不区分大小写，参数或请求头不同的请求不会合并。
+    """
+    if isinstance(params, dict):
+        params = sorted((str(k), v) for k, v in params.items())
+    if headers:
+        headers = sorted((str(k).lower(), str(v)) for k, v in headers.items())
+    return json.dumps([method.upper(), url, params, body, headers or None],
+                      ensure_ascii=False, sort_keys=True, default=str)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """合并进行中的相同调用
+    
+    同一个 key 的调用正在执行时，后到的调用不再重复执行，而是等待并共享第一个调用的结果（或异常）。
+    调用结束后即移除记录，之后的调用会重新执行（结果缓存由 LixingerCache 等负责）。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executed = 0
+        self._shared = 0
+    
+    def do(self, key, func):
+        """执行或等待 func()，返回 (结果, 是否为共享结果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._executed += 1
+            else:
+                call.waiters += 1
+                self._shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        if call.waiters:
+            logger.info(f"合并了 {call.waiters} 个相同的进行中请求")
+        return call.result, False
+    
+    def stats(self):
+        """返回实际执行次数和共享结果次数"""
+        with self._lock:
+            return {'executed': self._executed, 'shared': self._shared}
+
+class AsyncSingleFlight:
+    """SingleFlight 的 asyncio 版本，用于同一事件循环内的协程"""
+    
+    def __init__(self):
+        self._tasks = {}
+        self._executed = 0
+        self._shared = 0
+    
+    async def do(self, key, factory):
+        """执行或等待 factory() 返回的协程，返回其结果"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            self._executed += 1
+        else:
+            self._shared += 1
+        # shield：某个等待者被取消时不影响其他等待者
+        return await asyncio.shield(task)
+    
+    def stats(self):
+        """返回实际执行次数和共享结果次数"""
+        return {'executed': self._executed, 'shared': self._shared}
+
+# 进程内共享，不同机器人、不同 HttpClient 实例的相同请求也会合并
+default_group = SingleFlight()
+
+class CoalescingModule:
+    """模块包装：函数调用按 函数名+参数 合并，等待者得到结果的副本，避免互相修改"""
+    
+    def __init__(self, module, group=None, prefix=''):
+        self._module = module
+        self._group = group or default_group
+        self._prefix = prefix
+    
+    def __getattr__(self, name):
+        func = getattr(self._module, name)
+        if not callable(func):
+            return func
+        
+        def call(*args, **kwargs):
+            key = json.dumps([self._prefix, name, args, kwargs], ensure_ascii=False, sort_keys=True, default=repr)
+            result, shared = self._group.do(key, lambda: func(*args, **kwargs))
+            if shared and hasattr(result, 'copy'):
+                return result.copy()
+            return result
+        return call
\ No newline at end of file
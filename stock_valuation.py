@@ -1,17 +1,57 @@
 import json
 import requests
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import logging
+from change_detector import ChangeDetector
+from dingtalk_sender import DingTalkSender
+from history_store import HistoryStore, valuation_rows
+from http_client import HttpClient
+from last_good_store import LastGoodStore
+from lixinger_cache import LixingerCache
+from metric_registry import MetricRegistry
+from metrics import MetricsRecorder
+from percentile_engine import PercentileEngine
+from rate_limiter import RateLimiter
+from report_renderer import MARKDOWN, ValuationReport
+from trading_calendar import LatestDateResolver
+from valuation_frame import assign_bands, display_names, format_number, format_percent, join_parts
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 理杏仁接口限制：按日期查询时 stockCodes 最多 100 个
+MAX_CODES_PER_REQUEST = 100
+# 全市场股票列表接口
+UNIVERSE_API_URL = "https://open.lixinger.com/api/cn/company"
+
 class StockValuationBot:
-    def __init__(self, config_file='config.json'):
-        """初始化配置"""
-        with open(config_file, 'r', encoding='utf-8') as f:
-            config = json.load(f)
+    # 钉钉消息标题
+    report_title = "股票估值播报"
+    # 指标和状态记录中使用的名称，交易日历市场，以及历史存储的分区
+    bot_name = "stock"
+    market = "cn"
+    history_market = "stock"
+    # 消息模板，导入时预编译
+    report_template = ValuationReport(
+        heading="📊 **股票估值播报**",
+        unavailable="📊 股票估值数据获取失败",
+        cells=["📈 **{name}({code})**", "PE: **{pe}**", "百分位: {percentiles}", "{extra}", "{level}"],
+        separator="\n",
+        line_end="  "
+    )
+    
+    def __init__(self, config_file='config.json', config=None, session=None, cache=None):
+        """初始化配置
+        
+        config/session/cache 可由统一调度器传入，以共享配置、连接池和缓存
+        """
+        if config is None:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
         
         # 使用股票配置
         self.config = config['stock_config']
@@ -19,37 +59,98 @@ class StockValuationBot:
         self.dingtalk_config = self.config['dingtalk']
         self.stock_codes = self.config['stock_codes']
         self.stock_names = self.config.get('stock_names', {})
+        # 指标注册表：内置指标与配置中追加的指标合并为一个 metricsList
+        self.metric_registry = MetricRegistry.from_config(config, self.history_market)
+        self.metrics_list = self.metric_registry.metrics_list
+        
+        # 全市场模式：获取股票列表后分批并发请求
+        self.full_market = self.config.get('full_market', {})
+        self.full_market_enabled = self.full_market.get('enabled', False)
+        self.chunk_size = min(self.full_market.get('chunk_size', MAX_CODES_PER_REQUEST), MAX_CODES_PER_REQUEST)
+        self.max_workers = self.full_market.get('max_workers', 4)
+        # 失败批次占比超过该值时本次获取视为失败，未超过时报告标记为不完整
+        self.max_failed_ratio = self.full_market.get('max_failed_ratio', 0.2)
+        self.rate_limiter = RateLimiter.per_minute(
+            self.full_market.get('requests_per_minute', 120), capacity=self.max_workers
+        )
+        
+        # 理杏仁API响应缓存
+        self.cache = cache or LixingerCache.from_config(config)
+        # HTTP会话，复用连接
+        self.session = session or HttpClient.from_config(config)
+        # 钉钉消息发送（分段、限流）
+        self.dingtalk = DingTalkSender.from_config(
+            config, self.dingtalk_config['webhook_url'], self.session, separator="\n"
+        )
+        # 最新数据日期解析（交易日历 + 探测）
+        self.date_resolver = LatestDateResolver.from_config(config)
+        # 各阶段耗时与结果指标
+        self.metrics = MetricsRecorder.from_config(config, self.bot_name, self.session)
+        # 已播报状态与增量模式的变化检测
+        self.change_detector = ChangeDetector.from_config(config)
+        # 获取到的估值写入本地列式历史存储
+        self.history = HistoryStore.from_config(config)
+        # 最近一次成功获取的数据，接口熔断时回退
+        self.last_good = LastGoodStore.from_config(config)
+        # 本地百分位引擎（启用时），每日获取的数据追加到其持久化状态，理杏仁未返回的窗口百分位写入历史存储
+        self.percentile_engine = PercentileEngine.open(config, self.history_market)
+        self._pending_changes = []
+    
+    def build_payload(self, date, stock_codes=None):
+        """构建理杏仁请求参数，stock_codes 默认为配置中的股票"""
+        return {
+            "token": self.lixinger_config['token'],
+            "date": date,
+            "stockCodes": stock_codes if stock_codes is not None else self.stock_codes,
+            "metricsList": self.metrics_list
+        }
     
-    def get_stock_valuation(self, date=None):
-        """获取股票估值数据"""
+    def resolve_date(self, date=None):
+        """确定估值日期，未指定时使用已发布数据的最近交易日"""
+        if date is None:
+            date = self.date_resolver.resolve(
+                self.bot_name, self.market,
+                # 只用配置中的股票探测，避免全市场模式下每次探测都扫描全部股票
+                lambda d: LatestDateResolver.has_data(
+                    self.get_stock_valuation(d, full_market=False), self.metric_registry.rating
+                )
+            )
+        if date is None:
+            # 探测失败时使用7天前的日期（避免使用未来日期）
+            seven_days_ago = datetime.now() - timedelta(days=7)
+            date = seven_days_ago.strftime('%Y-%m-%d')
+        return date
+    
+    def get_stock_valuation(self, date=None, full_market=None):
+        """获取股票估值数据，full_market 默认取配置中的全市场模式开关"""
         if date is None:
             # 使用7天前的日期（避免使用未来日期）
             seven_days_ago = datetime.now() - timedelta(days=7)
             date = seven_days_ago.strftime('%Y-%m-%d')
         
+        if full_market is None:
+            full_market = self.full_market_enabled
+        if full_market:
+            return self.get_full_market_valuation(date)
+        
         # 构建请求参数
-        payload = {
-            "token": self.lixinger_config['token'],
-            "date": date,
-            "stockCodes": self.stock_codes,
-            "metricsList": [
-                "pe_ttm",
-                "pe_ttm.y3.cvpos",
-                "pe_ttm.y5.cvpos", 
-                "pe_ttm.y10.cvpos"
-            ]
-        }
+        payload = self.build_payload(date)
         
         # 添加详细日志输出
         logger.info(f"请求参数: {json.dumps(payload, ensure_ascii=False, indent=2)}")
         
+        cached_data = self.cache.get(self.lixinger_config['api_url'], payload)
+        if cached_data is not None:
+            logger.info(f"命中本地缓存，跳过API请求 - {self.cache.stats()}")
+            return cached_data
+        
         try:
             logger.info(f"正在获取 {date} 的股票估值数据...")
-            response = requests.post(
+            response = self.session.post(
                 self.lixinger_config['api_url'],
                 json=payload,
                 headers={'Content-Type': 'application/json'},
-                timeout=30
+                idempotent=True
             )
             
             logger.info(f"API响应状态码: {response.status_code}")
@@ -69,6 +170,9 @@ class StockValuationBot:
                 else:
                     logger.warning("API返回数据中没有 'data' 字段或数据为空")
                 
+                if 'data' in data:
+                    self.cache.set(self.lixinger_config['api_url'], payload, data)
+                
                 return data
             else:
                 logger.error(f"API请求失败，状态码: {response.status_code}")
@@ -79,178 +183,304 @@ class StockValuationBot:
             logger.error(f"请求异常: {e}")
             return None
     
-    def format_message(self, valuation_data, date):
-        """格式化钉钉消息"""
-        logger.info(f"开始格式化消息，数据: {json.dumps(valuation_data, ensure_ascii=False) if valuation_data else 'None'}")
+    def get_universe(self):
+        """获取全市场股票代码（默认非金融类），并补充股票名称映射"""
+        fs_table_type = self.full_market.get('fs_table_type', 'non_financial')
+        api_url = self.full_market.get('universe_api_url', UNIVERSE_API_URL)
+        payload = {
+            "token": self.lixinger_config['token'],
+            "fsTableType": fs_table_type,
+            "includeDelisted": False
+        }
         
-        if not valuation_data or 'data' not in valuation_data:
-            logger.warning("估值数据为空或缺少data字段")
-            return "📊 股票估值数据获取失败"
+        data = self.cache.get(api_url, payload)
+        if data is None:
+            logger.info("正在获取全市场股票列表...")
+            try:
+                response = self.session.post(
+                    api_url,
+                    json=payload,
+                    headers={'Content-Type': 'application/json'},
+                    idempotent=True
+                )
+            except requests.exceptions.RequestException as e:
+                logger.error(f"获取股票列表异常: {e}")
+                return []
+            if response.status_code != 200:
+                logger.error(f"获取股票列表失败，状态码: {response.status_code}")
+                return []
+            data = response.json()
+            if 'data' not in data:
+                logger.error(f"股票列表返回数据异常: {data}")
+                return []
+            self.cache.set(api_url, payload, data)
         
-        message_lines = [
-            "📊 **股票估值播报**",
-            f"📅 **日期**: {date}",
-            ""
-        ]
+        stock_codes = []
+        for item in data['data']:
+            # 接口已按类型过滤，这里再校验一次，避免混入金融类公司
+            if item.get('fsTableType', fs_table_type) != fs_table_type:
+                continue
+            stock_codes.append(item['stockCode'])
+            if item.get('name'):
+                self.stock_names.setdefault(item['stockCode'], item['name'])
+        logger.info(f"全市场股票列表共 {len(stock_codes)} 只（{fs_table_type}）")
+        return stock_codes
+    
+    def fetch_chunk(self, date, stock_codes):
+        """获取一批股票的估值数据，失败返回 None"""
+        api_url = self.lixinger_config['api_url']
+        payload = self.build_payload(date, stock_codes)
         
-        logger.info(f"可用的股票名称映射: {json.dumps(self.stock_names, ensure_ascii=False)}")
+        cached_data = self.cache.get(api_url, payload)
+        if cached_data is not None:
+            return cached_data
         
+        # 所有线程共用令牌桶，请求频率不超过配额
+        self.rate_limiter.acquire()
         try:
-            processed_count = 0
-            for item in valuation_data['data']:
-                stock_code = item.get('stockCode', '')
-                logger.info(f"处理股票: {stock_code}")
-                
-                # 使用配置文件中的股票名称映射
-                stock_name = self.stock_names.get(stock_code, f"股票{stock_code}")
-                logger.info(f"股票名称: {stock_name}")
-                
-                # 获取估值数据
-                pe_ttm = item.get('pe_ttm')
-                pe_3y_pos = item.get('pe_ttm.y3.cvpos')
-                pe_5y_pos = item.get('pe_ttm.y5.cvpos')
-                pe_10y_pos = item.get('pe_ttm.y10.cvpos')
-                
-                logger.info(f"原始数据: PE_TTM={pe_ttm}, 3年百分位={pe_3y_pos}, 5年百分位={pe_5y_pos}, 10年百分位={pe_10y_pos}")
-                
-                if pe_ttm is not None:
-                    # 构建消息行
-                    line_parts = [f"📈 **{stock_name}({stock_code})**"]
-                    line_parts.append(f"PE: **{pe_ttm:.2f}**")
-                    
-                    # 添加百分位信息
-                    percentile_info = []
-                    if pe_3y_pos is not None:
-                        percentile_info.append(f"3年: {pe_3y_pos*100:.1f}%")
-                    if pe_5y_pos is not None:
-                        percentile_info.append(f"5年: {pe_5y_pos*100:.1f}%")
-                    if pe_10y_pos is not None:
-                        percentile_info.append(f"10年: {pe_10y_pos*100:.1f}%")
-                    
-                    if percentile_info:
-                        line_parts.append(f"百分位: {' | '.join(percentile_info)}")
-                    
-                    # 根据10年百分位给出评级（优先使用10年，其次5年，最后3年）
-                    main_percentile = pe_10y_pos or pe_5y_pos or pe_3y_pos
-                    if main_percentile is not None:
-                        percentile_percent = main_percentile * 100
-                        if percentile_percent <= 20:
-                            level = "🟢 低估"
-                        elif percentile_percent <= 40:
-                            level = "🟡 偏低"
-                        elif percentile_percent <= 60:
-                            level = "🟠 适中"
-                        elif percentile_percent <= 80:
-                            level = "🔴 偏高"
-                        else:
-                            level = "🔴 高估"
-                        line_parts.append(level)
-                    
-                    line = " | ".join(line_parts) + "  "
-                    message_lines.append(line)
-                    logger.info(f"添加消息行: {line}")
-                    processed_count += 1
-                else:
-                    line = f"📈 **{stock_name}({stock_code})** | 状态: ❌ 数据获取失败  "
-                    message_lines.append(line)
-                    logger.warning(f"股票 {stock_code} 未能获取到PE数据")
+            response = self.session.post(
+                api_url,
+                json=payload,
+                headers={'Content-Type': 'application/json'},
+                idempotent=True
+            )
+        except requests.exceptions.RequestException as e:
+            logger.error(f"请求异常（{stock_codes[0]} 等 {len(stock_codes)} 只）: {e}")
+            return None
+        
+        if response.status_code != 200:
+            logger.error(f"API请求失败（{stock_codes[0]} 等 {len(stock_codes)} 只），状态码: {response.status_code}")
+            return None
+        
+        data = response.json()
+        if 'data' not in data:
+            logger.error(f"API返回数据异常（{stock_codes[0]} 等 {len(stock_codes)} 只）: {data}")
+            return None
+        self.cache.set(api_url, payload, data)
+        return data
+    
+    def get_full_market_valuation(self, date):
+        """全市场模式：分批并发获取全部股票的估值数据并合并"""
+        started_at = time.time()
+        stock_codes = self.get_universe()
+        if not stock_codes:
+            logger.error("未获取到全市场股票列表")
+            return None
+        
+        chunks = [stock_codes[i:i + self.chunk_size] for i in range(0, len(stock_codes), self.chunk_size)]
+        logger.info(f"正在获取 {date} 的全市场估值数据：{len(stock_codes)} 只股票，"
+                    f"分 {len(chunks)} 批，{self.max_workers} 个线程")
+        
+        merged = []
+        failed = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='full-market') as executor:
+            # map 按提交顺序返回结果，合并后的顺序与股票列表一致
+            for data in executor.map(lambda chunk: self.fetch_chunk(date, chunk), chunks):
+                if data is None:
+                    failed += 1
+                    continue
+                merged.extend(data['data'] or [])
+        
+        elapsed = time.time() - started_at
+        throughput = len(stock_codes) / elapsed if elapsed > 0 else float('inf')
+        logger.info(f"全市场估值获取完成：{len(merged)} 条数据，失败 {failed}/{len(chunks)} 批，"
+                    f"耗时 {elapsed:.1f} 秒，吞吐 {throughput:.1f} 只/秒")
+        
+        if failed / len(chunks) > self.max_failed_ratio:
+            logger.error(f"失败批次占比超过 {self.max_failed_ratio:.0%}，本次全市场获取视为失败")
+            return None
+        if failed:
+            # 部分批次失败：报告标记为不完整，且不记录播报状态
+            return {"data": merged, "incomplete": True}
+        return {"data": merged}
+    
+    def rating_percentile(self, frame):
+        """评级使用的百分位（0-1）：按注册表的 rating 顺序回退，默认优先10年，其次5年，最后3年"""
+        return self.metric_registry.rating_percentile(frame)
+    
+    def save_history(self, valuation_data, date):
+        """将本次获取的估值写入历史存储并记为最近一次成功获取的数据，写入失败不影响播报"""
+        try:
+            self.last_good.save(self.bot_name, date, valuation_data)
+            self.history.append(self.history_market, valuation_rows(valuation_data, self.metrics_list, date))
+            if self.percentile_engine is not None:
+                self.percentile_engine.update(valuation_data, date)
+                self.history.append(self.history_market, self.percentile_engine.history_rows(valuation_data, date))
+        except Exception as e:
+            logger.warning(f"写入历史存储失败: {e}")
+    
+    def last_known_good(self, date):
+        """理杏仁接口熔断时返回最近一次成功获取的 (数据, 数据日期)，未熔断或没有记录时返回 (None, date)"""
+        urls = [self.lixinger_config['api_url']]
+        if self.full_market_enabled:
+            urls.append(self.full_market.get('universe_api_url', UNIVERSE_API_URL))
+        if not any(self.session.circuit_open(url) for url in urls):
+            return None, date
+        last_good = self.last_good.load(self.bot_name)
+        if last_good is None:
+            logger.warning("理杏仁接口熔断中，且没有可用的历史数据")
+            return None, date
+        logger.warning(f"理杏仁接口熔断中，使用 {last_good[0]} 的数据并标记为非最新")
+        return last_good[1], last_good[0]
+    
+    def select_changes(self, valuation_data, date):
+        """按变化检测筛选要播报的代码，增量模式下全部无变化时返回 None
+        
+        本次播报的状态暂存，发送成功后由 confirm_changes 写入。
+        """
+        if not self.change_detector.enabled:
+            return valuation_data
+        frame = self.metric_registry.load(valuation_data)
+        selected, self._pending_changes = self.change_detector.select(
+            self.bot_name, valuation_data, frame['stockCode'], self.rating_percentile(frame), date
+        )
+        if valuation_data.get('incomplete'):
+            # 不完整的结果不写入播报状态，下次完整获取时再比较
+            self._pending_changes = []
+        return selected
+    
+    def confirm_changes(self):
+        """消息发送成功后记录本次播报的评级和百分位"""
+        self.change_detector.commit(self.bot_name, self._pending_changes)
+        self._pending_changes = []
+    
+    def format_message(self, valuation_data, date, output_format=MARKDOWN, stale=False):
+        """格式化消息，output_format 为 markdown（钉钉）或 text（纯文本），stale 标记数据非最新
+        
+        全市场模式部分批次失败时（响应带 incomplete 标记）报告注明结果不完整。
+        """
+        if not valuation_data or 'data' not in valuation_data:
+            logger.warning("估值数据为空或缺少data字段")
+            return self.report_template.unavailable
+        
+        try:
+            import numpy as np
             
-            logger.info(f"成功处理 {processed_count} 个股票的数据")
+            # 整个结果集载入列式表，评级和格式化均为批量向量运算
+            frame = self.metric_registry.load(valuation_data)
+            pe_ttm = frame['pe_ttm'].to_numpy(dtype=float)
+            has_data = ~np.isnan(pe_ttm)
             
-            message_lines.extend([
-                "",
-                "---",
-                "",
-                "💡 **估值说明**",
-                "",
-                "百分位越低表示估值越便宜：",
-                "",
-                "🟢 **0-20%**: 低估区域  ",
-                "🟡 **20-40%**: 偏低区域  ", 
-                "🟠 **40-60%**: 适中区域  ",
-                "🔴 **60-80%**: 偏高区域  ",
-                "🔴 **80-100%**: 高估区域  "
-            ])
+            # 百分位信息，只列出有数据的周期
+            percentile_parts = []
+            for column, label in [('pe_ttm.y3.cvpos', "3年"), ('pe_ttm.y5.cvpos', "5年"), ('pe_ttm.y10.cvpos', "10年")]:
+                values = frame[column].to_numpy(dtype=float)
+                percentile_parts.append(np.where(np.isnan(values), '', label + ": " + format_percent(values) + "%"))
             
+            columns = {
+                'name': display_names(frame['stockCode'], self.stock_names, "股票"),
+                'code': frame['stockCode'].to_numpy(dtype=object),
+                'pe': format_number(pe_ttm, '%.2f'),
+                'percentiles': join_parts(percentile_parts, " | "),
+                # 配置中追加展示的指标（PB、股息率等）
+                'extra': self.metric_registry.render(frame),
+                # 根据10年百分位给出评级（优先使用10年，其次5年，最后3年）
+                'level': assign_bands(self.rating_percentile(frame)),
+            }
+            message = self.report_template.render(
+                date, columns, has_data, output_format, stale, incomplete=bool(valuation_data.get('incomplete'))
+            )
         except Exception as e:
             logger.error(f"数据解析错误: {e}", exc_info=True)
-            message_lines.append("❌ 数据解析失败")
+            return self.report_template.render_error(date, output_format)
         
-        final_message = "\n".join(message_lines)
-        logger.info(f"最终消息内容: {final_message}")
-        return final_message
+        missing_codes = frame['stockCode'][~has_data].tolist()
+        if missing_codes:
+            logger.warning(f"股票 {', '.join(missing_codes)} 未能获取到PE数据")
+        logger.info(f"成功处理 {int(has_data.sum())} 个股票的数据，消息 {len(message)} 字符")
+        return message
     
-    def send_to_dingtalk(self, message):
-        """发送消息到钉钉机器人"""
-        payload = {
-            "msgtype": "markdown",
-            "markdown": {
-                "title": "股票估值播报",
-                "text": message
-            }
-        }
+    def send_to_dingtalk(self, message, title=None):
+        """发送消息到钉钉机器人，超长消息自动分段并限流发送"""
+        return self.dingtalk.send(message, title or self.report_title)
+    
+    def build_message(self, date=None):
+        """获取估值数据并格式化消息，获取失败返回 None，增量模式下无变化返回空字符串"""
+        date = self.resolve_date(date)
         
-        try:
-            logger.info("正在发送消息到钉钉...")
-            response = requests.post(
-                self.dingtalk_config['webhook_url'],
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('errcode') == 0:
-                    logger.info("消息发送成功")
-                    return True
-                else:
-                    logger.error(f"钉钉API返回错误: {result}")
-                    return False
-            else:
-                logger.error(f"钉钉请求失败，状态码: {response.status_code}")
-                return False
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"钉钉请求异常: {e}")
-            return False
+        logger.info(f"开始执行股票估值播报任务，日期: {date}")
+        
+        # 获取估值数据
+        with self.metrics.stage('fetch') as stage:
+            valuation_data = self.get_stock_valuation(date)
+            stage['success'] = bool(valuation_data)
+            if valuation_data:
+                stage['items'] = len(valuation_data.get('data') or [])
+                stage['payload_bytes'] = len(json.dumps(valuation_data, ensure_ascii=False).encode('utf-8'))
+        
+        # 接口熔断时回退到最近一次成功获取的数据
+        stale = False
+        if not valuation_data:
+            valuation_data, date = self.last_known_good(date)
+            stale = valuation_data is not None
+        
+        if not valuation_data:
+            logger.error("获取估值数据失败")
+            return None
+        
+        if not stale:
+            self.save_history(valuation_data, date)
+        
+        # 增量模式下只保留评级变化的代码
+        valuation_data = self.select_changes(valuation_data, date)
+        if valuation_data is None:
+            logger.info("估值评级无变化，跳过格式化和发送")
+            return ""
+        
+        # 格式化消息
+        with self.metrics.stage('format') as stage:
+            message = self.format_message(valuation_data, date, stale=stale)
+            stage['items'] = len(valuation_data.get('data') or [])
+            stage['payload_bytes'] = len(message.encode('utf-8'))
+        return message
     
     def run(self, date=None):
         """运行股票估值播报任务"""
         success = False
-        try:
-            # 如果没有指定日期，使用7天前的日期（避免使用未来日期）
-            if date is None:
-                seven_days_ago = datetime.now() - timedelta(days=7)
-                date = seven_days_ago.strftime('%Y-%m-%d')
-            
-            logger.info(f"开始执行股票估值播报任务，日期: {date}")
-            
-            # 获取估值数据
-            valuation_data = self.get_stock_valuation(date)
-            
-            if valuation_data:
-                # 格式化消息
-                message = self.format_message(valuation_data, date)
+        with self.metrics.stage('total') as total:
+            try:
+                message = self.build_message(date)
                 
-                # 发送到钉钉
-                if self.send_to_dingtalk(message):
-                    logger.info("任务执行成功")
+                if message == "":
                     success = True
-                else:
-                    logger.error("钉钉消息发送失败")
-            else:
-                logger.error("获取估值数据失败")
-                
-        except Exception as e:
-            logger.error(f"任务执行失败: {e}", exc_info=True)
+                elif message:
+                    # 发送到钉钉
+                    with self.metrics.stage('send') as stage:
+                        sent = self.send_to_dingtalk(message)
+                        stage['success'] = sent
+                        stage['payload_bytes'] = len(message.encode('utf-8'))
+                    
+                    if sent:
+                        self.confirm_changes()
+                        logger.info("任务执行成功")
+                        success = True
+                    else:
+                        logger.error("钉钉消息发送失败")
+            
+            except Exception as e:
+                logger.error(f"任务执行失败: {e}", exc_info=True)
+            
+            total['success'] = success
         
+        logger.info(f"缓存统计: {self.cache.stats()}")
+        logger.info(f"HTTP统计: {self.session.stats()}")
         return success
+    
+    def close(self):
+        """关闭机器人自身的状态库连接，会话和缓存可能与其他机器人共享，由创建方关闭"""
+        self.change_detector.close()
+        self.history.close()
+        self.last_good.close()
+        if self.percentile_engine is not None:
+            self.percentile_engine.close()
 
 def main():
     """主函数"""
     try:
         bot = StockValuationBot()
+        # 带 --full-market 参数时扫描全市场非金融类股票
+        if '--full-market' in sys.argv:
+            bot.full_market_enabled = True
         
         # 可以指定日期，不指定则使用7天前的日期
         # bot.run('2025-09-09')
@@ -0,0 +1,27 @@
+"""DeadlineRunner 测试使用的目标函数，工作进程按模块名导入"""
+import os
+import time
+
+def echo(value):
+    return value
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+def slow_first(marker, seconds):
+    """首次调用（marker 文件不存在时）创建 marker 并休眠，之后的调用立即返回"""
+    try:
+        fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return 'hedge'
+    os.close(fd)
+    time.sleep(seconds)
+    return 'first'
+
+def fail(message):
+    raise ValueError(message)
+
+def exit_silently(code):
+    """不发送结果直接退出工作进程"""
+    os._exit(code)
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from api_server import SnapshotIndex
+from history_store import HistoryStore
+
+RATING = 'pe_ttm.y10.mcw.cvpos'
+
+@pytest.fixture
+def index(tmp_path):
+    store = HistoryStore(path=str(tmp_path / 'history'))
+    store.append('cn', [
+        ('2024-01-31', '000300', RATING, 0.15),
+        ('2024-01-31', '000905', RATING, 0.55),
+        ('2024-02-01', '000300', RATING, 0.25),
+    ])
+    yield SnapshotIndex(store, names={'cn': {'000300': '沪深300'}})
+    store.close()
+
+def get(index, path):
+    status, body = index.handle(path, {})
+    return status, json.loads(body)
+
+def test_snapshot_keeps_codes_without_data_on_latest_date(index):
+    assert 'cn' in index.refresh()
+    status, market = get(index, '/markets/cn')
+    assert status == 200 and market['date'] == '2024-02-01'
+    items = {item['code']: item for item in market['items']}
+    assert items['000300']['date'] == '2024-02-01'
+    assert items['000300']['band'] == '偏低'
+    assert items['000905']['date'] == '2024-01-31'
+    assert items['000905']['metrics'] == {RATING: 0.55}
+
+def test_refresh_only_rebuilds_changed_markets(index):
+    index.refresh()
+    assert index.refresh() == []
+    index.store.append('cn', [('2024-02-02', '000905', RATING, 0.65)])
+    assert index.refresh() == ['cn']
+    status, item = get(index, '/markets/cn/codes/000905')
+    assert status == 200 and item['date'] == '2024-02-02' and item['band'] == '偏高'
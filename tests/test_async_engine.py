@@ -0,0 +1,101 @@
+import asyncio
+import socket
+
+import pytest
+
+from async_engine import AsyncEngine
+from benchmarks.fakes import DINGTALK_PATH, LIXINGER_PATHS, FakeBackend
+from index_valuation import IndexValuationBot
+
+DATES = ['2024-01-02', '2024-01-03', '2024-01-04']
+
+class RecordingBackend(FakeBackend):
+    """记录钉钉请求体，errcode 不为 0 时钉钉接口返回错误"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.dingtalk_bodies = []
+        self.errcode = 0
+    
+    def handle(self, path, body):
+        if path.startswith(DINGTALK_PATH):
+            self.dingtalk_bodies.append(body)
+            if self.errcode:
+                return {'errcode': self.errcode, 'errmsg': 'error'}
+        return super().handle(path, body)
+
+@pytest.fixture
+def backend():
+    with RecordingBackend(lixinger_latency=0.05) as backend:
+        yield backend
+
+@pytest.fixture
+def bot(backend, tmp_path):
+    config = backend.make_config(str(tmp_path), codes=5)
+    config['lixinger_cache']['enabled'] = False
+    config['circuit_breaker'].update(failure_threshold=1, reset_seconds=300)
+    config['async_engine'] = {'max_retries': 0}
+    config['dingtalk_sender'].update(max_bytes=300)
+    bot = IndexValuationBot(config=config)
+    yield bot
+    bot.close()
+    bot.session.close()
+
+def run_engine(work):
+    async def main():
+        async with AsyncEngine.from_config({'async_engine': {'max_retries': 0}}) as engine:
+            return await work(engine)
+    return asyncio.run(main())
+
+def closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}{LIXINGER_PATHS['cn_config']}"
+
+def test_concurrent_fetches_match_sync_path(backend, bot):
+    expected = {date: bot.get_index_valuation(date) for date in DATES}
+    backend.reset()
+    assert run_engine(lambda engine: engine.fetch_valuations(bot, DATES)) == expected
+    assert backend.requests[LIXINGER_PATHS['cn_config']] == len(DATES)
+
+def test_identical_concurrent_fetches_share_one_request(backend, bot):
+    async def work(engine):
+        return await asyncio.gather(*(engine.fetch_valuation(bot, DATES[0]) for _ in range(3)))
+    first, second, third = run_engine(work)
+    assert backend.requests[LIXINGER_PATHS['cn_config']] == 1
+    assert first == second == third == bot.get_index_valuation(DATES[0])
+
+def test_fetch_records_failures_and_respects_open_breaker(backend, bot):
+    api_url = bot.lixinger_config['api_url']
+    breaker = bot.session.breaker
+    bot.lixinger_config['api_url'] = closed_port_url()
+    assert run_engine(lambda engine: engine.fetch_valuation(bot, DATES[0])) is None
+    assert breaker.is_open(bot.lixinger_config['api_url'])
+    
+    # 熔断的端点不再发送请求，与同步请求的行为一致
+    bot.lixinger_config['api_url'] = api_url
+    breaker.record_failure(api_url)
+    assert run_engine(lambda engine: engine.fetch_valuation(bot, DATES[0])) is None
+    assert bot.get_index_valuation(DATES[0]) is None
+    assert backend.requests[LIXINGER_PATHS['cn_config']] == 0
+
+def test_send_uses_same_payloads_as_sync_sender(backend, bot):
+    message = '\n'.join(f"第 {i} 行估值数据" for i in range(40))
+    assert bot.send_to_dingtalk(message)
+    sync_bodies = backend.dingtalk_bodies
+    assert len(sync_bodies) > 1
+    
+    backend.dingtalk_bodies = []
+    assert run_engine(lambda engine: engine.send_dingtalk(bot, message, bot.report_title))
+    assert backend.dingtalk_bodies == sync_bodies == bot.dingtalk.payloads(message, bot.report_title)
+
+def test_send_stops_after_rejected_part_like_sync_sender(backend, bot):
+    message = '\n'.join(f"第 {i} 行估值数据" for i in range(40))
+    backend.errcode = 310000
+    assert not bot.send_to_dingtalk(message)
+    assert len(backend.dingtalk_bodies) == 1
+    
+    backend.dingtalk_bodies = []
+    assert not run_engine(lambda engine: engine.send_dingtalk(bot, message, bot.report_title))
+    assert len(backend.dingtalk_bodies) == 1
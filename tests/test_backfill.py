@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+from backfill import ValuationBackfill, split_date_range
+from history_store import HistoryStore
+from lixinger_cache import LixingerCache
+from trading_calendar import TradingCalendar
+
+class FakeResponse:
+    status_code = 200
+    
+    def __init__(self, data):
+        self._data = data
+    
+    def raise_for_status(self):
+        pass
+    
+    def json(self):
+        return self._data
+
+class FakeSession:
+    def __init__(self, fail_dates=()):
+        self.requests = []
+        self.fail_dates = set(fail_dates)
+    
+    def post(self, url, json, headers=None, idempotent=None):
+        self.requests.append(json)
+        if json.get('date') in self.fail_dates:
+            raise ConnectionError("down")
+        rows = [{'stockCode': code, 'date': json.get('date', json.get('startDate')) + 'T00:00:00+08:00',
+                 **{metric: 1.0 for metric in json['metricsList']}} for code in json['stockCodes']]
+        return FakeResponse({'data': rows})
+
+def make_backfill(tmp_path, session, metrics_list=("pe_ttm.mcw",), codes=None, hk_holidays=()):
+    bot = SimpleNamespace(
+        market='hk',
+        stock_codes=codes or [f"C{i:03d}" for i in range(250)],
+        metrics_list=list(metrics_list),
+        lixinger_config={'api_url': 'https://example.com/api', 'token': 't'},
+        cache=LixingerCache(enabled=False),
+        session=session,
+        date_resolver=SimpleNamespace(calendar=TradingCalendar(hk_holidays=list(hk_holidays))),
+    )
+    return ValuationBackfill(bot, 'hk', db_path=str(tmp_path / 'backfill.db'), max_workers=2,
+                             requests_per_minute=60000)
+
+def test_split_date_range_caps_window_length():
+    assert split_date_range('2005-01-01', '2024-06-30', 10) == [
+        ('2005-01-01', '2014-12-31'), ('2015-01-01', '2024-06-30')
+    ]
+
+def test_date_tasks_skip_weekends_and_holidays(tmp_path):
+    backfill = make_backfill(tmp_path, FakeSession(), hk_holidays=['2024-01-03'])
+    tasks = backfill.plan_tasks('2024-01-01', '2024-01-07')
+    dates = sorted({task['payload']['date'] for task in tasks})
+    assert dates == ['2024-01-01', '2024-01-02', '2024-01-04', '2024-01-05']
+    # 250 个代码按 100 个一组
+    assert len(tasks) == 4 * 3
+    backfill.close()
+
+def test_resume_skips_completed_tasks(tmp_path):
+    session = FakeSession(fail_dates={'2024-01-04'})
+    backfill = make_backfill(tmp_path, session)
+    assert backfill.run('2024-01-01', '2024-01-05') == 4 * 250
+    assert len(session.requests) == 5 * 3
+    backfill.close()
+    
+    session = FakeSession()
+    backfill = make_backfill(tmp_path, session)
+    assert backfill.run('2024-01-01', '2024-01-05') == 250
+    assert {request['date'] for request in session.requests} == {'2024-01-04'}
+    assert backfill.run('2024-01-01', '2024-01-05') == 0
+    backfill.close()
+
+def test_metric_change_invalidates_completed_tasks(tmp_path):
+    backfill = make_backfill(tmp_path, FakeSession(), codes=['000300'])
+    backfill.run('2024-01-01', '2024-01-02')
+    backfill.close()
+    
+    session = FakeSession()
+    backfill = make_backfill(tmp_path, session, metrics_list=("pe_ttm.mcw", "pb.mcw"), codes=['000300'])
+    assert backfill.run('2024-01-01', '2024-01-02') > 0
+    assert session.requests and all('pb.mcw' in request['metricsList'] for request in session.requests)
+    backfill.close()
+
+def test_backfilled_rows_reach_history_store(tmp_path):
+    backfill = make_backfill(tmp_path, FakeSession(), codes=['000300'])
+    backfill.bot.history = HistoryStore(path=str(tmp_path / 'history'))
+    assert backfill.run('2024-01-01', '2024-01-01') == 1
+    series = backfill.bot.history.series('hk', '000300', 'pe_ttm.mcw')
+    assert [day.strftime('%Y-%m-%d') for day in series.index] == ['2024-01-01']
+    assert series.tolist() == [1.0]
+    backfill.close()
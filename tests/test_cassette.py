@@ -0,0 +1,69 @@
+import copy
+import gzip
+import json
+import socket
+import sys
+
+import pytest
+
+import cassette
+from benchmarks.fakes import DINGTALK_PATH, FakeBackend, install_fake_akshare
+from hk_index_valuation import HKIndexValuationBot
+from index_valuation import IndexValuationBot
+from indicator import IndicatorBot
+from stock_valuation import StockValuationBot
+
+DATE = '2024-12-31'
+BOT_CLASSES = {
+    'cn': IndexValuationBot,
+    'hk': HKIndexValuationBot,
+    'stock': StockValuationBot,
+    'indicator': IndicatorBot,
+}
+
+def run_bots(config):
+    """依次生成并发送各机器人的消息，返回 {机器人: 消息字节}"""
+    messages = {}
+    for name, bot_class in BOT_CLASSES.items():
+        bot = bot_class(config=config)
+        message = bot.build_message() if name == 'indicator' else bot.build_message(DATE)
+        assert message
+        assert bot.send_to_dingtalk(message)
+        messages[name] = message.encode('utf-8')
+        bot.close()
+    return messages
+
+def test_configure_disables_all_local_state():
+    config = cassette.configure({'last_good': {'path': 'x.db'}}, 'replay')
+    for section in ('lixinger_cache', 'indicator_store', 'change_detection', 'history_store',
+                    'circuit_breaker', 'last_good', 'percentile_engine'):
+        assert config[section]['enabled'] is False, section
+    assert config['last_good']['path'] == 'x.db'
+
+def test_record_then_replay_without_network(tmp_path, monkeypatch):
+    path = str(tmp_path / 'run.json.gz')
+    monkeypatch.delitem(sys.modules, 'akshare', raising=False)
+    with FakeBackend() as backend:
+        config = cassette.configure(backend.make_config(str(tmp_path / 'data'), codes=5), 'record')
+        install_fake_akshare(rows=30)
+        with cassette.use(path, 'record'):
+            recorded = run_bots(copy.deepcopy(config))
+        assert sum(count for url, count in backend.requests.items() if url.startswith(DINGTALK_PATH)) == 4
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        recording = json.load(f)
+    assert recording['akshare'] and {entry['result']['type'] for entry in recording['akshare']} == {'parquet'}
+    
+    # 替身已关闭，回放时任何网络连接或 akshare 导入都会失败
+    def no_network(self, address):
+        raise AssertionError(f"回放时访问了网络: {address}")
+    monkeypatch.setattr(socket.socket, 'connect', no_network)
+    monkeypatch.setitem(sys.modules, 'akshare', None)
+    with cassette.use(path, 'replay'):
+        replayed = run_bots(cassette.configure(copy.deepcopy(config), 'replay'))
+    assert replayed == recorded
+
+def test_unsupported_akshare_result_is_rejected(tmp_path):
+    recorder = cassette.Cassette(str(tmp_path / 'run.json.gz'), 'record')
+    module = type('Module', (), {'broken': staticmethod(lambda: object())})
+    with pytest.raises(TypeError):
+        recorder.call_akshare(module, 'broken', (), {})
@@ -0,0 +1,57 @@
+import math
+
+import pytest
+
+from change_detector import ChangeDetector
+
+CODES = ['000300', '000905', '399006']
+
+@pytest.fixture
+def detector(tmp_path):
+    detector = ChangeDetector(path=str(tmp_path / 'reported.db'), delta_mode=True, min_change=5.0)
+    yield detector
+    detector.close()
+
+def test_first_run_reports_everything_with_data(detector):
+    selected, pending = detector.detect('cn_index', CODES, [0.1, 0.5, math.nan], '2024-01-02')
+    assert selected.tolist() == [True, True, False]
+    assert [row[0] for row in pending] == ['000300', '000905']
+
+def test_only_band_changes_and_large_moves_are_reported(detector):
+    _, pending = detector.detect('cn_index', CODES, [0.10, 0.50, 0.70], '2024-01-02')
+    detector.commit('cn_index', pending)
+    
+    # 000300 区间不变且变动 3 个百分点；000905 变动 6 个百分点；399006 跨区间
+    selected, pending = detector.detect('cn_index', CODES, [0.13, 0.56, 0.81], '2024-01-03')
+    assert selected.tolist() == [False, True, True]
+    assert [row[0] for row in pending] == ['000905', '399006']
+
+def test_state_is_recorded_only_on_commit(detector):
+    detector.detect('cn_index', CODES, [0.10, 0.50, 0.70], '2024-01-02')
+    selected, _ = detector.detect('cn_index', CODES, [0.10, 0.50, 0.70], '2024-01-02')
+    assert selected.all()
+    assert detector.load('cn_index').empty
+
+def test_select_filters_response_and_returns_none_without_changes(detector):
+    response = {'data': [{'stockCode': code} for code in CODES]}
+    _, pending = detector.select('cn_index', response, CODES, [0.10, 0.50, 0.70], '2024-01-02')
+    detector.commit('cn_index', pending)
+    
+    filtered, _ = detector.select('cn_index', response, CODES, [0.10, 0.30, 0.70], '2024-01-03')
+    assert filtered['data'] == [{'stockCode': '000905'}]
+    unchanged, pending = detector.select('cn_index', response, CODES, [0.10, 0.50, 0.70], '2024-01-03')
+    assert unchanged is None and pending == []
+
+def test_bots_are_tracked_separately(detector):
+    _, pending = detector.detect('cn_index', CODES[:1], [0.1], '2024-01-02')
+    detector.commit('cn_index', pending)
+    selected, _ = detector.detect('hk_index', CODES[:1], [0.1], '2024-01-02')
+    assert selected.tolist() == [True]
+
+def test_non_delta_mode_reports_all_and_records_state(tmp_path):
+    detector = ChangeDetector(path=str(tmp_path / 'reported.db'))
+    selected, pending = detector.detect('cn_index', CODES, [0.1, 0.1, math.nan], '2024-01-02')
+    detector.commit('cn_index', pending)
+    assert selected.all()
+    assert detector.load('cn_index').index.tolist() == ['000300', '000905']
+    detector.close()
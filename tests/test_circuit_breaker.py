@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import circuit_breaker
+from async_engine import AsyncEngine
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from http_client import HttpClient
+from lixinger_cache import LixingerCache
+
+URL = "https://open.lixinger.com/api/cn/index/fundamental"
+OTHER_URL = "https://open.lixinger.com/api/hk/index/fundamental"
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+    
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, 'time', clock.time)
+    return clock
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'circuit_breaker.json')
+
+def open_breaker(breaker, url=URL):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure(url)
+
+def test_opens_after_threshold_and_probes_once(path, clock):
+    breaker = CircuitBreaker(path, failure_threshold=2, reset_seconds=60)
+    breaker.record_failure(URL)
+    assert not breaker.is_open(URL)
+    breaker.record_failure(URL)
+    assert breaker.is_open(URL)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(URL)
+    
+    clock.now += 61
+    assert breaker.before_request(URL) is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(URL)
+    breaker.record_success(URL)
+    assert not breaker.is_open(URL)
+    assert breaker.before_request(URL) is False
+
+def test_failed_probe_reopens(path, clock):
+    breaker = CircuitBreaker(path, failure_threshold=1, reset_seconds=60)
+    open_breaker(breaker)
+    clock.now += 61
+    breaker.before_request(URL)
+    breaker.record_failure(URL)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(URL)
+
+def test_abandoned_probe_times_out(path, clock):
+    breaker = CircuitBreaker(path, failure_threshold=1, reset_seconds=60)
+    open_breaker(breaker)
+    clock.now += 61
+    breaker.before_request(URL)
+    clock.now += 61
+    assert breaker.before_request(URL) is True
+
+def test_probe_released_when_request_raises_non_network_error(path, clock, monkeypatch):
+    breaker = CircuitBreaker(path, failure_threshold=1, reset_seconds=60)
+    client = HttpClient(max_retries=0, coalesce=False, breaker=breaker)
+    open_breaker(breaker)
+    clock.now += 61
+    
+    def broken(self, method, url, **kwargs):
+        raise ValueError("bad body")
+    monkeypatch.setattr(requests.Session, 'request', broken)
+    with pytest.raises(ValueError):
+        client.post(URL, json={})
+    # 探测已释放，下一个请求可以再次探测
+    assert breaker.before_request(URL) is True
+
+def test_probe_released_when_async_fetch_is_cancelled(path, clock):
+    breaker = CircuitBreaker(path, failure_threshold=1, reset_seconds=60)
+    open_breaker(breaker)
+    clock.now += 61
+    bot = SimpleNamespace(
+        lixinger_config={'api_url': URL},
+        build_payload=lambda date: {'date': date},
+        cache=LixingerCache(enabled=False),
+        session=SimpleNamespace(breaker=breaker),
+    )
+    engine = AsyncEngine()
+    
+    async def hang(url, payload, idempotent=False):
+        await asyncio.sleep(3600)
+    engine.post_json = hang
+    
+    async def run():
+        task = asyncio.ensure_future(engine.fetch_valuation(bot, '2024-01-02'))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(run())
+    assert breaker.before_request(URL) is True
+
+def test_processes_merge_endpoints_instead_of_overwriting(path, clock):
+    first = CircuitBreaker(path, failure_threshold=1)
+    second = CircuitBreaker(path, failure_threshold=1)
+    first.record_failure(URL)
+    second.record_failure(OTHER_URL)
+    # 第二个实例写入时保留了第一个实例记录的端点，也能看到其熔断
+    reloaded = CircuitBreaker(path, failure_threshold=1)
+    assert reloaded.is_open(URL) and reloaded.is_open(OTHER_URL)
+    assert second.is_open(URL)
+    
+    first.record_success(URL)
+    assert not second.is_open(URL)
+    assert second.is_open(OTHER_URL)
+
+def test_disabled_breaker_never_rejects(path):
+    breaker = CircuitBreaker(path, failure_threshold=1, enabled=False)
+    open_breaker(breaker)
+    assert breaker.before_request(URL) is False
+    assert not breaker.is_open(URL)
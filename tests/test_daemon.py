@@ -0,0 +1,110 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import daemon
+from daemon import BotDaemon, CronSchedule
+
+class FakeRunner:
+    instances = []
+    
+    def __init__(self, config_file, pipelines=None, config=None, session=None, cache=None, store=None):
+        self.config = config
+        self.session = session or object()
+        self.cache = cache or object()
+        self.store = store or object()
+        self.bots = {}
+        self.closed = None
+        FakeRunner.instances.append(self)
+    
+    def run(self, date=None, pipelines=None):
+        return {name: True for name in pipelines}
+    
+    def close(self, keep=()):
+        self.closed = set(keep)
+
+def write_config(path, jobs, http=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'daemon': {'jobs': jobs}, 'http': http or {}}, f)
+    # 保证修改时间变化
+    mtime = os.path.getmtime(path) + len(FakeRunner.instances) + 1
+    os.utime(path, (mtime, mtime))
+
+@pytest.fixture
+def config_path(tmp_path, monkeypatch):
+    FakeRunner.instances = []
+    monkeypatch.setattr(daemon, 'UnifiedRunner', FakeRunner)
+    return str(tmp_path / 'config.json')
+
+def test_next_after_minute_and_weekday_fields():
+    schedule = CronSchedule('35 15 * * 1-5')
+    # 2024-01-05 为周五
+    assert schedule.next_after(datetime(2024, 1, 5, 15, 34)) == datetime(2024, 1, 5, 15, 35)
+    assert schedule.next_after(datetime(2024, 1, 5, 15, 35)) == datetime(2024, 1, 8, 15, 35)
+
+def test_day_and_weekday_restricted_match_either():
+    schedule = CronSchedule('0 9 1 * 1')
+    # 2024-01-01 为周一且为 1 日，之后的第一个周一为 8 日
+    assert schedule.next_after(datetime(2024, 1, 1, 9, 0)) == datetime(2024, 1, 8, 9, 0)
+    assert schedule.next_after(datetime(2024, 1, 29, 9, 0)) == datetime(2024, 2, 1, 9, 0)
+
+def test_step_in_day_field_counts_as_unrestricted():
+    schedule = CronSchedule('0 9 */2 * 1')
+    # 与 Vixie cron 一致：单数日且为周一，2024-01-01 之后为 2024-01-15
+    assert schedule.next_after(datetime(2024, 1, 1, 9, 0)) == datetime(2024, 1, 15, 9, 0)
+
+def test_invalid_expressions():
+    with pytest.raises(ValueError):
+        CronSchedule('0 9 * *')
+    with pytest.raises(ValueError):
+        CronSchedule('60 9 * * *')
+
+def test_reload_keeps_due_run_of_unchanged_job(config_path):
+    write_config(config_path, [{'name': 'cn_close', 'cron': '35 15 * * *', 'pipelines': ['cn']}])
+    bot_daemon = BotDaemon(config_path)
+    due = datetime(2024, 1, 5, 15, 35)
+    bot_daemon.jobs[0].next_run = due
+    
+    write_config(config_path, [{'name': 'cn_close', 'cron': '35 15 * * *', 'pipelines': ['cn', 'hk']},
+                               {'name': 'indicators', 'cron': '0 18 * * *', 'pipelines': ['indicator']}])
+    assert bot_daemon.reload_if_changed()
+    jobs = {job.name: job for job in bot_daemon.jobs}
+    assert jobs['cn_close'].next_run == due
+    assert jobs['indicators'].next_run > datetime.now()
+
+def test_reload_closes_previous_runner_after_running_jobs(config_path):
+    write_config(config_path, [{'name': 'cn_close', 'cron': '35 15 * * *', 'pipelines': ['cn']}])
+    bot_daemon = BotDaemon(config_path)
+    first = bot_daemon.runner
+    job = bot_daemon.jobs[0]
+    bot_daemon._running.add(job.name)
+    
+    write_config(config_path, [{'name': 'cn_close', 'cron': '35 15 * * *', 'pipelines': ['cn']}],
+                 http={'timeout': 5})
+    assert bot_daemon.reload_if_changed()
+    assert bot_daemon.runner is not first
+    assert bot_daemon.runner.cache is first.cache
+    # 运行中的任务结束后才关闭，沿用的缓存不关闭
+    assert first.closed is None
+    bot_daemon.run_job(job)
+    assert 'cache' in first.closed and 'session' not in first.closed
+
+def test_reload_rebuilds_session_when_circuit_breaker_changes(config_path):
+    jobs = [{'name': 'cn_close', 'cron': '35 15 * * *', 'pipelines': ['cn']}]
+    write_config(config_path, jobs)
+    bot_daemon = BotDaemon(config_path)
+    first = bot_daemon.runner
+    
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config['circuit_breaker'] = {'failure_threshold': 5}
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    mtime = os.path.getmtime(config_path) + 10
+    os.utime(config_path, (mtime, mtime))
+    assert bot_daemon.reload_if_changed()
+    assert bot_daemon.runner.session is not first.session
+    assert bot_daemon.runner.cache is first.cache
+    assert first.closed == {'cache', 'store'}
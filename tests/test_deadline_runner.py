@@ -0,0 +1,62 @@
+import multiprocessing
+import time
+
+import pytest
+
+from deadline_runner import DeadlineExceeded, DeadlineRunner
+
+TARGETS = 'tests.deadline_targets'
+
+@pytest.fixture(params=[method for method in ('fork', 'forkserver') if method in multiprocessing.get_all_start_methods()])
+def start_method(request):
+    return request.param
+
+def make_runner(start_method, **kwargs):
+    return DeadlineRunner(start_method=start_method, preload=(), **kwargs)
+
+def test_returns_result(start_method):
+    runner = make_runner(start_method, deadline_seconds=10)
+    assert runner.call(TARGETS, 'echo', ({'value': [1, 2]},)) == {'value': [1, 2]}
+    assert runner.module(TARGETS).echo(None) is None
+    assert runner.stats() == {'calls': 2, 'timeouts': 0, 'hedges': 0, 'hedge_wins': 0}
+
+def test_worker_past_deadline_is_killed(start_method, monkeypatch):
+    runner = make_runner(start_method, deadline_seconds=0.5)
+    stopped = []
+    stop = DeadlineRunner._stop
+    
+    def record_stop(attempt):
+        stop(attempt)
+        stopped.append(attempt[0])
+    monkeypatch.setattr(DeadlineRunner, '_stop', staticmethod(record_stop))
+    started_at = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        runner.call(TARGETS, 'sleep', (30,))
+    assert time.monotonic() - started_at < 5
+    assert len(stopped) == 1 and not stopped[0].is_alive()
+    assert runner.stats()['timeouts'] == 1
+
+def test_hedge_wins_when_first_attempt_is_slow(start_method, tmp_path):
+    runner = make_runner(start_method, deadline_seconds=10, hedge_after_seconds=0.3)
+    started_at = time.monotonic()
+    assert runner.call(TARGETS, 'slow_first', (str(tmp_path / 'marker'), 30)) == 'hedge'
+    assert time.monotonic() - started_at < 5
+    assert runner.stats() == {'calls': 1, 'timeouts': 0, 'hedges': 1, 'hedge_wins': 1}
+
+def test_no_hedge_when_first_attempt_is_fast(start_method, tmp_path):
+    runner = make_runner(start_method, deadline_seconds=10, hedge_after_seconds=5)
+    assert runner.call(TARGETS, 'slow_first', (str(tmp_path / 'marker'), 0)) == 'first'
+    assert runner.stats()['hedges'] == 0
+
+def test_exception_is_raised_in_caller(start_method):
+    runner = make_runner(start_method, deadline_seconds=10)
+    with pytest.raises(ValueError, match="bad input"):
+        runner.call(TARGETS, 'fail', ("bad input",))
+
+def test_worker_exiting_without_result_raises_clear_error(start_method):
+    runner = make_runner(start_method, deadline_seconds=10)
+    started_at = time.monotonic()
+    with pytest.raises(RuntimeError, match="exit_silently 工作进程异常退出（退出码 3）"):
+        runner.call(TARGETS, 'exit_silently', (3,))
+    assert time.monotonic() - started_at < 5
+    assert runner.stats()['timeouts'] == 0
@@ -0,0 +1,128 @@
+import time
+import uuid
+
+import pytest
+
+from dingtalk_sender import DingTalkSender, split_message
+
+class FakeResponse:
+    def __init__(self, status_code, result):
+        self.status_code = status_code
+        self._result = result
+    
+    def json(self):
+        return self._result
+
+class FakeSession:
+    def __init__(self, results):
+        self.results = list(results)
+        self.payloads = []
+    
+    def post(self, url, json, headers=None):
+        self.payloads.append(json)
+        status, result = self.results.pop(0)
+        return FakeResponse(status, result)
+
+@pytest.fixture
+def clock(monkeypatch):
+    """假时钟：sleep 只推进时间，记录每次等待"""
+    state = {'now': 1000.0, 'sleeps': []}
+    def sleep(seconds):
+        state['sleeps'].append(seconds)
+        state['now'] += seconds
+    monkeypatch.setattr(time, 'monotonic', lambda: state['now'])
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return state
+
+def make_sender(results, **kwargs):
+    # 限流器按 webhook 共享，每个测试使用独立的地址
+    webhook_url = f"https://oapi.dingtalk.com/robot/send?access_token={uuid.uuid4().hex}"
+    return DingTalkSender(webhook_url, FakeSession(results), **kwargs)
+
+OK = (200, {'errcode': 0})
+TOO_FAST = (200, {'errcode': 130101, 'errmsg': 'send too fast'})
+
+def test_short_message_is_not_split():
+    assert split_message("a\nb", max_bytes=10) == ["a\nb"]
+
+def test_split_on_line_boundaries_within_byte_limit():
+    lines = [f"行{i:02d}" for i in range(20)]
+    message = "\n".join(lines)
+    parts = split_message(message, max_bytes=30)
+    assert len(parts) > 1
+    assert all(len(part.encode('utf-8')) <= 30 for part in parts)
+    assert "\n".join(parts) == message
+
+def test_split_long_line_without_breaking_characters():
+    message = "估值" * 20
+    parts = split_message(message, max_bytes=10)
+    assert all(len(part.encode('utf-8')) <= 10 for part in parts)
+    assert "".join(parts) == message
+
+def test_split_with_custom_separator():
+    message = "\n\n".join(["a" * 8] * 6)
+    parts = split_message(message, max_bytes=20, separator="\n\n")
+    assert parts == ["a" * 8 + "\n\n" + "a" * 8] * 3
+
+def test_sender_numbers_parts_and_titles(clock):
+    sender = make_sender([OK] * 10, max_bytes=200, burst=10)
+    message = "\n".join(f"line {i}" for i in range(60))
+    assert sender.send(message, "播报")
+    payloads = sender.session.payloads
+    assert len(payloads) > 1
+    for i, payload in enumerate(payloads, 1):
+        assert payload['markdown']['title'] == f"播报 ({i}/{len(payloads)})"
+        assert payload['markdown']['text'].startswith(f"**播报 ({i}/{len(payloads)})**\n")
+        assert len(payload['markdown']['text'].encode('utf-8')) <= 200
+
+def test_single_part_keeps_plain_title(clock):
+    sender = make_sender([OK])
+    assert sender.send("hello", "播报")
+    assert sender.session.payloads == [{'msgtype': 'markdown', 'markdown': {'title': "播报", 'text': "hello"}}]
+
+def test_throttled_send_waits_through_rate_limiter(clock):
+    sender = make_sender([TOO_FAST, OK], throttle_pause_seconds=10)
+    assert sender.send("hello", "播报")
+    assert len(sender.session.payloads) == 2
+    assert sum(clock['sleeps']) == pytest.approx(10)
+
+def test_throttle_retries_are_bounded(clock):
+    sender = make_sender([TOO_FAST] * 3, max_throttle_retries=2, throttle_pause_seconds=5)
+    assert not sender.send("hello", "播报")
+    assert len(sender.session.payloads) == 3
+    assert sum(clock['sleeps']) == pytest.approx(10)
+
+@pytest.mark.parametrize("result", [(500, None), (200, {'errcode': 310000, 'errmsg': 'keywords not in content'})])
+def test_failures_stop_remaining_parts(clock, result):
+    sender = make_sender([result, OK, OK], max_bytes=100, burst=10)
+    assert not sender.send("\n".join(f"line {i}" for i in range(40)), "t")
+    assert len(sender.session.payloads) == 1
+
+def test_rate_limit_spaces_sends(clock):
+    sender = make_sender([OK] * 3, messages_per_minute=60, burst=1)
+    for _ in range(3):
+        assert sender.send("hello", "t")
+    assert clock['sleeps'] == [pytest.approx(1.0), pytest.approx(1.0)]
+
+def test_async_engine_shares_throttle_handling(clock, monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+    
+    from async_engine import AsyncEngine
+    
+    sender = make_sender([], throttle_pause_seconds=10)
+    results = [TOO_FAST, OK]
+    sent = []
+    async def post_json(url, payload, idempotent=False):
+        sent.append(payload)
+        return results.pop(0)
+    async def fake_sleep(seconds):
+        clock['sleeps'].append(seconds)
+        clock['now'] += seconds
+    
+    engine = AsyncEngine()
+    monkeypatch.setattr(engine, 'post_json', post_json)
+    monkeypatch.setattr(asyncio, 'sleep', fake_sleep)
+    assert asyncio.run(engine.send_dingtalk(SimpleNamespace(dingtalk=sender), "hello", "播报"))
+    assert len(sent) == 2
+    assert sum(clock['sleeps']) == pytest.approx(10)
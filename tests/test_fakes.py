@@ -0,0 +1,21 @@
+import os
+
+from benchmarks.fakes import FakeBackend
+
+def state_paths(config, prefix=''):
+    """配置中所有本地文件路径（键名以 path 或 dir 结尾），返回 {配置键: 路径}"""
+    paths = {}
+    for key, value in config.items():
+        if isinstance(value, dict):
+            paths.update(state_paths(value, f"{prefix}{key}."))
+        elif isinstance(value, str) and key.endswith(('path', 'dir')):
+            paths[prefix + key] = value
+    return paths
+
+def test_make_config_keeps_all_local_state_in_data_dir(tmp_path):
+    with FakeBackend() as backend:
+        config = backend.make_config(str(tmp_path))
+    paths = state_paths(config)
+    assert {'last_good.path', 'percentile_engine.path', 'backfill.db_path'} <= set(paths)
+    for key, path in paths.items():
+        assert os.path.abspath(path).startswith(str(tmp_path) + os.sep), key
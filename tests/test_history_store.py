@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+
+import pytest
+
+from history_store import HistoryStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(path=str(tmp_path / 'history'))
+    yield store
+    store.close()
+
+def rows_of(table):
+    frame = table.to_pandas()
+    return [(str(row.date), str(row.code), str(row.metric), row.value) for row in frame.itertuples()]
+
+def test_append_replaces_same_key_and_partitions_by_month(store):
+    store.append('cn', [('2024-01-31', '000300', 'pe', 1.0), ('2024-02-01', '000300', 'pe', 2.0)])
+    store.append('cn', [('2024-02-01', '000300', 'pe', 3.0)])
+    assert [os.path.basename(path) for path in store.partitions('cn')] == ['2024-01.arrow', '2024-02.arrow']
+    assert store.series('cn', '000300', 'pe').tolist() == [1.0, 3.0]
+
+def test_latest_returns_last_row_per_code_and_metric(store):
+    store.append('stock', [
+        ('2024-01-30', '600000', 'pe', 5.0),
+        ('2024-01-31', '600000', 'pe', 6.0),
+        ('2024-01-31', '600000', 'pb', 0.5),
+        ('2024-02-01', '600519', 'pe', 30.0),
+        ('2024-02-02', '600519', 'pe', 31.0),
+    ])
+    # 600000 在二月停牌，pb 只有一月的数据
+    store.append('stock', [('2024-02-02', '600000', 'pe', 7.0)])
+    assert rows_of(store.latest('stock')) == [
+        ('2024-01-31', '600000', 'pb', 0.5),
+        ('2024-02-02', '600000', 'pe', 7.0),
+        ('2024-02-02', '600519', 'pe', 31.0),
+    ]
+
+def test_latest_reads_index_kept_by_append(store, monkeypatch):
+    store.append('cn', [('2024-01-31', '000300', 'pe', 1.0), ('2024-02-01', '000300', 'pe', 2.0)])
+    # 回填更早的数据不替换最新值，同一天的新值替换旧值
+    store.append('cn', [('2023-12-29', '000300', 'pe', 0.5), ('2023-12-29', '000905', 'pe', 0.8)])
+    store.append('cn', [('2024-02-01', '000300', 'pe', 2.5)])
+    
+    def no_scan(market):
+        raise AssertionError(f"latest 扫描了 {market} 的分区")
+    monkeypatch.setattr(store, '_scan_latest', no_scan)
+    assert rows_of(store.latest('cn')) == [
+        ('2024-02-01', '000300', 'pe', 2.5),
+        ('2023-12-29', '000905', 'pe', 0.8),
+    ]
+
+def test_missing_index_is_rebuilt_from_partitions(store):
+    store.append('cn', [('2024-01-31', '000300', 'pe', 1.0), ('2024-02-01', '000905', 'pe', 2.0)])
+    expected = rows_of(store.latest('cn'))
+    os.remove(os.path.join(store.path, 'cn', 'latest.index'))
+    assert rows_of(store.latest('cn')) == expected
+    assert os.path.exists(os.path.join(store.path, 'cn', 'latest.index'))
+    assert [os.path.basename(path) for path in store.partitions('cn')] == ['2024-01.arrow', '2024-02.arrow']
+
+def test_latest_of_empty_market(store):
+    assert store.latest('hk').num_rows == 0
+
+def _append_days(path, code, days):
+    store = HistoryStore(path=path)
+    for day in range(1, days + 1):
+        store.append('cn', [(f'2024-01-{day:02d}', code, 'pe', float(day))])
+
+def test_concurrent_processes_do_not_lose_rows(tmp_path):
+    path = str(tmp_path / 'history')
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_append_days, args=(path, code, 20)) for code in ('A', 'B', 'C')]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    store = HistoryStore(path=path)
+    assert store.read('cn').num_rows == 60
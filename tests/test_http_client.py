@@ -0,0 +1,81 @@
+import io
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from http_client import HttpClient, is_connect_error
+
+URL = "https://oapi.dingtalk.com/robot/send"
+
+def make_response(status):
+    response = requests.Response()
+    response.status_code = status
+    response._content = b'{"errcode": 0}'
+    response.raw = io.BytesIO()
+    return response
+
+def connect_refused():
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.exceptions.ConnectionError(MaxRetryError(None, URL, reason))
+
+def connection_reset():
+    return requests.exceptions.ConnectionError(ProtocolError("Connection aborted.", ConnectionResetError()))
+
+@pytest.fixture
+def outcomes(monkeypatch):
+    """按顺序返回的结果：状态码或异常，记录实际发送次数"""
+    queue = []
+    sent = []
+    def fake_request(self, method, url, **kwargs):
+        sent.append(url)
+        outcome = queue.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return make_response(outcome)
+    monkeypatch.setattr(requests.Session, 'request', fake_request)
+    return queue, sent
+
+@pytest.fixture
+def client():
+    return HttpClient(max_retries=3, backoff_factor=0, coalesce=False)
+
+def test_is_connect_error():
+    assert is_connect_error(connect_refused())
+    assert is_connect_error(requests.exceptions.ConnectTimeout())
+    assert not is_connect_error(connection_reset())
+    assert not is_connect_error(requests.exceptions.ReadTimeout())
+
+@pytest.mark.parametrize("status", [500, 502, 503, 504])
+def test_non_idempotent_post_not_retried_on_5xx(client, outcomes, status):
+    queue, sent = outcomes
+    queue.extend([status, 200])
+    assert client.post(URL, json={}).status_code == status
+    assert len(sent) == 1
+
+def test_non_idempotent_post_retried_on_429(client, outcomes):
+    queue, sent = outcomes
+    queue.extend([429, 200])
+    assert client.post(URL, json={}).status_code == 200
+    assert len(sent) == 2
+
+def test_non_idempotent_post_retried_on_connect_failure(client, outcomes):
+    queue, sent = outcomes
+    queue.extend([connect_refused(), requests.exceptions.ConnectTimeout(), 200])
+    assert client.post(URL, json={}).status_code == 200
+    assert len(sent) == 3
+
+@pytest.mark.parametrize("error", [connection_reset, requests.exceptions.ReadTimeout])
+def test_non_idempotent_post_not_retried_after_send(client, outcomes, error):
+    queue, sent = outcomes
+    queue.extend([error(), 200])
+    with pytest.raises(requests.exceptions.RequestException):
+        client.post(URL, json={})
+    assert len(sent) == 1
+
+def test_idempotent_post_retried_until_limit(client, outcomes):
+    queue, sent = outcomes
+    queue.extend([502, connection_reset(), requests.exceptions.ReadTimeout(), 503])
+    assert client.post(URL, json={}, idempotent=True).status_code == 503
+    assert len(sent) == 4
+    assert client.stats()['oapi.dingtalk.com']['retries'] == 3
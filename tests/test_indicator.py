@@ -0,0 +1,57 @@
+import pandas as pd
+
+import indicator
+from indicator_store import IndicatorStore
+
+class FakeAkshare:
+    def __init__(self, frames):
+        self.frames = frames
+    
+    def __getattr__(self, name):
+        frame = self.frames[name]
+        if isinstance(frame, Exception):
+            def fail():
+                raise frame
+            return fail
+        return lambda: frame
+
+def test_summary_omits_empty_sources(monkeypatch):
+    fake = FakeAkshare({
+        'stock_ebs_lg': pd.DataFrame(),
+        'stock_buffett_index_lg': pd.DataFrame({'日期': ['2024-01-02'], '总市值': [1.5]}),
+        'stock_a_ttm_lyr': RuntimeError("boom"),
+    })
+    monkeypatch.setattr(indicator, 'load_akshare', lambda runner=None: fake)
+    
+    summary = indicator.get_latest_indicators_summary()
+    
+    assert '股债利差' not in summary
+    assert summary['巴菲特指标'] == {'日期': '2024-01-02', '总市值': 1.5}
+    assert summary['A股市盈率指标'] == "获取失败: boom"
+
+def test_bot_reports_empty_sources():
+    assert indicator.extract_latest(indicator.INDICATOR_SOURCES[0], pd.DataFrame()) == indicator.EMPTY_DATA
+
+def test_fetch_without_date_column_is_a_failure(tmp_path, monkeypatch):
+    store = IndicatorStore(path=str(tmp_path / 'indicators.db'), max_age_hours=0)
+    source = indicator.INDICATOR_SOURCES[0]
+    store.merge(source['name'], pd.DataFrame({'日期': ['2024-01-02'], '股债利差': [1.0]}), '日期')
+    
+    fake = FakeAkshare({'stock_ebs_lg': pd.DataFrame({'股债利差': [2.0]})})
+    monkeypatch.setattr(indicator, 'load_akshare', lambda runner=None: fake)
+    assert indicator.fetch_indicator(source, store).startswith("获取失败")
+    
+    fake.frames['stock_ebs_lg'] = pd.DataFrame()
+    assert indicator.fetch_indicator(source, store) == indicator.EMPTY_DATA
+    store.close()
+
+def test_report_date_rows_match_each_source():
+    message = indicator.IndicatorBot.report_template.render('2024-01-02', {
+        '股债利差': {'日期': '2024-01-02', '股债利差': 0.05},
+        'A股市盈率指标': {'date': '2024-01-02', '数据日期': '2024-01-02', '等权市盈率分位数': 0.25},
+    }, output_format='text')
+    lines = message.split('\n')
+    assert "📊 日期: 2024-01-02" in lines
+    assert "📊 date: 2024-01-02" in lines
+    assert "📅 数据日期: 2024-01-02" in lines
+    assert "📊 等权市盈率分位数: 25.0%" in lines
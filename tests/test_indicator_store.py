@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from indicator_store import IndicatorStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = IndicatorStore(path=str(tmp_path / 'indicators.db'))
+    yield store
+    store.close()
+
+def frame(dates, values):
+    return pd.DataFrame({'日期': pd.to_datetime(dates).date, '股债利差': values})
+
+def test_merge_only_appends_newer_rows(store):
+    assert store.merge('ebs', frame(['2024-01-02', '2024-01-03'], [1.0, 2.0]), '日期') == 2
+    assert store.merge('ebs', frame(['2024-01-02', '2024-01-03', '2024-01-04'], [9.0, 9.0, 3.0]), '日期') == 1
+    history = store.history('ebs')
+    assert history['日期'].tolist() == ['2024-01-02', '2024-01-03', '2024-01-04']
+    assert history['股债利差'].tolist() == [1.0, 2.0, 3.0]
+    assert store.latest('ebs') == {'日期': '2024-01-04', '股债利差': 3.0}
+    assert store.is_fresh('ebs')
+
+def test_merge_keeps_full_float_precision(store):
+    value = 0.12345678901234568
+    store.merge('ebs', frame(['2024-01-02'], [value]), '日期')
+    assert store.latest('ebs')['股债利差'] == value
+
+def test_full_refresh_replaces_history(store):
+    store.merge('ebs', frame(['2024-01-02', '2024-01-03'], [1.0, 2.0]), '日期')
+    assert store.merge('ebs', frame(['2024-01-03'], [5.0]), '日期', full_refresh=True) == 1
+    assert store.history('ebs')['股债利差'].tolist() == [5.0]
+
+def test_missing_date_column_is_an_error(store):
+    store.merge('ebs', frame(['2024-01-02'], [1.0]), '日期')
+    with pytest.raises(ValueError):
+        store.merge('ebs', pd.DataFrame({'value': [2.0]}), '日期')
+
+def test_disabled_store(tmp_path):
+    store = IndicatorStore(path=str(tmp_path / 'indicators.db'), enabled=False)
+    assert store.merge('ebs', frame(['2024-01-02'], [1.0]), '日期') == 0
+    assert store.latest('ebs') is None
+    assert store.history('ebs').empty
+    assert not store.is_fresh('ebs')
@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from lixinger_cache import LixingerCache
+
+API_URL = "https://open.lixinger.com/api/cn/index/fundamental"
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = LixingerCache(path=str(tmp_path / 'cache.db'), today_ttl=600, max_entries=3)
+    yield cache
+    cache.close()
+
+def payload(date, codes=("000300",), token="secret"):
+    return {"token": token, "date": date, "stockCodes": list(codes), "metricsList": ["pe_ttm.mcw"]}
+
+def expires_at(cache, request):
+    key = LixingerCache.make_key(API_URL, request)
+    return cache._conn.execute("SELECT expires_at FROM responses WHERE key = ?", (key,)).fetchone()[0]
+
+def test_key_ignores_token_and_order():
+    a = payload("2024-01-02", ["000300", "000905"], token="a")
+    b = payload("2024-01-02", ["000905", "000300"], token="b")
+    assert LixingerCache.make_key(API_URL, a) == LixingerCache.make_key(API_URL, b)
+    assert LixingerCache.make_key(API_URL, a) != LixingerCache.make_key(API_URL, payload("2024-01-03"))
+
+def test_past_date_with_data_never_expires(cache):
+    request = payload("2020-01-02")
+    cache.set(API_URL, request, {"data": [{"stockCode": "000300"}]})
+    assert expires_at(cache, request) is None
+    assert cache.get(API_URL, request) == {"data": [{"stockCode": "000300"}]}
+
+@pytest.mark.parametrize("data", [{"data": []}, {"data": None}])
+def test_empty_past_date_uses_short_ttl(cache, data):
+    request = payload("2020-01-02")
+    before = time.time()
+    cache.set(API_URL, request, data)
+    assert before + 600 <= expires_at(cache, request) <= time.time() + 600
+
+def test_today_uses_short_ttl_and_expires(cache, monkeypatch):
+    request = payload("2999-01-01")
+    cache.set(API_URL, request, {"data": [{"stockCode": "000300"}]})
+    assert cache.get(API_URL, request) is not None
+    
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 601)
+    assert cache.get(API_URL, request) is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_evicts_least_recently_used(cache, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: clock[0])
+    requests = [payload(f"2020-01-0{day}") for day in range(1, 5)]
+    for request in requests[:3]:
+        clock[0] += 1
+        cache.set(API_URL, request, {"data": [1]})
+    clock[0] += 1
+    cache.get(API_URL, requests[0])
+    clock[0] += 1
+    cache.set(API_URL, requests[3], {"data": [1]})
+    
+    assert cache.stats()['entries'] == 3
+    assert cache.get(API_URL, requests[0]) is not None
+    assert cache.get(API_URL, requests[1]) is None
+
+def test_disabled_cache_is_a_no_op(tmp_path):
+    cache = LixingerCache(path=str(tmp_path / 'cache.db'), enabled=False)
+    cache.set(API_URL, payload("2020-01-02"), {"data": [1]})
+    assert cache.get(API_URL, payload("2020-01-02")) is None
+    assert not (tmp_path / 'cache.db').exists()
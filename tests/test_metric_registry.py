@@ -0,0 +1,120 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from index_valuation import IndexValuationBot
+from metric_registry import DEFAULT_MARKETS, MetricRegistry, MetricSpec, parse_metric_key
+from stock_valuation import StockValuationBot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATE = '2024-01-02'
+RATING = 'pe_ttm.y10.mcw.cvpos'
+
+@pytest.mark.parametrize('key, parsed', [
+    ('pe_ttm.y10.mcw.cvpos', ('pe_ttm', 10, 'mcw', 'cvpos')),
+    ('pe_ttm.mcw', ('pe_ttm', None, 'mcw', None)),
+    ('pb.y5.cvpos', ('pb', 5, None, 'cvpos')),
+    ('dyr', ('dyr', None, None, None)),
+])
+def test_parse_metric_key(key, parsed):
+    assert parse_metric_key(key) == parsed
+
+@pytest.mark.parametrize('entry, label, format, digits', [
+    ('pb.y10.mcw.cvpos', "PB 10年分位", 'percent', 1),
+    ('pe_ttm.y5.ew.cvpos', "PE等权 5年分位", 'percent', 1),
+    ('dyr.mcw', "股息率", 'percent', 2),
+    ('pb', "PB", '%.2f', 2),
+    ('roe', "roe", '%.2f', 2),
+    ({'key': 'pb.mcw', 'label': "市净率", 'format': '%.1f'}, "市净率", '%.1f', 2),
+])
+def test_spec_defaults_and_overrides(entry, label, format, digits):
+    spec = MetricSpec.parse(entry)
+    assert (spec.label, spec.format, spec.digits) == (label, format, digits)
+
+def test_spec_render_skips_missing_values():
+    spec = MetricSpec('pb.y10.cvpos')
+    assert spec.render([0.2, np.nan]).tolist() == ["PB 10年分位: 20.0%", '']
+    assert MetricSpec('pb').render([1.234]).tolist() == ["PB: 1.23"]
+
+def test_metrics_list_merges_in_declared_order_without_duplicates():
+    config = {
+        'metric_registry': {'stock': {
+            'rating': ['pe_ttm.y5.cvpos'],
+            'display': ['pb', 'pe_ttm', {'key': 'dyr', 'label': "股息"}],
+            'fetch': ['pb', 'mc'],
+        }},
+        'percentile_engine': {'enabled': True},
+    }
+    registry = MetricRegistry.from_config(config, 'stock')
+    assert registry.rating == ['pe_ttm.y5.cvpos']
+    assert registry.metrics_list == DEFAULT_MARKETS['stock']['base'] + ['pb', 'dyr', 'mc']
+    
+    registry = MetricRegistry.from_config(config, 'cn')
+    assert registry.metrics_list == [RATING, 'pe_ttm.mcw']
+    assert registry.display == []
+
+def test_shipped_config_displays_no_extra_columns():
+    with open(os.path.join(ROOT, 'config.json'), 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    for market in DEFAULT_MARKETS:
+        registry = MetricRegistry.from_config(config, market)
+        assert registry.display == []
+        assert registry.render(pd.DataFrame(index=range(2))).tolist() == ['', '']
+
+def test_render_joins_display_columns_per_row():
+    registry = MetricRegistry('cn', display=['pb.y10.mcw.cvpos', 'dyr.mcw'])
+    frame = registry.load({'data': [
+        {'stockCode': '000300', 'pb.y10.mcw.cvpos': 0.2, 'dyr.mcw': 0.0312},
+        {'stockCode': '000905', 'dyr.mcw': 0.02},
+        {'stockCode': '399006'},
+    ]})
+    assert registry.render(frame).tolist() == ["PB 10年分位: 20.0% | 股息率: 3.12%", "股息率: 2.00%", '']
+
+@pytest.fixture
+def config(tmp_path):
+    data = str(tmp_path)
+    market = {
+        'lixinger': {'token': 't', 'api_url': 'https://example.com/api'},
+        'dingtalk': {'webhook_url': 'https://oapi.dingtalk.com/robot/send?access_token=test'},
+        'stock_codes': [],
+    }
+    return {
+        'cn_config': dict(market, index_names={'000300': '沪深300'}),
+        'stock_config': dict(market, stock_names={'600519': '贵州茅台'}),
+        'lixinger_cache': {'enabled': False},
+        'change_detection': {'path': f"{data}/reported.db"},
+        'history_store': {'enabled': False},
+        'metrics': {'enabled': False},
+        'circuit_breaker': {'enabled': False},
+        'last_good': {'enabled': False},
+        'trading_calendar': {'path': f"{data}/calendar.json", 'state_path': f"{data}/latest.json"},
+        'metric_registry': {
+            'cn': {'display': ['pb.y10.mcw.cvpos', {'key': 'dyr.mcw', 'label': "股息"}]},
+            'stock': {'display': ['pb', 'dyr']},
+        },
+    }
+
+def test_display_columns_appear_before_rating(config):
+    bot = IndexValuationBot(config=config)
+    message = bot.format_message({'data': [
+        {'stockCode': '000300', RATING: 0.15, 'pb.y10.mcw.cvpos': 0.2, 'dyr.mcw': 0.0312},
+        {'stockCode': '000905', RATING: 0.55},
+    ]}, DATE)
+    bot.close()
+    assert message.split('\n')[3:5] == [
+        "📈 **沪深300** | 估值: **15.0%** | PB 10年分位: 20.0% | 股息: 3.12% | 🟢 低估  ",
+        "📈 **指数000905** | 估值: **55.0%** | 🟠 适中  ",
+    ]
+
+def test_stock_display_columns(config):
+    bot = StockValuationBot(config=config)
+    message = bot.format_message({'data': [
+        {'stockCode': '600519', 'pe_ttm': 25.678, 'pe_ttm.y10.cvpos': 0.3, 'pb': 8.1, 'dyr': 0.015},
+    ]}, DATE)
+    bot.close()
+    assert message.split('\n')[3] == (
+        "📈 **贵州茅台(600519)** | PE: **25.68** | 百分位: 10年: 30.0% | PB: 8.10 | 股息率: 1.50% | 🟡 偏低  "
+    )
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import metrics
+from metrics import MetricsRecorder
+
+class FakeSession:
+    def __init__(self):
+        self.retries = 0
+    
+    def stats(self):
+        return {'open.lixinger.com': {'retries': self.retries}}
+
+@pytest.fixture
+def clock(monkeypatch):
+    ticks = iter([10.0, 10.25, 20.0, 20.5])
+    monkeypatch.setattr(metrics.time, 'perf_counter', lambda: next(ticks))
+    monkeypatch.setattr(metrics.time, 'time', lambda: 1700000000.0)
+
+def read_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_jsonl_line_per_stage(tmp_path, clock):
+    path = str(tmp_path / 'metrics' / 'bot_metrics.jsonl')
+    session = FakeSession()
+    recorder = MetricsRecorder('cn', path=path, session=session)
+    with recorder.stage('fetch') as stage:
+        session.retries += 2
+        stage['items'] = 3
+        stage['payload_bytes'] = 120
+    with pytest.raises(RuntimeError):
+        with recorder.stage('send'):
+            raise RuntimeError("down")
+    
+    assert read_lines(path) == [
+        {'ts': 1700000000.0, 'bot': 'cn', 'stage': 'fetch', 'duration_ms': 250.0, 'success': True,
+         'items': 3, 'payload_bytes': 120, 'retries': 2},
+        {'ts': 1700000000.0, 'bot': 'cn', 'stage': 'send', 'duration_ms': 500.0, 'success': False,
+         'items': None, 'payload_bytes': None, 'retries': 0, 'error': 'down'},
+    ]
+
+def test_prometheus_textfile_keeps_latest_entry_per_stage(tmp_path, clock):
+    recorder = MetricsRecorder('hk', format='prometheus', textfile_dir=str(tmp_path))
+    with recorder.stage('fetch') as stage:
+        stage['items'] = 5
+    with recorder.stage('send') as stage:
+        stage['success'] = False
+    
+    text = (tmp_path / 'hk.prom').read_text(encoding='utf-8')
+    assert text == '\n'.join([
+        '# HELP bot_stage_duration_seconds 阶段耗时',
+        '# TYPE bot_stage_duration_seconds gauge',
+        'bot_stage_duration_seconds{bot="hk",stage="fetch"} 0.25',
+        'bot_stage_duration_seconds{bot="hk",stage="send"} 0.5',
+        '# HELP bot_stage_success 阶段是否成功',
+        '# TYPE bot_stage_success gauge',
+        'bot_stage_success{bot="hk",stage="fetch"} 1',
+        'bot_stage_success{bot="hk",stage="send"} 0',
+        '# HELP bot_stage_items 处理条目数',
+        '# TYPE bot_stage_items gauge',
+        'bot_stage_items{bot="hk",stage="fetch"} 5',
+        '# HELP bot_stage_payload_bytes 数据大小',
+        '# TYPE bot_stage_payload_bytes gauge',
+        '# HELP bot_stage_retries HTTP重试次数',
+        '# TYPE bot_stage_retries gauge',
+        'bot_stage_retries{bot="hk",stage="fetch"} 0',
+        'bot_stage_retries{bot="hk",stage="send"} 0',
+        '# HELP bot_stage_last_run_timestamp_seconds 最近运行时间',
+        '# TYPE bot_stage_last_run_timestamp_seconds gauge',
+        'bot_stage_last_run_timestamp_seconds{bot="hk",stage="fetch"} 1700000000.0',
+        'bot_stage_last_run_timestamp_seconds{bot="hk",stage="send"} 1700000000.0',
+    ]) + '\n'
+    assert not list(tmp_path.glob('*.tmp'))
+
+def test_disabled_recorder_writes_nothing(tmp_path, clock):
+    path = tmp_path / 'bot_metrics.jsonl'
+    recorder = MetricsRecorder('cn', path=str(path), enabled=False)
+    with recorder.stage('fetch'):
+        pass
+    assert not path.exists()
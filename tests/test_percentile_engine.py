@@ -0,0 +1,131 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from metric_registry import MetricRegistry
+from percentile_engine import PercentileEngine, RollingPercentile
+
+def days(count, start='2020-01-01'):
+    first = datetime.strptime(start, '%Y-%m-%d')
+    return [first + timedelta(days=i) for i in range(count)]
+
+def response(date, values, metric='pe_ttm.mcw'):
+    return {'data': [{'stockCode': code, 'date': f"{date}T00:00:00+08:00", metric: value}
+                     for code, value in values.items()]}
+
+def write_backfill(path, market, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE valuations (market TEXT, stock_code TEXT, date TEXT, metrics TEXT)")
+    conn.executemany("INSERT INTO valuations VALUES (?, ?, ?, ?)",
+                     [(market, code, date, json.dumps(metrics)) for code, date, metrics in rows])
+    conn.commit()
+    conn.close()
+
+def test_rolling_percentile_matches_cvpos_and_expires_old_days():
+    window = RollingPercentile(1)
+    dates = days(3, '2020-01-01') + [datetime(2021, 1, 2)]
+    assert window.append(dates[0], 10.0) == 0.0
+    assert window.append(dates[1], 20.0) == 1.0
+    assert window.append(dates[2], 15.0) == 0.5
+    # 窗口为 (2020-01-02, 2021-01-02]，前两天已移出
+    assert window.append(dates[3], 30.0) == 1.0
+    assert len(window) == 2
+    with pytest.raises(ValueError):
+        window.append(dates[3], 1.0)
+
+def test_restore_keeps_sorted_state():
+    window = RollingPercentile(3)
+    for day, value in zip(days(5), [5.0, 1.0, 4.0, 2.0, 3.0]):
+        window.append(day, value)
+    restored = RollingPercentile.restore(3, window.last_date, window.entries())
+    assert restored.sorted_values() == [1.0, 2.0, 3.0, 4.0, 5.0]
+    next_day = window.last_date + timedelta(days=1)
+    assert restored.append(next_day, 2.5) == window.append(next_day, 2.5)
+
+def test_update_persists_and_skips_seen_days(tmp_path):
+    path = str(tmp_path / 'state.db')
+    engine = PercentileEngine('pe_ttm.mcw', [3, 10], 'cn', path)
+    assert engine.update(response('2024-01-02', {'000300': 10.0, '000905': 20.0}), '2024-01-02') == 2
+    assert engine.update(response('2024-01-03', {'000300': 12.0}), '2024-01-03') == 1
+    # 同一天重复运行不重复追加
+    assert engine.update(response('2024-01-03', {'000300': 12.0}), '2024-01-03') == 0
+    engine.close()
+    
+    reopened = PercentileEngine('pe_ttm.mcw', [3, 10], 'cn', path)
+    assert reopened.latest('000300') == {
+        'pe_ttm.y3.mcw.cvpos': 1.0, 'pe_ttm.y10.mcw.cvpos': 1.0, 'date': '2024-01-03', 'pe_ttm.mcw': 12.0
+    }
+    assert reopened.update(response('2024-01-04', {'000300': 11.0}), '2024-01-04') == 1
+    assert reopened.latest('000300')['pe_ttm.y10.mcw.cvpos'] == 0.5
+    reopened.close()
+
+def test_update_inserts_one_row_per_code_and_prunes_expired_days(tmp_path):
+    path = str(tmp_path / 'state.db')
+    engine = PercentileEngine('pe_ttm.mcw', [1], 'cn', path)
+    engine.update(response('2024-01-02', {'000300': 10.0, '000905': 20.0}), '2024-01-02')
+    engine.update(response('2024-06-03', {'000300': 12.0, '000905': 'N/A'}), '2024-06-03')
+    engine.update(response('2025-01-03', {'000300': 11.0}), '2025-01-03')
+    engine.close()
+    
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT code, date, value FROM observations ORDER BY code, date").fetchall()
+    conn.close()
+    # 2024-01-02 已移出 000300 的一年窗口；000905 缺失数值的日期只记录日期
+    assert rows == [
+        ('000300', '2024-06-03', 12.0), ('000300', '2025-01-03', 11.0),
+        ('000905', '2024-01-02', 20.0), ('000905', '2024-06-03', None),
+    ]
+    
+    reopened = PercentileEngine('pe_ttm.mcw', [1], 'cn', path)
+    assert reopened.latest('000300') == {'pe_ttm.y1.mcw.cvpos': 0.0, 'date': '2025-01-03', 'pe_ttm.mcw': 11.0}
+    assert reopened.latest('000905')['date'] == '2024-01-02'
+    # 恢复后窗口推进到末尾的空值日，同一天不再追加
+    assert reopened.update(response('2024-06-03', {'000905': 21.0}), '2024-06-03') == 0
+    assert reopened.update(response('2025-01-03', {'000905': 21.0}), '2025-01-03') == 1
+    assert reopened.latest('000905')['pe_ttm.y1.mcw.cvpos'] == 0.0
+    reopened.close()
+
+def test_history_rows_only_add_horizons_missing_from_response(tmp_path):
+    engine = PercentileEngine('pe_ttm.mcw', [3, 7], 'cn', str(tmp_path / 'state.db'))
+    engine.update(response('2024-01-02', {'000300': 10.0}), '2024-01-02')
+    data = response('2024-01-03', {'000300': 12.0})
+    data['data'][0]['pe_ttm.y3.mcw.cvpos'] = 0.8
+    engine.update(data, '2024-01-03')
+    assert engine.history_rows(data, '2024-01-03') == [('2024-01-03', '000300', 'pe_ttm.y7.mcw.cvpos', 1.0)]
+    engine.close()
+
+def test_open_seeds_from_backfill_once(tmp_path):
+    backfill_path = str(tmp_path / 'backfill.db')
+    write_backfill(backfill_path, 'cn', [
+        ('000300', '2024-01-02', {'pe_ttm.mcw': 10.0}),
+        ('000300', '2024-01-03', {'pe_ttm.mcw': 30.0}),
+    ])
+    config = {
+        'backfill': {'db_path': backfill_path},
+        'percentile_engine': {'enabled': True, 'path': str(tmp_path / 'state.db'), 'horizons': [5]},
+    }
+    engine = PercentileEngine.open(config, 'cn')
+    assert engine.latest('000300')['pe_ttm.y5.mcw.cvpos'] == 1.0
+    engine.close()
+    
+    # 已有状态时不再重放回填数据库
+    write_backfill(str(tmp_path / 'other.db'), 'cn', [])
+    config['backfill']['db_path'] = str(tmp_path / 'other.db')
+    engine = PercentileEngine.open(config, 'cn')
+    assert engine.update(response('2024-01-04', {'000300': 20.0}), '2024-01-04') == 1
+    assert engine.latest('000300')['pe_ttm.y5.mcw.cvpos'] == 0.5
+    engine.close()
+    
+    # 窗口配置变化时重建
+    config['percentile_engine']['horizons'] = [3]
+    engine = PercentileEngine.open(config, 'cn')
+    assert engine.latest('000300') is None
+    engine.close()
+
+def test_engine_metric_fetched_only_when_enabled():
+    assert 'pe_ttm.mcw' not in MetricRegistry.from_config({}, 'cn').metrics_list
+    config = {'percentile_engine': {'enabled': True}}
+    assert 'pe_ttm.mcw' in MetricRegistry.from_config(config, 'cn').metrics_list
+    assert PercentileEngine.open({}, 'cn') is None
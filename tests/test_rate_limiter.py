@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from rate_limiter import RateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+    
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(time, 'monotonic', clock)
+    return clock
+
+def test_allows_burst_up_to_capacity(clock):
+    limiter = RateLimiter(rate=1.0, capacity=3)
+    assert [limiter.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+def test_refills_at_rate_without_exceeding_capacity(clock):
+    limiter = RateLimiter(rate=2.0, capacity=2)
+    limiter.try_acquire()
+    limiter.try_acquire()
+    assert limiter.wait_time() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    clock.now += 60
+    assert [limiter.try_acquire() for _ in range(3)] == [True, True, False]
+
+def test_per_minute(clock):
+    limiter = RateLimiter.per_minute(30)
+    assert limiter.rate == pytest.approx(0.5)
+    assert limiter.try_acquire()
+    assert limiter.wait_time() == pytest.approx(2.0)
+
+def test_acquire_sleeps_until_token_available(clock, monkeypatch):
+    sleeps = []
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+    monkeypatch.setattr(time, 'sleep', fake_sleep)
+    limiter = RateLimiter(rate=4.0, capacity=1)
+    limiter.acquire()
+    limiter.acquire()
+    assert sleeps == [pytest.approx(0.25)]
@@ -0,0 +1,168 @@
+import pytest
+
+import indicator
+from hk_index_valuation import HKIndexValuationBot
+from index_valuation import IndexValuationBot
+from indicator import IndicatorBot
+from report_renderer import TEXT
+from stock_valuation import StockValuationBot
+
+# 以下期望值为改用模板渲染之前各机器人 format_message 的输出
+DATE = '2024-01-02'
+RATING = 'pe_ttm.y10.mcw.cvpos'
+LEGEND = [
+    "🟢 **0-20%**: 低估区域",
+    "🟡 **20-40%**: 偏低区域",
+    "🟠 **40-60%**: 适中区域",
+    "🔴 **60-80%**: 偏高区域",
+    "🔴 **80-100%**: 高估区域",
+]
+
+def valuation_tail(line_end):
+    return ["", "---", "", "💡 **估值说明**", "", "百分位越低表示估值越便宜：", ""] + [line + line_end for line in LEGEND]
+
+CN_FULL = [
+    "📈 **沪深300** | 估值: **15.0%** | 🟢 低估  ",
+    "📈 **指数000905** | 估值: **55.0%** | 🟠 适中  ",
+    "📈 **指数399006** | 状态: ❌ 数据获取失败  ",
+    "📈 **指数000016** | 估值: **85.3%** | 🔴 高估  ",
+]
+HK_FULL = [
+    "📈 **恒生指数** | 估值: **25.0%** | 🟡 偏低",
+    "📈 **指数HSCEI** | 状态: ❌ 数据获取失败",
+    "📈 **指数HSTECH** | 估值: **5.0%** | 🟢 低估",
+]
+STOCK_FULL = [
+    "📈 **贵州茅台(600519)** | PE: **25.68** | 百分位: 3年: 10.0% | 5年: 20.0% | 10年: 30.0% | 🟡 偏低  ",
+    "📈 **股票000001(000001)** | PE: **5.10** | 百分位: 5年: 65.0% | 🔴 偏高  ",
+    "📈 **股票300750(300750)** | PE: **30.00**  ",
+    "📈 **股票000002(000002)** | 状态: ❌ 数据获取失败  ",
+    "📈 **股票()** | 状态: ❌ 数据获取失败  ",
+]
+# 机器人类, 标题, 获取失败时的消息, 行分隔符, 行尾, 测试数据, 期望的数据行
+BOTS = {
+    'cn': (IndexValuationBot, "📊 **指数估值播报**", "📊 指数估值数据获取失败", "\n", "  ", [
+        {'stockCode': '000300', RATING: 0.15},
+        {'stockCode': '000905', RATING: 0.55},
+        {'stockCode': '399006'},
+        {'stockCode': '000016', RATING: 0.853},
+    ], CN_FULL),
+    'hk': (HKIndexValuationBot, "🇭🇰 **港股指数估值播报**", "📊 港股指数估值数据获取失败", "\n\n", "", [
+        {'stockCode': 'HSI', RATING: 0.25},
+        {'stockCode': 'HSCEI', RATING: None},
+        {'stockCode': 'HSTECH', RATING: 0.05},
+    ], HK_FULL),
+    'stock': (StockValuationBot, "📊 **股票估值播报**", "📊 股票估值数据获取失败", "\n", "  ", [
+        {'stockCode': '600519', 'pe_ttm': 25.678, 'pe_ttm.y3.cvpos': 0.1, 'pe_ttm.y5.cvpos': 0.2,
+         'pe_ttm.y10.cvpos': 0.3},
+        {'stockCode': '000001', 'pe_ttm': 5.1, 'pe_ttm.y5.cvpos': 0.65},
+        {'stockCode': '300750', 'pe_ttm': 30.0},
+        {'stockCode': '000002'},
+        {'stockCode': None},
+    ], STOCK_FULL),
+}
+
+@pytest.fixture
+def config(tmp_path):
+    data = str(tmp_path)
+    market = {
+        'lixinger': {'token': 't', 'api_url': 'https://example.com/api'},
+        'dingtalk': {'webhook_url': 'https://oapi.dingtalk.com/robot/send?access_token=test'},
+        'stock_codes': [],
+    }
+    return {
+        'cn_config': dict(market, index_names={'000300': '沪深300'}),
+        'hk_config': dict(market, index_names={'HSI': '恒生指数'}),
+        'stock_config': dict(market, stock_names={'600519': '贵州茅台'}),
+        'indicator_config': dict(market),
+        'lixinger_cache': {'enabled': False},
+        'indicator_store': {'enabled': False},
+        'change_detection': {'path': f"{data}/reported.db"},
+        'history_store': {'enabled': False},
+        'metrics': {'enabled': False},
+        'circuit_breaker': {'enabled': False},
+        'last_good': {'enabled': False},
+        'trading_calendar': {'path': f"{data}/calendar.json", 'state_path': f"{data}/latest.json"},
+    }
+
+@pytest.fixture(params=list(BOTS))
+def case(request, config):
+    bot_class, heading, unavailable, separator, line_end, rows, lines = BOTS[request.param]
+    bot = bot_class(config=config)
+    yield bot, heading, unavailable, separator, line_end, rows, lines
+    bot.close()
+
+def test_valuation_report_matches_previous_output(case):
+    bot, heading, _, separator, line_end, rows, lines = case
+    expected = [heading, f"📅 **日期**: {DATE}", ""] + lines + valuation_tail(line_end)
+    assert bot.format_message({'data': rows}, DATE) == separator.join(expected)
+
+def test_valuation_report_without_rows(case):
+    bot, heading, _, separator, line_end, _, _ = case
+    expected = [heading, f"📅 **日期**: {DATE}", ""] + valuation_tail(line_end)
+    assert bot.format_message({'data': []}, DATE) == separator.join(expected)
+
+def test_valuation_report_when_data_unavailable(case):
+    bot, _, unavailable, _, _, _, _ = case
+    assert bot.format_message(None, DATE) == unavailable
+    assert bot.format_message({'code': 1}, DATE) == unavailable
+
+def test_valuation_report_when_rows_cannot_be_parsed(case):
+    bot, heading, _, separator, _, _, _ = case
+    expected = [heading, f"📅 **日期**: {DATE}", "", "❌ 数据解析失败"]
+    assert bot.format_message({'data': [None]}, DATE) == separator.join(expected)
+
+def test_text_output_strips_markup(case):
+    bot, _, _, _, _, rows, _ = case
+    text = bot.format_message({'data': rows}, DATE, output_format=TEXT)
+    assert '**' not in text and '\n\n\n' not in text
+    assert not any(line.endswith(' ') for line in text.split('\n'))
+
+INDICATOR_NOTES = [
+    "---", "", "💡 **数据说明**", "",
+    "📊 股债利差：股票收益率与债券收益率的差值",
+    "💰 巴菲特指标：股市总市值与GDP的比值",
+    "📈 市盈率分位数：当前估值在历史数据中的相对位置",
+]
+EBS = {'日期': DATE, '沪深300指数': 3500.12, '股债利差': 0.0512, '股债利差均线': 0.048}
+BUFFETT = {'日期': DATE, '收盘价': 3000.0, '总市值': 80.5, 'GDP': 120.0, '近十年分位数': 0.4, '总历史分位数': 0.55}
+PE = {
+    '日期': DATE,
+    '全A股滚动市盈率(TTM)中位数': 30.1,
+    '当前"TTM(滚动市盈率)中位数"在最近10年数据上的分位数': 0.4567,
+    '当前"TTM(滚动市盈率)等权平均"在在最近10年数据上的分位数': '缺失',
+}
+
+@pytest.fixture
+def indicator_bot(config, monkeypatch):
+    monkeypatch.setattr(indicator, 'memo', lambda name, func: DATE)
+    return IndicatorBot(config=config)
+
+@pytest.mark.parametrize('data, lines', [
+    ({'股债利差': EBS, '巴菲特指标': BUFFETT, 'A股市盈率指标': PE}, [
+        "📈 **股债利差**", f"📊 日期: {DATE}", "📊 沪深300指数: 3500.12", "📊 股债利差: 0.0512",
+        "📊 股债利差均线: 0.048", "",
+        "💰 **巴菲特指标**", f"📊 日期: {DATE}", "📊 收盘价: 3000.0", "📊 总市值: 80.5", "📊 GDP: 120.0",
+        "📊 近十年分位数: 0.4", "📊 总历史分位数: 0.55", "",
+        "📈 **A股市盈率指标**", f"📅 日期: {DATE}", "📊 全A股滚动市盈率(TTM)中位数: 30.1",
+        '📊 当前"TTM(滚动市盈率)中位数"在最近10年数据上的分位数: 45.7%',
+        '📊 当前"TTM(滚动市盈率)等权平均"在在最近10年数据上的分位数: 缺失', "",
+    ]),
+    ({'股债利差': '数据为空', '巴菲特指标': '获取超时', 'A股市盈率指标': {'日期': DATE}}, [
+        "📈 **股债利差**", "❌ 数据为空", "",
+        "💰 **巴菲特指标**", "❌ 获取超时", "",
+        "📈 **A股市盈率指标**", f"📅 日期: {DATE}", "",
+    ]),
+    ({'股债利差': {'date': DATE, '股债利差': 0.05}}, ["📈 **股债利差**", f"📅 日期: {DATE}", "📊 股债利差: 0.05", ""]),
+    ({}, []),
+])
+def test_indicator_report_matches_previous_output(indicator_bot, data, lines):
+    expected = ["📊 **股票指标数据播报**", f"📅 **日期**: {DATE}", ""] + lines + INDICATOR_NOTES
+    assert indicator_bot.format_message(data) == "\n\n".join(expected)
+
+def test_indicator_report_when_formatting_fails(indicator_bot, monkeypatch):
+    def broken(*args, **kwargs):
+        raise ValueError("broken")
+    monkeypatch.setattr(indicator_bot.report_template, 'render', broken)
+    expected = ["📊 **股票指标数据播报**", f"📅 **日期**: {DATE}", "", "❌ 数据格式化失败"]
+    assert indicator_bot.format_message({'股债利差': EBS}) == "\n\n".join(expected)
@@ -0,0 +1,82 @@
+import json
+import sys
+
+import pytest
+
+import run_all
+from lixinger_cache import LixingerCache
+from run_all import UnifiedRunner
+
+class FakeBot:
+    sent = []
+    
+    def __init__(self, config=None, session=None, cache=None):
+        self.config = config
+        self.session = session
+        self.cache = cache
+        self.confirmed = False
+    
+    def run(self, date=None):
+        return True
+    
+    def build_message(self, date=None):
+        return f"{type(self).__name__} {date}"
+    
+    def send_to_dingtalk(self, message, title=None):
+        FakeBot.sent.append((title, message))
+        return True
+    
+    def confirm_changes(self):
+        self.confirmed = True
+    
+    def close(self):
+        pass
+
+class BrokenBot(FakeBot):
+    def run(self, date=None):
+        raise RuntimeError("boom")
+    
+    def build_message(self, date=None):
+        raise RuntimeError("boom")
+
+class FailingBot(FakeBot):
+    def run(self, date=None):
+        return False
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    FakeBot.sent = []
+    monkeypatch.setattr(run_all, 'PIPELINES', {'cn': FakeBot, 'hk': BrokenBot, 'stock': FailingBot})
+    return {
+        'metrics': {'enabled': False},
+        'lixinger_cache': {'enabled': False, 'path': str(tmp_path / 'cache.db')},
+        'indicator_store': {'enabled': False, 'path': str(tmp_path / 'indicator.db')},
+        'circuit_breaker': {'enabled': False, 'path': str(tmp_path / 'circuit_breaker.json')},
+    }
+
+def make_runner(config, pipelines, combine_report=False):
+    return UnifiedRunner(config=config, pipelines=pipelines, combine_report=combine_report, use_async=False,
+                         cache=LixingerCache(enabled=False))
+
+def test_failure_of_one_pipeline_does_not_stop_others(config):
+    runner = make_runner(config, ['cn', 'hk', 'stock'])
+    assert runner.run('2024-01-02') == {'cn': True, 'hk': False, 'stock': False}
+    runner.close()
+
+def test_combined_report_skips_failed_pipeline(config):
+    runner = make_runner(config, ['cn', 'hk'], combine_report=True)
+    assert runner.run('2024-01-02') == {'cn': True, 'hk': False}
+    assert FakeBot.sent == [("每日估值汇总播报", "FakeBot 2024-01-02")]
+    assert runner.bots['cn'].confirmed and not runner.bots['hk'].confirmed
+    runner.close()
+
+@pytest.mark.parametrize('only, code', [(['cn'], 0), (['cn', 'hk'], 1), (['stock'], 1)])
+def test_main_exit_code(config, tmp_path, monkeypatch, only, code):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(config), encoding='utf-8')
+    monkeypatch.setattr(sys, 'argv', ['run_all.py', '--config', str(path), '--only', *only])
+    assert run_all.main() == code
+
+def test_main_exit_code_when_config_missing(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['run_all.py', '--config', str(tmp_path / 'missing.json')])
+    assert run_all.main() == 1
@@ -0,0 +1,174 @@
+import asyncio
+import threading
+import time
+
+import pandas as pd
+import pytest
+import requests
+
+from http_client import HttpClient
+from single_flight import AsyncSingleFlight, CoalescingModule, SingleFlight, default_group, request_key
+
+URL = "https://open.lixinger.com/api/cn/index/fundamental"
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.001)
+
+def run_concurrently(group, count, func, key='key'):
+    """count 个线程同时以同一个 key 调用，首个调用在其余调用都加入等待后才返回，返回各线程的结果或异常"""
+    release = threading.Event()
+    results = [None] * count
+    
+    def leader_func():
+        release.wait(5)
+        return func()
+    
+    def worker(i):
+        try:
+            results[i] = group.do(key, leader_func)
+        except Exception as e:
+            results[i] = e
+    
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: group.stats()['shared'] == count - 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_callers_share_one_call():
+    group = SingleFlight()
+    calls = []
+    results = run_concurrently(group, 4, lambda: calls.append(1) or 'value')
+    assert calls == [1]
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert {value for value, _ in results} == {'value'}
+    assert group.stats() == {'executed': 1, 'shared': 3}
+    # 调用结束后不再共享
+    assert group.do('key', lambda: 'again') == ('again', False)
+
+def test_exception_reaches_every_waiter():
+    group = SingleFlight()
+    error = ValueError("boom")
+    
+    def fail():
+        raise error
+    results = run_concurrently(group, 3, fail)
+    assert results == [error, error, error]
+    assert group.do('key', lambda: 'recovered') == ('recovered', False)
+
+def test_async_concurrent_callers_share_one_call():
+    group = AsyncSingleFlight()
+    calls = []
+    
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'data': []}
+    
+    async def main():
+        return await asyncio.gather(*(group.do('key', fetch) for _ in range(3)))
+    results = asyncio.run(main())
+    assert calls == [1]
+    assert results == [{'data': []}] * 3
+    assert group.stats() == {'executed': 1, 'shared': 2}
+
+def test_async_exception_reaches_every_waiter():
+    group = AsyncSingleFlight()
+    
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+    
+    async def main():
+        return await asyncio.gather(*(group.do('key', fail) for _ in range(3)), return_exceptions=True)
+    results = asyncio.run(main())
+    assert len(results) == 3 and all(isinstance(result, ValueError) for result in results)
+    assert group.stats()['executed'] == 1
+
+def test_coalescing_module_gives_waiters_their_own_copy():
+    group = SingleFlight()
+    release = threading.Event()
+    frame = pd.DataFrame({'pe': [10.0, 20.0]})
+    calls = []
+    
+    class Module:
+        @staticmethod
+        def stock_ebs_lg():
+            calls.append(1)
+            release.wait(5)
+            return frame
+    
+    module = CoalescingModule(Module, group=group, prefix='akshare')
+    results = [None] * 3
+    
+    def worker(i):
+        results[i] = module.stock_ebs_lg()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: group.stats()['shared'] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    
+    assert calls == [1]
+    assert sum(result is frame for result in results) == 1
+    assert all(result.equals(frame) for result in results)
+    # 等待者得到各自的副本，修改互不影响
+    first, second = [result for result in results if result is not frame]
+    first.loc[0, 'pe'] = -1.0
+    assert second.loc[0, 'pe'] == 10.0 and frame.loc[0, 'pe'] == 10.0
+
+def test_request_key_covers_params_and_headers():
+    base = request_key('GET', URL, None, {'a': 1, 'b': 2}, {'Accept': 'application/json'})
+    assert base == request_key('get', URL, None, {'b': 2, 'a': 1}, {'accept': 'application/json'})
+    assert base != request_key('GET', URL, None, {'a': 1, 'b': 3}, {'Accept': 'application/json'})
+    assert base != request_key('GET', URL, None, {'a': 1, 'b': 2}, {'Accept': 'text/csv'})
+    assert base != request_key('GET', URL, None, None, {'Accept': 'application/json'})
+
+@pytest.fixture
+def slow_server(monkeypatch):
+    """请求在全部调用方发出后才返回，记录每次实际发送的查询参数和请求头"""
+    sent = []
+    release = threading.Event()
+    
+    def fake_request(self, method, url, **kwargs):
+        sent.append((kwargs.get('params'), kwargs.get('headers')))
+        release.wait(5)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = repr(kwargs.get('params')).encode('utf-8')
+        return response
+    monkeypatch.setattr(requests.Session, 'request', fake_request)
+    return sent, release
+
+def test_client_only_coalesces_identical_params_and_headers(slow_server):
+    sent, release = slow_server
+    client = HttpClient(max_retries=0)
+    calls = [
+        {'params': {'page': 1}},
+        {'params': {'page': 1}},
+        {'params': {'page': 2}},
+        {'params': {'page': 1}, 'headers': {'Authorization': 'other'}},
+    ]
+    results = [None] * len(calls)
+    shared_before = default_group.stats()['shared']
+    
+    def worker(i):
+        results[i] = client.get(URL, **calls[i]).text
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(calls))]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: len(sent) == 3 and default_group.stats()['shared'] == shared_before + 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    
+    assert len(sent) == 3
+    assert results == ["{'page': 1}", "{'page': 1}", "{'page': 2}", "{'page': 1}"]
@@ -0,0 +1,88 @@
+import pytest
+
+from stock_valuation import StockValuationBot
+
+UNIVERSE_URL = "https://example.com/api/cn/company"
+API_URL = "https://example.com/api/cn/company/fundamental/non_financial"
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+        self.text = str(data)
+    
+    def json(self):
+        return self._data
+
+class FakeSession:
+    """全市场 250 只股票，failing 中的批次（按首个代码）返回 500"""
+    
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.open = False
+    
+    def circuit_open(self, url):
+        return self.open
+    
+    def post(self, url, json, headers=None, idempotent=None):
+        if url == UNIVERSE_URL:
+            return FakeResponse(200, {'data': [{'stockCode': f"{i:06d}", 'fsTableType': 'non_financial'}
+                                               for i in range(250)]})
+        if json['stockCodes'][0] in self.failing:
+            return FakeResponse(500, {})
+        return FakeResponse(200, {'data': [
+            {'stockCode': code, 'pe_ttm': 10.0, 'pe_ttm.y10.cvpos': 0.1} for code in json['stockCodes']
+        ]})
+
+def make_bot(tmp_path, session, max_failed_ratio=0.5):
+    data = str(tmp_path)
+    config = {
+        'stock_config': {
+            'lixinger': {'token': 't', 'api_url': API_URL},
+            'dingtalk': {'webhook_url': 'https://oapi.dingtalk.com/robot/send?access_token=test'},
+            'stock_codes': ['000001'],
+            'full_market': {'enabled': True, 'universe_api_url': UNIVERSE_URL, 'chunk_size': 100,
+                            'max_workers': 2, 'requests_per_minute': 60000,
+                            'max_failed_ratio': max_failed_ratio},
+        },
+        'lixinger_cache': {'enabled': False},
+        'change_detection': {'path': f"{data}/reported.db"},
+        'history_store': {'enabled': False},
+        'metrics': {'enabled': False},
+        'circuit_breaker': {'enabled': False},
+        'last_good': {'path': f"{data}/last_good.db"},
+        'trading_calendar': {'path': f"{data}/calendar.json", 'state_path': f"{data}/latest.json"},
+    }
+    return StockValuationBot(config=config, session=session)
+
+def test_complete_full_market_fetch(tmp_path):
+    bot = make_bot(tmp_path, FakeSession())
+    data = bot.get_full_market_valuation('2024-01-05')
+    assert len(data['data']) == 250
+    assert 'incomplete' not in data
+
+def test_partial_failure_is_flagged_and_not_recorded(tmp_path):
+    bot = make_bot(tmp_path, FakeSession(failing={'000100'}))
+    data = bot.get_full_market_valuation('2024-01-05')
+    assert len(data['data']) == 150
+    assert data['incomplete']
+    
+    selected = bot.select_changes(data, '2024-01-05')
+    assert bot._pending_changes == []
+    assert "部分数据获取失败" in bot.format_message(selected, '2024-01-05')
+    bot.change_detector.close()
+
+def test_too_many_failed_chunks_fail_the_fetch(tmp_path):
+    bot = make_bot(tmp_path, FakeSession(failing={'000000', '000100'}))
+    assert bot.get_full_market_valuation('2024-01-05') is None
+
+def test_last_known_good_works_with_cache_disabled(tmp_path):
+    session = FakeSession()
+    bot = make_bot(tmp_path, session)
+    data = bot.get_full_market_valuation('2024-01-05')
+    bot.save_history(data, '2024-01-05')
+    assert bot.last_known_good('2024-01-08') == (None, '2024-01-08')
+    
+    session.open = True
+    assert bot.last_known_good('2024-01-08') == (data, '2024-01-05')
+    bot.close()
@@ -0,0 +1,74 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import trading_calendar
+from trading_calendar import LatestDateResolver, TradingCalendar
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 1, 5, 15, 40)
+
+@pytest.fixture
+def resolver(tmp_path, monkeypatch):
+    monkeypatch.setattr(trading_calendar, 'datetime', FixedDatetime)
+    calendar = TradingCalendar(path=str(tmp_path / 'calendar.json'), hk_holidays=['2024-01-03'])
+    return LatestDateResolver(calendar, str(tmp_path / 'latest.json'), max_probes=3, recheck_minutes=30)
+
+@pytest.fixture
+def clock(monkeypatch):
+    state = {'now': 1_000_000.0}
+    monkeypatch.setattr(time, 'time', lambda: state['now'])
+    return state
+
+class Probe:
+    def __init__(self, published):
+        self.published = set(published)
+        self.calls = []
+    
+    def __call__(self, date):
+        self.calls.append(date)
+        return date in self.published
+
+def test_trading_days_skip_weekends_and_holidays(tmp_path):
+    calendar = TradingCalendar(path=str(tmp_path / 'calendar.json'), hk_holidays=['2024-01-03'])
+    days = calendar.trading_days('hk', datetime(2024, 1, 1), datetime(2024, 1, 8))
+    assert days == ['2024-01-01', '2024-01-02', '2024-01-04', '2024-01-05', '2024-01-08']
+    assert calendar.recent_trading_days('hk', datetime(2024, 1, 5), 3) == ['2024-01-05', '2024-01-04', '2024-01-02']
+
+def test_latest_trading_day_is_kept_for_the_day(resolver, clock):
+    probe = Probe({'2024-01-05'})
+    assert resolver.resolve('cn_index', 'hk', probe) == '2024-01-05'
+    clock['now'] += 6 * 3600
+    assert resolver.resolve('cn_index', 'hk', probe) == '2024-01-05'
+    assert probe.calls == ['2024-01-05']
+
+def test_unpublished_day_is_rechecked(resolver, clock):
+    probe = Probe({'2024-01-04'})
+    assert resolver.resolve('cn_index', 'hk', probe) == '2024-01-04'
+    assert probe.calls == ['2024-01-05', '2024-01-04']
+    
+    # 复查间隔内沿用结果，不再探测
+    clock['now'] += 10 * 60
+    assert resolver.resolve('cn_index', 'hk', probe) == '2024-01-04'
+    assert len(probe.calls) == 2
+    
+    # 超过复查间隔后重新探测，数据已发布
+    probe.published.add('2024-01-05')
+    clock['now'] += 25 * 60
+    assert resolver.resolve('cn_index', 'hk', probe) == '2024-01-05'
+    assert probe.calls[2:] == ['2024-01-05']
+
+def test_no_data_returns_none(resolver, clock):
+    probe = Probe(set())
+    assert resolver.resolve('cn_index', 'hk', probe) is None
+    assert probe.calls == ['2024-01-05', '2024-01-04', '2024-01-02']
+
+def test_has_data_requires_rating_metric():
+    rating = ['pe_ttm.y10.mcw.cvpos']
+    assert not LatestDateResolver.has_data(None, rating)
+    assert not LatestDateResolver.has_data({'data': []}, rating)
+    assert not LatestDateResolver.has_data({'data': [{'stockCode': '000300', 'pe_ttm.mcw': 12.3}]}, rating)
+    assert LatestDateResolver.has_data({'data': [{'stockCode': '000300', 'pe_ttm.y10.mcw.cvpos': 0.3}]}, rating)
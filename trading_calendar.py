@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from cassette import memo
+
+logger = logging.getLogger(__name__)
+
+# 同一进程内多个机器人共用状态文件时的写入锁
+_state_lock = threading.Lock()
+
+def _load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _save_json(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _weekdays(start, end, holidays=()):
+    """生成 start 到 end 之间的工作日（排除指定节假日）"""
+    holidays = set(holidays)
+    day = start
+    days = []
+    while day <= end:
+        date = day.strftime('%Y-%m-%d')
+        if day.weekday() < 5 and date not in holidays:
+            days.append(date)
+        day += timedelta(days=1)
+    return days
+
+class TradingCalendar:
+    """A股/港股交易日历，本地缓存
+    
+    A股日历来自 akshare 的新浪交易日历，缓存 refresh_days 天；获取失败时退化为工作日。
+    港股没有可用的免费日历接口，使用工作日并排除配置中的 hk_holidays。
+    """
+    
+    def __init__(self, path='data/trading_calendar.json', refresh_days=30, hk_holidays=None):
+        self.path = path
+        self.refresh_days = refresh_days
+        self.hk_holidays = hk_holidays or []
+        self._calendars = {}
+    
+    def _load_cn(self):
+        cached = _load_json(self.path).get('cn')
+        if cached and time.time() - cached['fetched_at'] < self.refresh_days * 86400:
+            return cached['days']
+        
+        try:
+            from indicator import load_akshare
+            
+            df = load_akshare().tool_trade_date_hist_sina()
+            days = sorted(str(value)[:10] for value in df['trade_date'])
+        except Exception as e:
+            logger.error(f"获取A股交易日历失败，使用工作日代替: {e}")
+            if cached:
+                return cached['days']
+            return None
+        
+        with _state_lock:
+            data = _load_json(self.path)
+            data['cn'] = {'fetched_at': time.time(), 'days': days}
+            _save_json(self.path, data)
+        logger.info(f"A股交易日历已更新，共 {len(days)} 天")
+        return days
+    
+    def trading_days(self, market, start, end):
+        """返回 [start, end] 区间内的交易日（YYYY-MM-DD，升序）"""
+        start_str, end_str = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+        if market == 'cn':
+            if 'cn' not in self._calendars:
+                self._calendars['cn'] = self._load_cn()
+            days = self._calendars['cn']
+            # 日历覆盖到区间末尾时才使用，否则退化为工作日
+            if days and days[-1] >= end_str:
+                return [day for day in days if start_str <= day <= end_str]
+            return _weekdays(start, end)
+        return _weekdays(start, end, self.hk_holidays)
+    
+    def recent_trading_days(self, market, end, count):
+        """返回截至 end（含）的最近 count 个交易日，按日期倒序"""
+        days = self.trading_days(market, end - timedelta(days=count * 3 + 14), end)
+        return list(reversed(days))[:count]
+
+class LatestDateResolver:
+    """查找已发布数据的最近交易日，并记住结果
+    
+    从今天开始按交易日倒序探测，通常第一次探测即命中；探测使用与正式请求相同的参数，
+    结果会写入理杏仁缓存，随后的正式获取直接命中缓存。
+    解析到最近一个交易日时当天内不再探测；最近交易日的数据尚未发布、解析到更早的日期时，
+    结果只保留 recheck_minutes 分钟，之后重新探测，避免发布前的一次探测锁定整天。
+    """
+    
+    def __init__(self, calendar, state_path='data/latest_date.json', max_probes=5, recheck_minutes=30):
+        self.calendar = calendar
+        self.state_path = state_path
+        self.max_probes = max_probes
+        self.recheck_minutes = recheck_minutes
+    
+    @classmethod
+    def from_config(cls, config):
+        """根据完整配置中的 trading_calendar 段创建解析器"""
+        options = dict(config.get('trading_calendar', {}))
+        state_path = options.pop('state_path', 'data/latest_date.json')
+        max_probes = options.pop('max_probes', 5)
+        recheck_minutes = options.pop('recheck_minutes', 30)
+        return cls(TradingCalendar(**options), state_path, max_probes, recheck_minutes)
+    
+    @staticmethod
+    def has_data(valuation_data, rating_metrics):
+        """响应中是否至少有一条记录包含评级使用的指标（任一即可）"""
+        if not valuation_data or not valuation_data.get('data'):
+            return False
+        return any(
+            item.get(metric) is not None
+            for item in valuation_data['data']
+            for metric in rating_metrics
+        )
+    
+    def resolve(self, key, market, probe):
+        """返回最新的有数据日期，失败时返回 None
+        
+        key 为状态文件中的记录名，probe(date) 返回该日期是否已有数据。
+        录制时记录解析结果，回放时直接使用，不再探测。
+        """
+        return memo(f"latest_date:{key}", lambda: self._resolve(key, market, probe))
+    
+    def _resolve(self, key, market, probe):
+        today = datetime.now().strftime('%Y-%m-%d')
+        candidates = self.calendar.recent_trading_days(market, datetime.now(), self.max_probes)
+        with _state_lock:
+            state = _load_json(self.state_path).get(key)
+        if state and state.get('resolved_on') == today:
+            if candidates and state['date'] == candidates[0]:
+                logger.info(f"使用今日已确定的最新数据日期: {state['date']}")
+                return state['date']
+            if time.time() - state.get('resolved_at', 0) < self.recheck_minutes * 60:
+                logger.info(f"{candidates[0] if candidates else today} 数据尚未发布，"
+                            f"暂用最近探测到的日期: {state['date']}")
+                return state['date']
+        
+        for probes, date in enumerate(candidates, 1):
+            logger.info(f"探测 {date} 是否已有估值数据...")
+            if probe(date):
+                logger.info(f"最新数据日期: {date}（探测 {probes} 次）")
+                with _state_lock:
+                    data = _load_json(self.state_path)
+                    data[key] = {'resolved_on': today, 'resolved_at': time.time(), 'date': date}
+                    _save_json(self.state_path, data)
+                return date
+        
+        logger.warning(f"最近 {len(candidates)} 个交易日均无数据")
+        return None
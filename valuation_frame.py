@@ -0,0 +1,90 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 百分位评级区间：百分位（0-100）<= 上限即属于该区间
+VALUATION_BANDS = [
+    (20, "🟢 低估"),
+    (40, "🟡 偏低"),
+    (60, "🟠 适中"),
+    (80, "🔴 偏高"),
+    (float('inf'), "🔴 高估"),
+]
+
+def load_frame(valuation_data, columns):
+    """将理杏仁响应的 data 列表转换为 DataFrame，缺失的列补为 NaN
+    
+    pandas 在此处延迟导入，避免拖慢机器人启动。
+    """
+    import pandas as pd
+    
+    records = valuation_data.get('data') or []
+    if records and any(isinstance(value, dict) for value in records[0].values()):
+        # 按层级返回的指标（{"pe_ttm": {"y10": {"mcw": {"cvpos": ...}}}}）整体展开为扁平指标名
+        frame = pd.json_normalize(records, sep='.')
+    else:
+        frame = pd.DataFrame.from_records(records)
+    for column in ['stockCode'] + list(columns):
+        if column not in frame.columns:
+            frame[column] = None
+    frame['stockCode'] = frame['stockCode'].fillna('').astype(str)
+    for column in columns:
+        frame[column] = pd.to_numeric(frame[column], errors='coerce')
+    return frame
+
+def fallback_percentile(frame, columns):
+    """按 columns 顺序取第一个有效的百分位
+    
+    与原实现 `pe_10y_pos or pe_5y_pos or pe_3y_pos` 语义一致：
+    缺失和 0 都视为无效并回退到下一个，最后一个直接使用。
+    """
+    import numpy as np
+    
+    result = frame[columns[-1]].to_numpy(dtype=float)
+    for column in reversed(columns[:-1]):
+        values = frame[column].to_numpy(dtype=float)
+        truthy = ~np.isnan(values) & (values != 0)
+        result = np.where(truthy, values, result)
+    return result
+
+def assign_bands(percentile):
+    """按百分位（0-1）批量评级，缺失值返回空字符串"""
+    import numpy as np
+    
+    percent = np.asarray(percentile, dtype=float) * 100
+    valid = ~np.isnan(percent)
+    conditions = [valid & (percent <= upper) for upper, _ in VALUATION_BANDS]
+    labels = [label for _, label in VALUATION_BANDS]
+    return np.select(conditions, labels, default='').astype(object)
+
+def format_number(values, fmt):
+    """批量格式化数值，缺失值返回空字符串"""
+    import numpy as np
+    
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    result = np.full(values.shape, '', dtype=object)
+    if valid.any():
+        result[valid] = np.char.mod(fmt, values[valid])
+    return result
+
+def format_percent(percentile, digits=1):
+    """将百分位（0-1）批量格式化为百分数字符串（不含 %），缺失值返回空字符串"""
+    import numpy as np
+    
+    return format_number(np.asarray(percentile, dtype=float) * 100, f'%.{digits}f')
+
+def display_names(codes, names, default_prefix):
+    """批量映射名称，未配置的使用 默认前缀+代码"""
+    return codes.map(names).fillna(default_prefix + codes).to_numpy(dtype=object)
+
+def join_parts(parts, separator):
+    """按行拼接多个字符串列，跳过空字符串"""
+    import numpy as np
+    
+    result = np.asarray(parts[0], dtype=object)
+    for part in parts[1:]:
+        part = np.asarray(part, dtype=object)
+        result = np.where(part == '', result,
+                          np.where(result == '', part, result + separator + part))
+    return result
\ No newline at end of file